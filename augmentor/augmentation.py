@@ -1,43 +1,52 @@
-from utils.config_parser import ConfParser
-import augmentor.operations as ops
+import threading
+from utils.settings import settings, on_reload
+from utils.profiling import timed
+from augmentor.pipeline import AugmentationPipeline
+
+# compiled pipelines kept, one per distinct AUGMENTATION section (eg: per request overrides) #
+MAX_PIPELINES = 16
 
 
 class Augmentor(object):
-    def __init__(self, img_array):
+    """
+    Apply the augmentation pipeline of a settings snapshot to a stack of images.
+    Pipelines are compiled once per distinct AUGMENTATION section and shared by every Augmentor.
+    """
+    _pipelines = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, img_array, rng=None, config=None):
+        """
+        :param config: Settings to augment with (eg: with per request overrides), default settings()
+        """
         self.img_array = img_array
-        self._parser = ConfParser().parser
-        self._rand_aug = self._parser.get('AUGMENTATION', 'RandAug')
-        self._rotate = self._parser.get('AUGMENTATION', 'Rotate')
-        self._blur = self._parser.get('AUGMENTATION', 'Blur')
-        self._warp = self._parser.get('AUGMENTATION', 'Warp')
-        self._verticalflip = self._parser.get('AUGMENTATION', 'VerticalFlip')
-        self._horizontalflip = self._parser.get('AUGMENTATION', 'HorizontalFlip')
-
+        self.rng = rng
+        self.config = config
+
+    @classmethod
+    def pipeline(cls, config=None):
+        augmentation = (config or settings()).augmentation
+        with cls._lock:
+            pipeline = cls._pipelines.get(augmentation)
+            if pipeline is None:
+                if len(cls._pipelines) >= MAX_PIPELINES:
+                    cls._pipelines.clear()
+                pipeline = AugmentationPipeline.from_settings(augmentation)
+                cls._pipelines[augmentation] = pipeline
+            return pipeline
+
+    @classmethod
+    def reset(cls):
+        """
+        Drop the compiled pipelines, the next Augmentor recompiles its pipeline
+        """
+        with cls._lock:
+            cls._pipelines.clear()
+
+    @timed("augment")
     def execute(self):
-        if self._rotate:
-            rotate = ops.Rotate(self.img_array)
-            rotated_img = rotate.execute()
-            return rotated_img
-
-        if self._blur:
-            blur = ops.Blur(self.img_array)
-            blured_img = blur.execute()
-            return blured_img
-
-        if self._warp:
-            warp = ops.Warp(self.img_array)
-            warped_img = warp.execute()
-            return warped_img
-
-        if self._verticalflip:
-            verticalflip = ops.Verticalflip(self.img_array)
-            verticalfliped_img = verticalflip.execute()
-            return verticalfliped_img
-
-        if self._horizontalflip:
-            horizontalflip = ops.Horizontalflip(self.img_array)
-            horizontalfliped_img = horizontalflip.execute()
-            return horizontalfliped_img
-
+        return self.pipeline(self.config).execute(self.img_array, self.rng)
 
 
+# a settings reload recompiles the pipeline on the next request #
+on_reload(lambda config: Augmentor.reset())
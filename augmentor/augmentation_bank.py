@@ -0,0 +1,297 @@
+import os
+import json
+import atexit
+import threading
+import collections
+import multiprocessing.util
+import numpy as np
+from utils.custom_logging import Logging
+from utils.profiling import timed
+from augmentor.augmentation import Augmentor
+
+logger = Logging(__name__).get_logger()
+
+EVICTION_POLICIES = ('lru', 'random')
+BANK_FORMAT_VERSION = 2
+
+
+class AugmentationBank(object):
+    """
+    Bounded store of pre-augmented variants : every banked source image (label, index) owns one slot holding
+    `variants` augmented copies, a lookup returns one of them at random in O(1).
+    Missing images are augmented in one pipeline call (all variants of all misses) and banked,
+    evicting the least recently used (lru) or a random (random) slot when the bank is full.
+    Slots live in one (capacity, variants, H, W) float32 array, an np.memmap under storage_dir when given :
+    the variants are then kept across restarts, bank.<n>.index.json records which image owns every slot
+    and is only trusted when the dataset shape, variant count, source files and augmentation pipeline (ops,
+    probabilities and parameters) are unchanged.
+    The slot index is private to a process, so every process (pool worker, API process) claims its own
+    bank.<n>.dat through bank.<n>.lock, a restarted process takes over the files of an exited one.
+    Misses are augmented outside the lock, concurrent requests only wait for each other to copy slots.
+    """
+    def __init__(self, img_map, variants=8, max_bytes=256 << 20, eviction='lru', storage_dir=None,
+                 augmentor=None, sources=None):
+        """
+        :param augmentor: fn(stack, rng) -> augmented stack, default the configured pipeline
+        :param sources: identity of the dataset files (eg: their source_fingerprint), part of the on-disk fingerprint
+        """
+        if eviction not in EVICTION_POLICIES:
+            raise (Exception("Unknown bank eviction = {}, expected one of {}".format(eviction, EVICTION_POLICIES)))
+        if variants < 1:
+            raise (Exception("Augmentation bank needs at least 1 variant per image, received = {}".format(variants)))
+        self.img_map = img_map
+        self.variants = variants
+        self.eviction = eviction
+        self.storage_dir = storage_dir
+        self.sources = sources
+        # variants are made by the pipeline of the settings the bank was built with #
+        self.pipeline = Augmentor.pipeline()
+        self._augment = augmentor or timed("augment")(self.pipeline.execute)
+        self._lock = threading.Lock()
+        # eviction draws, only used under the lock #
+        self._rng = np.random.default_rng()
+
+        self.image_shape = tuple(next(iter(img_map.values())).shape[1:])
+        slot_bytes = variants * int(np.prod(self.image_shape)) * np.dtype(np.float32).itemsize
+        self.capacity = int(max_bytes // slot_bytes)
+        if self.capacity < 1:
+            raise (Exception("Augmentation bank of {} bytes can not hold one slot of {} bytes".format(
+                max_bytes, slot_bytes)))
+
+        # (label, index) -> slot, ordered from least to most recently used #
+        self._slot_of = collections.OrderedDict()
+        self._key_of = [None] * self.capacity
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._pid = os.getpid()
+        self._files = None
+        self._slots = self._open_slots()
+
+    def _fingerprint(self):
+        return {"version": BANK_FORMAT_VERSION, "shape": list(self.image_shape), "variants": self.variants,
+                "capacity": self.capacity, "pipeline": self.pipeline.describe(), "sources": self.sources,
+                "counts": {label: int(images.shape[0]) for label, images in sorted(self.img_map.items())}}
+
+    @staticmethod
+    def _owner_alive(lock_file):
+        try:
+            with open(lock_file) as fp:
+                os.kill(int(fp.read().strip()), 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except (OSError, ValueError):
+            # unreadable lock (eg: being written) or a process of another user : treated as taken #
+            return True
+
+    def _claim_files(self):
+        """
+        Take the first bank.<n> file set no live process owns
+        :return: (data file, index file, lock file)
+        """
+        number = 0
+        while True:
+            prefix = os.path.join(self.storage_dir, "bank.{}".format(number))
+            lock_file = prefix + ".lock"
+            try:
+                fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._owner_alive(lock_file):
+                    number += 1
+                else:
+                    logger.info("Removing augmentation bank lock {} of an exited process".format(lock_file))
+                    self._remove_lock(lock_file)
+                continue
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            os.close(fd)
+            return prefix + ".dat", prefix + ".index.json", lock_file
+
+    @staticmethod
+    def _remove_lock(lock_file):
+        try:
+            os.remove(lock_file)
+        except OSError:
+            pass
+
+    def _open_slots(self):
+        shape = (self.capacity, self.variants) + self.image_shape
+        if not self.storage_dir:
+            return np.empty(shape, dtype=np.float32)
+
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._files = self._claim_files()
+        data_file, index_file, _ = self._files
+        index = None
+        try:
+            with open(index_file) as fp:
+                index = json.load(fp)
+        except (OSError, ValueError):
+            pass
+
+        if index is not None and index.get("fingerprint") == self._fingerprint() and os.path.exists(data_file):
+            slots = np.memmap(data_file, dtype=np.float32, mode='r+', shape=shape)
+            for slot, key in index["slots"]:
+                key = (str(key[0]), int(key[1]))
+                self._slot_of[key] = slot
+                self._key_of[slot] = key
+            used = set(self._slot_of.values())
+            self._free = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used]
+            logger.info("Augmentation bank reopened : {} banked images from {}".format(len(self._slot_of), data_file))
+        else:
+            slots = np.memmap(data_file, dtype=np.float32, mode='w+', shape=shape)
+            logger.info("Augmentation bank created : {} slots in {}".format(self.capacity, data_file))
+        atexit.register(self.close)
+        # pool workers exit without atexit handlers, multiprocessing still runs its finalizers #
+        multiprocessing.util.Finalize(None, self.close, exitpriority=10)
+        return slots
+
+    def save(self):
+        """
+        Flush the on-disk slots and write the slot index, no-op for an in-memory bank or in a forked child
+        """
+        if not self._files or self._pid != os.getpid():
+            return
+        with self._lock:
+            self._slots.flush()
+            index = {"fingerprint": self._fingerprint(),
+                     "slots": [[slot, list(key)] for key, slot in self._slot_of.items()]}
+            index_file = self._files[1]
+            with open(index_file + ".tmp", "w") as fp:
+                json.dump(index, fp)
+            os.replace(index_file + ".tmp", index_file)
+
+    def close(self):
+        """
+        Save and release the claimed files to the next process
+        """
+        if not self._files or self._pid != os.getpid():
+            return
+        self.save()
+        self._remove_lock(self._files[2])
+        self._files = None
+
+    def _take_slot(self):
+        if self._free:
+            return self._free.pop()
+        if self.eviction == 'lru':
+            key, slot = self._slot_of.popitem(last=False)
+        else:
+            slot = int(self._rng.integers(self.capacity))
+            key = self._key_of[slot]
+            del self._slot_of[key]
+        self.evictions += 1
+        return slot
+
+    def sample(self, labels, indices, rng=None):
+        """
+        One augmented variant of every requested source image
+        :param labels: label of every image
+        :param indices: index of every image inside its label
+        :param rng: np.random.Generator choosing the variants and augmenting the misses
+        :return: float32 (T, H, W) array
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        keys = [(str(label), int(index)) for label, index in zip(labels, indices)]
+        choice = rng.integers(0, self.variants, size=len(keys))
+        out = np.empty((len(keys),) + self.image_shape, dtype=np.float32)
+        with self._lock:
+            missing = collections.OrderedDict()
+            for position, key in enumerate(keys):
+                slot = self._slot_of.get(key)
+                if slot is None:
+                    missing.setdefault(key, list()).append(position)
+                    continue
+                self._slot_of.move_to_end(key)
+                # copied out before any miss can evict this slot #
+                out[position] = self._slots[slot, choice[position]]
+            n_missing = sum(len(positions) for positions in missing.values())
+            self.hits += len(keys) - n_missing
+            self.misses += n_missing
+        if not missing:
+            return out
+
+        # augmented without the lock, other requests keep being served from the bank meanwhile #
+        sources = np.stack([self.img_map[label][index] for label, index in missing.keys()])
+        augmented = self._augment(np.repeat(sources, self.variants, axis=0), rng)
+        augmented = augmented.reshape((len(missing), self.variants) + self.image_shape)
+        for entry, positions in enumerate(missing.values()):
+            out[positions] = augmented[entry, choice[positions]]
+
+        with self._lock:
+            for entry, key in enumerate(list(missing.keys())[:self.capacity]):
+                if key in self._slot_of:
+                    # banked by a concurrent request in the meantime #
+                    continue
+                slot = self._take_slot()
+                self._slots[slot] = augmented[entry]
+                self._slot_of[key] = slot
+                self._key_of[slot] = key
+        return out
+
+    def warm(self, labels=None, per_label=None):
+        """
+        Bank the first per_label images of every label (default every image) until the bank is full,
+        eg: offline before serving or from a background thread
+        :return: number of banked images
+        """
+        labels = sorted(self.img_map.keys()) if labels is None else [str(label) for label in labels]
+        banked = 0
+        for label in labels:
+            count = self.img_map[label].shape[0] if per_label is None else min(per_label, self.img_map[label].shape[0])
+            for first in range(0, count, 256):
+                if len(self._slot_of) >= self.capacity:
+                    return banked
+                indices = np.arange(first, min(first + 256, count, first + self.capacity - len(self._slot_of)))
+                self.sample([label] * indices.shape[0], indices)
+                banked += indices.shape[0]
+        logger.info("Augmentation bank warmed : {} images, stats = {}".format(banked, self.stats()))
+        return banked
+
+    def warm_async(self, labels=None, per_label=None):
+        thread = threading.Thread(target=self.warm, args=(labels, per_label), name="mdsg-augmentation-bank",
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hitRate": self.hits / float(lookups) if lookups else 0.,
+                "banked": len(self._slot_of), "capacity": self.capacity,
+                "bytes": int(self._slots.nbytes), "file": self._files[0] if self._files else None}
+
+
+_banks = dict()
+_banks_lock = threading.Lock()
+
+
+def shared_bank(key, img_map, **kwargs):
+    """
+    Process wide bank of a loaded dataset, rebuilt when the dataset map is replaced (eg: registry reload)
+    or the augmentation pipeline is recompiled (settings reload)
+    :param key: dataset key, eg: DatasetRegistry.key(image_file, label_file)
+    :param kwargs: AugmentationBank arguments
+    """
+    with _banks_lock:
+        bank = _banks.get(key)
+        # a forked child never reuses the bank (and the files) of its parent #
+        if bank is None or bank.img_map is not img_map or bank.pipeline is not Augmentor.pipeline() or \
+                bank._pid != os.getpid():
+            if bank is not None:
+                bank.close()
+            bank = AugmentationBank(img_map, **kwargs)
+            _banks[key] = bank
+        return bank
+
+
+def bank_stats():
+    """
+    stats() of every bank of this process
+    :return: dict "<image file>, <label file>" -> stats
+    """
+    with _banks_lock:
+        banks = list(_banks.items())
+    return {", ".join(os.path.basename(str(part)) for part in key): bank.stats() for key, bank in banks}
@@ -1,97 +1,202 @@
-import random
 import numpy as np
-from skimage.transform import rotate, warp, SimilarityTransform
-from skimage.util import random_noise
-from scipy import ndimage
-from utils.config_parser import ConfParser
+from utils.settings import settings
+
+# images resampled per chunk, keeps the coordinate and index arrays cache sized #
+RESAMPLE_CHUNK = 256
+
+
+def as_stack(in_img):
+    """
+    Contiguous float32 (N, H, W) stack from a list of 2D images or an array
+    """
+    return np.ascontiguousarray(np.asarray(in_img, dtype=np.float32))
+
+
+def rotation_matrices(angles, rows, cols):
+    """
+    Inverse maps (output x, y -> input x, y) rotating every image by its angle (degrees, counter clockwise)
+    around the image center, same geometry as skimage.transform.rotate
+    :return: (N, 3, 3) array
+    """
+    theta = np.deg2rad(np.asarray(angles, dtype=np.float64))
+    cos, sin = np.cos(theta), np.sin(theta)
+    center_x, center_y = cols / 2. - 0.5, rows / 2. - 0.5
+    matrices = np.zeros((theta.shape[0], 3, 3))
+    matrices[:, 0, 0] = cos
+    matrices[:, 0, 1] = -sin
+    matrices[:, 0, 2] = center_x - cos * center_x + sin * center_y
+    matrices[:, 1, 0] = sin
+    matrices[:, 1, 1] = cos
+    matrices[:, 1, 2] = center_y - sin * center_x - cos * center_y
+    matrices[:, 2, 2] = 1.
+    return matrices
+
+
+def translation_matrices(translations):
+    """
+    Inverse maps sampling every output pixel at (x + tx, y + ty), same as skimage SimilarityTransform(translation)
+    :param translations: (N, 2) array of (tx, ty)
+    :return: (N, 3, 3) array
+    """
+    translations = np.asarray(translations, dtype=np.float64)
+    matrices = np.zeros((translations.shape[0], 3, 3))
+    matrices[:, 0, 0] = matrices[:, 1, 1] = matrices[:, 2, 2] = 1.
+    matrices[:, :2, 2] = translations
+    return matrices
+
+
+def affine_resample(stack, matrices):
+    """
+    Bilinear resampling of every image of the stack through its own inverse affine map, with wrap around edges.
+    All images of a chunk are resampled by one set of array ops.
+    :param stack: (N, H, W) float32 array
+    :param matrices: (N, 3, 3) inverse maps in (x, y) pixel coordinates
+    :return: (N, H, W) float32 array
+    """
+    n_images, rows, cols = stack.shape
+    out = np.empty_like(stack)
+    grid_y, grid_x = np.mgrid[0:rows, 0:cols]
+    grid = np.stack((grid_x.ravel(), grid_y.ravel(), np.ones(rows * cols))).astype(np.float32)
+    matrices = np.asarray(matrices, dtype=np.float32)
+    flat = stack.reshape(-1)
+
+    for first in range(0, n_images, RESAMPLE_CHUNK):
+        count = min(RESAMPLE_CHUNK, n_images - first)
+        source = np.matmul(matrices[first:first + count, :2], grid)
+
+        # wrap source coordinates into the image (floor based, np.remainder is far slower on floats), #
+        # then split into pixel index and bilinear weight, all in float32 / intp to avoid upcasts #
+        x = source[:, 0]
+        x -= np.floor(x * (1. / cols)) * cols
+        y = source[:, 1]
+        y -= np.floor(y * (1. / rows)) * rows
+        fx = np.floor(x)
+        fy = np.floor(y)
+        x0 = fx.astype(np.intp)
+        y0 = fy.astype(np.intp)
+        np.subtract(x, fx, out=fx)
+        np.subtract(y, fy, out=fy)
+        # float rounding can land exactly on the wrapped edge #
+        x0[x0 == cols] = 0
+        y0[y0 == rows] = 0
+        x1 = x0 + 1
+        x1[x1 == cols] = 0
+        y1 = y0 + 1
+        y1[y1 == rows] = 0
+
+        # flat offsets of the source rows inside the whole stack #
+        base = (np.arange(first, first + count, dtype=np.intp) * (rows * cols))[:, None]
+        y0 *= cols
+        y0 += base
+        y1 *= cols
+        y1 += base
+        top = flat.take(y0 + x0)
+        top += (flat.take(y0 + x1) - top) * fx
+        bottom = flat.take(y1 + x0)
+        bottom += (flat.take(y1 + x1) - bottom) * fx
+        top += (bottom - top) * fy
+        out[first:first + count] = top.reshape(count, rows, cols)
+    return out
+
 
 class Rotate(object):
 
-    def __init__(self, in_img):
-        self._parser = ConfParser().parser
-        self.max_left_degree = int(self._parser.get('AUGMENTATION', 'max_left_degree'))
-        self.max_right_degree = int(self._parser.get('AUGMENTATION', 'max_right_degree'))
-        self.in_img = in_img
-        self.out_img = list()
+    def __init__(self, in_img, max_left_degree=None, max_right_degree=None, rng=None):
+        if max_left_degree is None or max_right_degree is None:
+            max_left_degree = settings().augmentation.max_left_degree
+            max_right_degree = settings().augmentation.max_right_degree
+        self.max_left_degree = max_left_degree
+        self.max_right_degree = max_right_degree
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.in_img = as_stack(in_img)
+        self.out_img = None
 
-    def execute(self):
-        for index in range(len(self.in_img)):
-            random_degree = random.uniform(-self.max_right_degree, self.max_left_degree)
-            self.out_img.append(rotate(image=self.in_img[index], angle=random_degree, mode='wrap'))
+    def matrices(self):
+        random_degree = self.rng.uniform(-self.max_right_degree, self.max_left_degree, self.in_img.shape[0])
+        return rotation_matrices(random_degree, self.in_img.shape[1], self.in_img.shape[2])
 
+    def execute(self):
+        self.out_img = affine_resample(self.in_img, self.matrices())
         return self.out_img
 
 
 class RandomNoise(object):
-
-    def __init__(self, in_img):
-        self.in_img = in_img
-        self.out_img = list()
+    """
+    Additive gaussian noise (mean 0, variance 0.01) clipped to [0, 1], like skimage.util.random_noise
+    """
+    def __init__(self, in_img, var=0.01, rng=None):
+        self.in_img = as_stack(in_img)
+        self.var = var
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.out_img = None
 
     def execute(self):
-        for index in range(len(self.in_img)):
-            self.out_img.append(random_noise(image=self.in_img[index]))
-
+        noise = self.rng.standard_normal(size=self.in_img.shape, dtype=np.float32)
+        noise *= self.var ** 0.5
+        self.out_img = np.clip(self.in_img + noise, 0., 1.)
         return self.out_img
 
 
 class Blur(object):
 
-    def __init__(self, in_img):
-        self.in_img = in_img
-        self.out_img = list()
+    def __init__(self, in_img, size=3, rng=None):
+        self.in_img = as_stack(in_img)
+        self.size = size
+        self.out_img = None
 
     def execute(self):
-        for index in range(len(self.in_img)):
-            self.out_img.append(ndimage.uniform_filter(input=self.in_img[index]))
-
+        # scipy is only imported when a Blur actually runs #
+        from scipy import ndimage
+        # one filter over the stack, never across images #
+        self.out_img = ndimage.uniform_filter(input=self.in_img, size=(1, self.size, self.size))
         return self.out_img
 
 
 """
-Not applicable for some digits 1, 2, 3, 5, 7, 9 
+Not applicable for some digits 1, 2, 3, 5, 7, 9
 """
 class HorizontalFlip(object):
 
-    def __init__(self, in_img):
-        self.in_img = in_img
-        self.out_img = list()
+    def __init__(self, in_img, rng=None):
+        self.in_img = as_stack(in_img)
+        self.out_img = None
 
     def execute(self):
-        for index in range(len(self.in_img)):
-            self.out_img.append(self.in_img[index][:, ::-1])
-
+        self.out_img = self.in_img[:, :, ::-1]
         return self.out_img
 
 
 """
-Not applicable for some digits 
+Not applicable for some digits
 """
 class VerticalFlip(object):
 
-    def __init__(self, in_img):
-        self.in_img = in_img
-        self.out_img = list()
+    def __init__(self, in_img, rng=None):
+        self.in_img = as_stack(in_img)
+        self.out_img = None
 
     def execute(self):
-        for index in range(len(self.in_img)):
-            self.out_img.append(self.in_img[index][:, ::-1][::-1, :])
-
+        self.out_img = self.in_img[:, ::-1, ::-1]
         return self.out_img
 
 
 class Warp(object):
-
-    def __init__(self, in_img):
-        self.matrix = np.array([[1, 0, 0], [0, 1, -10], [0, 0, 1]])
-        self.in_img = in_img
-        self.out_img = list()
+    """
+    Translation by (tx, ty) pixels with wrap around, each drawn uniformly per image from its (min, max) range
+    """
+    def __init__(self, in_img, translation_x=(0, 0), translation_y=(4, 4), rng=None):
+        self.translation_x = translation_x
+        self.translation_y = translation_y
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.in_img = as_stack(in_img)
+        self.out_img = None
+
+    def matrices(self):
+        n_images = self.in_img.shape[0]
+        translations = np.stack((self.rng.uniform(self.translation_x[0], self.translation_x[1], n_images),
+                                 self.rng.uniform(self.translation_y[0], self.translation_y[1], n_images)), axis=1)
+        return translation_matrices(translations)
 
     def execute(self):
-        for index in range(len(self.in_img)):
-            tform = SimilarityTransform(translation=(0, 4))
-            self.out_img.append(warp(self.in_img[index], inverse_map=tform, clip=True, mode='wrap'))
-
+        self.out_img = affine_resample(self.in_img, self.matrices())
         return self.out_img
-
-
@@ -0,0 +1,185 @@
+import numpy as np
+import augmentor.operations as ops
+from utils.settings import settings
+from utils.custom_logging import Logging
+
+logger = Logging(__name__).get_logger()
+
+OPERATIONS = {
+    "Rotate": ops.Rotate,
+    "Warp": ops.Warp,
+    "Blur": ops.Blur,
+    "RandomNoise": ops.RandomNoise,
+    "HorizontalFlip": ops.HorizontalFlip,
+    "VerticalFlip": ops.VerticalFlip,
+}
+
+# operation => its enabled flag in AugmentationSettings, the probability is <flag>_probability #
+OPERATION_FIELDS = {
+    "Rotate": "rotate",
+    "Warp": "warp",
+    "Blur": "blur",
+    "RandomNoise": "random_noise",
+    "HorizontalFlip": "horizontal_flip",
+    "VerticalFlip": "vertical_flip",
+}
+
+
+def _operation_params(augmentation, name):
+    """
+    Keyword arguments of an operation from the AugmentationSettings
+    """
+    if name == "Rotate":
+        return {"max_left_degree": augmentation.max_left_degree, "max_right_degree": augmentation.max_right_degree}
+    if name == "Warp":
+        return {"translation_x": augmentation.warp_translation_x, "translation_y": augmentation.warp_translation_y}
+    if name == "Blur":
+        return {"size": augmentation.blur_size}
+    if name == "RandomNoise":
+        return {"var": augmentation.noise_var}
+    return dict()
+
+
+class PipelineStep(object):
+    """
+    One operation of the pipeline with its probability and keyword arguments
+    """
+    def __init__(self, name, probability=1.0, params=None):
+        if name not in OPERATIONS:
+            raise (Exception("Unknown augmentation = {}, expected one of {}".format(name, sorted(OPERATIONS))))
+        if not 0. <= probability <= 1.:
+            raise (Exception("Probability of {} must be in [0, 1], received = {}".format(name, probability)))
+        self.name = name
+        self.operation = OPERATIONS[name]
+        self.probability = probability
+        self.params = params or dict()
+        # affine ops expose their per image inverse maps and can share one resampling pass #
+        self.affine = hasattr(self.operation, "matrices")
+
+    def __repr__(self):
+        return "PipelineStep({}, p={}, {})".format(self.name, self.probability, self.params)
+
+
+class AugmentationPipeline(object):
+    """
+    Ordered augmentation operations applied to a whole (N, H, W) stack.
+    With random_aug every step is applied to each image with its own probability, otherwise every step
+    is applied to every image.
+    Runs of consecutive affine steps (Rotate, Warp) are fused : their inverse maps are multiplied per image and
+    the stack is interpolated once instead of once per step. The wrap around is applied once to the fused
+    coordinates, so border pixels can differ slightly from chaining the ops one by one.
+    """
+    def __init__(self, steps, random_aug=True):
+        self.steps = list(steps)
+        self.random_aug = random_aug
+        self.stages = self._compile(self.steps)
+
+    @classmethod
+    def from_settings(cls, augmentation=None):
+        """
+        Compile the pipeline from the AUGMENTATION section : enabled ops in Pipeline order,
+        with <op>_probability and the op parameters
+        :param augmentation: AugmentationSettings, default settings().augmentation
+        """
+        try:
+            augmentation = augmentation or settings().augmentation
+            steps = list()
+            for name in augmentation.pipeline:
+                if name not in OPERATION_FIELDS:
+                    raise (Exception("Unknown augmentation = {}, expected one of {}".format(
+                        name, sorted(OPERATION_FIELDS))))
+                field = OPERATION_FIELDS[name]
+                if not getattr(augmentation, field):
+                    continue
+                steps.append(PipelineStep(name, getattr(augmentation, field + "_probability"),
+                                          _operation_params(augmentation, name)))
+            pipeline = cls(steps, random_aug=augmentation.rand_aug)
+            logger.info("Augmentation pipeline compiled : {}".format(pipeline))
+            return pipeline
+        except Exception as e:
+            logger.error("Unable to compile augmentation pipeline, exception : {}".format(str(e)))
+            raise (Exception(e))
+
+    @staticmethod
+    def _compile(steps):
+        """
+        Group consecutive affine steps into one stage, every other step is a stage of its own
+        """
+        stages = list()
+        for step in steps:
+            if step.affine and stages and stages[-1][0].affine:
+                stages[-1].append(step)
+            else:
+                stages.append([step])
+        return stages
+
+    def __repr__(self):
+        return " -> ".join("+".join(step.name for step in stage) for stage in self.stages) or "identity"
+
+    def describe(self):
+        """
+        JSON-able description of everything the pipeline output depends on : steps in order with their probability
+        and parameters, and random_aug
+        """
+        return {"random_aug": self.random_aug,
+                "steps": [{"name": step.name, "probability": step.probability,
+                           "params": {key: list(value) if isinstance(value, tuple) else value
+                                      for key, value in sorted(step.params.items())}}
+                          for step in self.steps]}
+
+    def _selection(self, step, n_images, rng):
+        """
+        Boolean mask of the images a step applies to, None when it applies to all of them
+        """
+        if not self.random_aug or step.probability >= 1.:
+            return None
+        return rng.random(n_images) < step.probability
+
+    def _run_affine(self, stage, stack, rng):
+        n_images = stack.shape[0]
+        identity = np.eye(3)
+        matrices = None
+        for step in stage:
+            mask = self._selection(step, n_images, rng)
+            if mask is not None and not mask.any():
+                continue
+            step_matrices = step.operation(stack, rng=rng, **step.params).matrices()
+            if mask is not None:
+                step_matrices[~mask] = identity
+            # step applied after the previous ones : out(p) = in(M_previous . M_step . p) #
+            matrices = step_matrices if matrices is None else np.matmul(matrices, step_matrices)
+
+        if matrices is None:
+            return stack
+        changed = np.any(matrices != identity, axis=(1, 2))
+        if changed.all():
+            return ops.affine_resample(stack, matrices)
+        stack = stack.copy()
+        if changed.any():
+            stack[changed] = ops.affine_resample(np.ascontiguousarray(stack[changed]), matrices[changed])
+        return stack
+
+    def _run_step(self, step, stack, rng):
+        mask = self._selection(step, stack.shape[0], rng)
+        if mask is None:
+            return step.operation(stack, rng=rng, **step.params).execute()
+        if not mask.any():
+            return stack
+        stack = stack.copy()
+        stack[mask] = step.operation(stack[mask], rng=rng, **step.params).execute()
+        return stack
+
+    def execute(self, in_img, rng=None):
+        """
+        :param in_img: (N, H, W) stack or list of 2D images
+        :param rng: np.random.Generator drawing every random choice, default a freshly seeded one
+        :return: float32 (N, H, W) array, the input itself when no step applies
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        stack = ops.as_stack(in_img)
+        for stage in self.stages:
+            if stage[0].affine:
+                stack = self._run_affine(stage, stack, rng)
+            else:
+                stack = self._run_step(stage[0], stack, rng)
+        return stack
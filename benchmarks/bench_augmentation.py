@@ -0,0 +1,97 @@
+"""
+Batched augmentation ops on (N, 28, 28) stacks against the original per-image skimage/scipy loops,
+and the fused Rotate + Warp pipeline stage against the two ops chained.
+Usage : python -m benchmarks.bench_augmentation --sizes 1 10 100 1000 10000 100000
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+import augmentor.operations as ops
+from augmentor.pipeline import AugmentationPipeline, PipelineStep
+
+
+def legacy_ops():
+    """
+    The per-image implementations the batched ops replaced
+    """
+    from scipy import ndimage
+    from skimage.transform import rotate, warp, SimilarityTransform
+
+    def legacy_rotate(images):
+        return [rotate(image=image, angle=random.uniform(-30, 30), mode='wrap') for image in images]
+
+    def legacy_warp(images):
+        return [warp(image, inverse_map=SimilarityTransform(translation=(0, 4)), clip=True, mode='wrap')
+                for image in images]
+
+    return {
+        "Rotate": legacy_rotate,
+        "Warp": legacy_warp,
+        "Blur": lambda images: [ndimage.uniform_filter(input=image) for image in images],
+        "HorizontalFlip": lambda images: [image[:, ::-1] for image in images],
+        "VerticalFlip": lambda images: [image[:, ::-1][::-1, :] for image in images],
+    }
+
+
+BATCHED_OPS = {
+    "Rotate": ops.Rotate,
+    "Warp": ops.Warp,
+    "Blur": ops.Blur,
+    "HorizontalFlip": ops.HorizontalFlip,
+    "VerticalFlip": ops.VerticalFlip,
+    "RandomNoise": ops.RandomNoise,
+}
+
+
+def rotate_warp_pipeline():
+    return AugmentationPipeline([PipelineStep("Rotate", 1.0, {"max_left_degree": 30, "max_right_degree": 30}),
+                                 PipelineStep("Warp", 1.0, {"translation_x": (0, 0), "translation_y": (4, 4)})])
+
+
+def chained_rotate_warp(stack):
+    return ops.Warp(ops.Rotate(stack, 30, 30).execute()).execute()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run(sizes=(1, 10, 100, 1000, 10000), legacy=True, legacy_max=10000):
+    images = np.random.RandomState(0).rand(max(sizes), 28, 28).astype(np.float32)
+    legacy_funcs = legacy_ops() if legacy else dict()
+    results = dict()
+    for name, op in BATCHED_OPS.items():
+        results[name] = dict()
+        for size in sizes:
+            stack = images[:size]
+            entry = {"batched_seconds": timed(lambda: op(stack).execute())}
+            if name in legacy_funcs and size <= legacy_max:
+                entry["per_image_seconds"] = timed(legacy_funcs[name], list(stack))
+                entry["speedup"] = entry["per_image_seconds"] / max(entry["batched_seconds"], 1e-9)
+            results[name][str(size)] = entry
+
+    # Rotate + Warp : one fused resampling pass vs two chained ops #
+    pipeline = rotate_warp_pipeline()
+    results["Rotate+Warp"] = dict()
+    for size in sizes:
+        stack = images[:size]
+        fused = timed(pipeline.execute, stack)
+        chained = timed(chained_rotate_warp, stack)
+        results["Rotate+Warp"][str(size)] = {"fused_seconds": fused, "chained_seconds": chained,
+                                             "speedup": chained / max(fused, 1e-9)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_augmentation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000], help="batch sizes")
+    parser.add_argument("--legacy-max", type=int, default=10000, help="largest batch run through the per-image path")
+    parser.add_argument("--skip-legacy", action="store_true", help="do not run the per-image path")
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, legacy=not args.skip_legacy, legacy_max=args.legacy_max), indent=2))
@@ -0,0 +1,51 @@
+"""
+Augmented digit latency and hit rate of the augmentation bank for several size caps, against augmenting every request.
+Usage : python -m benchmarks.bench_augmentation_bank --requests 2000 --digits 8 --sizes-mb 1 8 64
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from augmentor.augmentation import Augmentor
+from augmentor.augmentation_bank import AugmentationBank
+from benchmarks.fixtures import make_idx_fixture
+from generator.image_data_reader import ImageDataReader
+
+
+def run(requests=2000, digits=8, sizes_mb=(1, 8, 64), variants=8, dataset_size=10000, eviction='lru'):
+    rng = np.random.RandomState(0)
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        img_map = ImageDataReader(*make_idx_fixture(tmp, dataset_size)).read_image()
+        labels = rng.randint(0, 10, size=(requests, digits))
+        indices = np.array([[rng.randint(img_map[str(label)].shape[0]) for label in row] for row in labels])
+
+        start = time.perf_counter()
+        for row_labels, row_indices in zip(labels, indices):
+            Augmentor(np.stack([img_map[str(label)][index] for label, index in zip(row_labels, row_indices)])).execute()
+        results["no_bank"] = {"ms_per_request": 1000. * (time.perf_counter() - start) / requests}
+
+        for size_mb in sizes_mb:
+            bank = AugmentationBank(img_map, variants=variants, max_bytes=int(size_mb * (1 << 20)), eviction=eviction)
+            start = time.perf_counter()
+            for row_labels, row_indices in zip(labels, indices):
+                bank.sample(row_labels, row_indices)
+            entry = {"ms_per_request": 1000. * (time.perf_counter() - start) / requests}
+            entry.update(bank.stats())
+            results["bank_{}MB".format(size_mb)] = entry
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_augmentation_bank")
+    parser.add_argument("--requests", type=int, default=2000, help="number of requests")
+    parser.add_argument("--digits", type=int, default=8, help="digits per request")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 8, 64], help="bank size caps in MB")
+    parser.add_argument("--variants", type=int, default=8, help="variants per source image")
+    parser.add_argument("--dataset-size", type=int, default=10000, help="images in the synthetic IDX fixture")
+    parser.add_argument("--eviction", choices=["lru", "random"], default="lru", help="eviction policy")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.digits, args.sizes_mb, args.variants, args.dataset_size, args.eviction), indent=2))
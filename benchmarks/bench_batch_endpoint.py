@@ -0,0 +1,42 @@
+"""
+Images/sec of POST /mdsg/batch against one GET /mdsg per image, through the Flask test client.
+Usage : python -m benchmarks.bench_batch_endpoint --images 1000 --digits 6 --width 250
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import mdsg_api
+
+
+def run(images=1000, digits=6, width=250, get_images=100, batch_format="stream"):
+    client = mdsg_api.app.test_client()
+    sequences = np.random.RandomState(0).randint(0, 10, size=(images, digits)).tolist()
+    results = dict()
+
+    start = time.perf_counter()
+    for sequence in sequences[:get_images]:
+        client.get("/mdsg?{}&sr1=3&sr2=9&w={}&fmt=raw&variant=org".format(
+            "&".join("d={}".format(digit) for digit in sequence), width))
+    results["get_per_sec"] = get_images / (time.perf_counter() - start)
+
+    specs = [{"d": sequence, "w": width, "sr1": 3, "sr2": 9} for sequence in sequences]
+    start = time.perf_counter()
+    response = client.post("/mdsg/batch", json={"specs": specs, "format": batch_format, "image": "raw"})
+    results["batch_per_sec"] = images / (time.perf_counter() - start)
+    results["batch_status"] = response.status_code
+    results["speedup"] = results["batch_per_sec"] / results["get_per_sec"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_batch_endpoint")
+    parser.add_argument("--images", type=int, default=1000, help="images in the batch request")
+    parser.add_argument("--digits", type=int, default=6, help="digits per image")
+    parser.add_argument("--width", type=int, default=250, help="image width in pixels")
+    parser.add_argument("--get-images", type=int, default=100, help="images requested one GET at a time")
+    parser.add_argument("--format", choices=["stream", "zip"], default="stream", help="batch response format")
+    args = parser.parse_args()
+    print(json.dumps(run(args.images, args.digits, args.width, args.get_images, args.format), indent=2))
@@ -0,0 +1,59 @@
+"""
+Throughput in images/sec of the batch generation API against the per-image path.
+Usage : python -m benchmarks.bench_batch_generation --images 2000 --digits 8 --width 400
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.dataset_registry import DatasetRegistry
+from generator.digit_sequence_generator import DigitSequenceGenerator
+
+
+def make_generator(image_file, label_file, width, spacing=(3, 9)):
+    return DigitSequenceGenerator({"digits": [], "minSpacingRange": spacing[0], "maxSpacingRange": spacing[1],
+                                   "imageWidth": width, "imageFile": image_file, "labelFile": label_file,
+                                   "cacheMode": "skip"})
+
+
+def per_image(generator, sequences):
+    generator._img_map = generator.load_dataset()
+    for sequence in sequences:
+        generator.digits = sequence
+        generator._random_img_array = generator._select_images()
+        generator._generate_sequence(mode='original')
+
+
+def run(images=2000, digits=8, width=400, dataset_size=10000):
+    rng = np.random.RandomState(0)
+    sequences = rng.randint(0, 10, size=(images, digits)).tolist()
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        image_file, label_file = make_idx_fixture(tmp, dataset_size)
+        generator = make_generator(image_file, label_file, width)
+        generator.load_dataset()
+
+        start = time.perf_counter()
+        per_image(generator, sequences)
+        results["per_image_per_sec"] = images / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        generator.generate_batch(sequences)
+        results["batch_per_sec"] = images / (time.perf_counter() - start)
+        DatasetRegistry.instance().clear()
+
+    results["speedup"] = results["batch_per_sec"] / results["per_image_per_sec"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_batch_generation")
+    parser.add_argument("--images", type=int, default=2000, help="number of images to generate")
+    parser.add_argument("--digits", type=int, default=8, help="digits per image")
+    parser.add_argument("--width", type=int, default=400, help="image width in pixels")
+    args = parser.parse_args()
+    print(json.dumps(run(args.images, args.digits, args.width), indent=2))
@@ -0,0 +1,36 @@
+"""
+Dataset generation throughput for an increasing number of worker processes.
+Usage : python -m benchmarks.bench_dataset_builder --count 20000 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.dataset_builder import DatasetBuilder
+
+
+def run(count=20000, workers=(1, 2, 4), shard_size=1000, dataset_size=10000):
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        image_file, label_file = make_idx_fixture(tmp, dataset_size)
+        for worker_count in workers:
+            builder = DatasetBuilder({"count": count, "lengths": ["3", "5", "8"], "widthRange": [300, 400],
+                                      "minSpacingRange": 3, "maxSpacingRange": 9, "shardSize": shard_size,
+                                      "workers": worker_count, "seed": 0, "cacheMode": "skip",
+                                      "outputDir": os.path.join(tmp, "out_{}".format(worker_count)),
+                                      "imageFile": image_file, "labelFile": label_file})
+            start = time.perf_counter()
+            builder.run()
+            results[str(worker_count)] = {"images_per_sec": count / (time.perf_counter() - start)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_dataset_builder")
+    parser.add_argument("--count", type=int, default=20000, help="images per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to measure")
+    args = parser.parse_args()
+    print(json.dumps(run(args.count, args.workers), indent=2))
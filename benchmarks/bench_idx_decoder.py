@@ -0,0 +1,63 @@
+"""
+Compare the original per-pixel IDX decoder with the vectorized one and the mmap backend.
+Usage : python -m benchmarks.bench_idx_decoder --count 60000
+"""
+import argparse
+import gc
+import json
+import struct
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+import numpy as np
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.image_data_reader import ImageDataReader, decode_idx_images
+
+
+def legacy_decode(path):
+    with open(path, "rb") as f:
+        magic_num, size, rows, cols = struct.unpack(">IIII", f.read(16))
+        image = list(map(lambda px: (255 - px) / 255.0, array("B", f.read())))
+        return np.asarray(image, dtype=np.float32).reshape(size, rows, cols)
+
+
+def vectorized_decode(path, dtype=np.float32):
+    with open(path, "rb") as f:
+        return decode_idx_images(f.read(), dtype=dtype)[1]
+
+
+def measure(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": elapsed, "peak_bytes": peak}
+
+
+def run(count=60000, legacy=True):
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        path, label_path = make_idx_fixture(tmp, count)
+        _, results["mmap_views"] = measure(ImageDataReader(path, label_path, backend='mmap').read_image)
+        new_images, results["vectorized_float32"] = measure(vectorized_decode, path)
+        _, results["vectorized_uint8"] = measure(vectorized_decode, path, np.uint8)
+        if legacy:
+            old_images, results["legacy"] = measure(legacy_decode, path)
+            if not np.array_equal(old_images, new_images):
+                raise Exception("Vectorized decoder output differs from legacy decoder output")
+            results["speedup"] = results["legacy"]["seconds"] / results["vectorized_float32"]["seconds"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_idx_decoder")
+    parser.add_argument("--count", type=int, default=60000, help="number of synthetic images")
+    parser.add_argument("--skip-legacy", action="store_true", help="do not run the per-pixel decoder")
+    args = parser.parse_args()
+    print(json.dumps(run(args.count, legacy=not args.skip_legacy), indent=2))
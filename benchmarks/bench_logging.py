@@ -0,0 +1,73 @@
+"""
+Logging overhead of the per-image generation path : log level and sink (synchronous file handler,
+queue + listener thread, JSON records). Every mode writes to a temporary log file.
+Usage : python -m benchmarks.bench_logging --requests 2000
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.digit_sequence_generator import DigitSequenceGenerator
+from utils.custom_logging import AsyncLogSink, JsonFormatter
+
+TEXT_FORMAT = '%(asctime)s : %(name)-25s : %(levelname)-8s  : %(message)s'
+
+
+def _project_loggers():
+    return [logger for logger in logging.root.manager.loggerDict.values()
+            if isinstance(logger, logging.Logger) and logger.handlers]
+
+
+def _use(loggers, handler, level):
+    for logger in loggers:
+        logger.handlers = [handler]
+        logger.setLevel(level)
+
+
+def images_per_sec(image_file, label_file, requests):
+    args = {"digits": [4, 5, 8, 1, 0], "minSpacingRange": 3, "maxSpacingRange": 9, "imageWidth": 200,
+            "imageFile": image_file, "labelFile": label_file, "cacheMode": "skip"}
+    DigitSequenceGenerator(args).generate_numbers_sequence()
+    start = time.perf_counter()
+    for _ in range(requests):
+        DigitSequenceGenerator(args).generate_numbers_sequence()
+    return requests / (time.perf_counter() - start)
+
+
+def run(requests=2000, dataset_size=10000):
+    loggers = _project_loggers()
+    saved = [(logger, logger.handlers, logger.level) for logger in loggers]
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        image_file, label_file = make_idx_fixture(tmp, dataset_size)
+        modes = [("warning", logging.WARNING, False, False), ("info_sync_text", logging.INFO, False, False),
+                 ("info_async_text", logging.INFO, True, False), ("info_async_json", logging.INFO, True, True),
+                 ("debug_sync_text", logging.DEBUG, False, False), ("debug_async_text", logging.DEBUG, True, False)]
+        try:
+            for name, level, use_queue, use_json in modes:
+                log_file = os.path.join(tmp, name + ".log")
+                target = logging.FileHandler(log_file)
+                target.setFormatter(JsonFormatter() if use_json else logging.Formatter(TEXT_FORMAT))
+                sink = AsyncLogSink(target) if use_queue else None
+                _use(loggers, sink.handler if use_queue else target, level)
+                rate = images_per_sec(image_file, label_file, requests)
+                if sink is not None:
+                    sink.stop()
+                target.close()
+                results[name] = {"images_per_sec": rate, "log_bytes": os.path.getsize(log_file)}
+        finally:
+            for logger, handlers, level in saved:
+                logger.handlers = handlers
+                logger.setLevel(level)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_logging")
+    parser.add_argument("--requests", type=int, default=2000, help="images generated per mode")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests), indent=2))
@@ -0,0 +1,65 @@
+"""
+File size and encode time of the grayscale PNG writer against matplotlib's plt.imsave(cmap="gray").
+Usage : python -m benchmarks.bench_png_encoder --widths 530 5000 --repeat 20
+"""
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+
+from generator.png_writer import encode_png
+
+
+def synthetic_sequence(width, height=28, seed=0):
+    rng = np.random.RandomState(seed)
+    image = np.ones((height, width), dtype=np.float32)
+    for offset in range(10, width - 28, 40):
+        image[:, offset:offset + 28] = rng.rand(height, 28)
+    return image
+
+
+def encode_time(func, image, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data = func(image)
+    return (time.perf_counter() - start) / repeat, len(data)
+
+
+def matplotlib_encode(image):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    plt.imsave(buffer, arr=image, cmap="gray", format="png")
+    return buffer.getvalue()
+
+
+def run(widths=(530, 5000), repeat=20, levels=(1, 6, 9)):
+    results = dict()
+    for width in widths:
+        image = synthetic_sequence(width)
+        entry = dict()
+        for level in levels:
+            seconds, size = encode_time(lambda img: encode_png(img, level), image, repeat)
+            entry["encode_png_level_{}".format(level)] = {"seconds": seconds, "bytes": size}
+        try:
+            start = time.perf_counter()
+            matplotlib_encode(image)
+            entry["matplotlib_first_call_seconds"] = time.perf_counter() - start
+            seconds, size = encode_time(matplotlib_encode, image, repeat)
+            entry["matplotlib_imsave"] = {"seconds": seconds, "bytes": size}
+        except ImportError:
+            entry["matplotlib_imsave"] = None
+        results[str(width)] = entry
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_png_encoder")
+    parser.add_argument("--widths", type=int, nargs="+", default=[530, 5000], help="image widths in pixels")
+    parser.add_argument("--repeat", type=int, default=20, help="encodes per measurement")
+    args = parser.parse_args()
+    print(json.dumps(run(args.widths, args.repeat), indent=2))
@@ -0,0 +1,65 @@
+"""
+Cost of the stage timers : a decorated no-op call with profiling disabled and enabled vs an undecorated one,
+and per-image generation throughput with profiling disabled and enabled.
+Usage : python -m benchmarks.bench_profiling --requests 2000
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.digit_sequence_generator import DigitSequenceGenerator
+from utils import profiling
+
+
+def _noop():
+    return None
+
+
+_timed_noop = profiling.timed("noop")(_noop)
+
+
+def call_ns(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def images_per_sec(args, requests):
+    DigitSequenceGenerator(args).generate_numbers_sequence()
+    start = time.perf_counter()
+    for _ in range(requests):
+        DigitSequenceGenerator(args).generate_numbers_sequence()
+    return requests / (time.perf_counter() - start)
+
+
+def run(requests=2000, calls=200000, dataset_size=10000):
+    results = {"plain_call_ns": call_ns(_noop, calls)}
+    profiling.disable()
+    results["timed_call_disabled_ns"] = call_ns(_timed_noop, calls)
+    profiling.enable()
+    results["timed_call_enabled_ns"] = call_ns(_timed_noop, calls)
+    profiling.disable()
+    profiling.reset()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_file, label_file = make_idx_fixture(tmp, dataset_size)
+        args = {"digits": [4, 5, 8, 1, 0], "minSpacingRange": 3, "maxSpacingRange": 9, "imageWidth": 200,
+                "imageFile": image_file, "labelFile": label_file, "cacheMode": "skip"}
+        results["disabled_images_per_sec"] = images_per_sec(args, requests)
+        profiling.enable()
+        results["enabled_images_per_sec"] = images_per_sec(args, requests)
+        profiling.disable()
+    results["stages"] = {name: {"count": summary["count"], "p50_us": summary["p50"] * 1e6}
+                         for name, summary in profiling.snapshot().items()}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_profiling")
+    parser.add_argument("--requests", type=int, default=2000, help="images generated per mode")
+    parser.add_argument("--calls", type=int, default=200000, help="no-op calls per mode")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.calls), indent=2))
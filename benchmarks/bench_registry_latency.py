@@ -0,0 +1,53 @@
+"""
+Per-request generation latency with and without the process wide dataset registry, for several dataset sizes.
+Usage : python -m benchmarks.bench_registry_latency --sizes 10000 60000 --requests 50
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.dataset_registry import DatasetRegistry
+from generator.digit_sequence_generator import DigitSequenceGenerator
+
+
+def request_latencies(image_file, label_file, requests, use_registry):
+    registry = DatasetRegistry.instance()
+    registry.clear()
+    latencies = list()
+    for _ in range(requests):
+        if not use_registry:
+            registry.clear()
+        start = time.perf_counter()
+        generator = DigitSequenceGenerator({"digits": [4, 5, 8], "minSpacingRange": 3, "maxSpacingRange": 9,
+                                            "imageWidth": 100, "imageFile": image_file, "labelFile": label_file,
+                                            "cacheMode": "skip"})
+        generator.generate_numbers_sequence()
+        latencies.append(time.perf_counter() - start)
+    registry.clear()
+    # first request pays the load in both cases, report steady state
+    latencies = np.asarray(latencies[1:]) * 1000.0
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99))}
+
+
+def run(sizes=(10000, 60000), requests=50):
+    results = dict()
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            image_file, label_file = make_idx_fixture(tmp, size)
+            results[str(size)] = {
+                "registry": request_latencies(image_file, label_file, requests, use_registry=True),
+                "reload_per_request": request_latencies(image_file, label_file, requests, use_registry=False),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_registry_latency")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 60000], help="synthetic dataset sizes")
+    parser.add_argument("--requests", type=int, default=50, help="requests per measurement")
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.requests), indent=2))
@@ -0,0 +1,40 @@
+"""
+Latency of replayed seeded GET /mdsg requests : cold (generated), cached, and conditional (If-None-Match => 304),
+through the Flask test client.
+Usage : python -m benchmarks.bench_response_cache --requests 200
+"""
+import argparse
+import json
+import time
+
+import mdsg_api
+
+
+def timed_requests(client, queries, headers=None):
+    start = time.perf_counter()
+    responses = [client.get(query, headers=headers(query) if headers else None) for query in queries]
+    return 1000. * (time.perf_counter() - start) / len(queries), responses
+
+
+def run(requests=200):
+    if mdsg_api.RESPONSE_CACHE is None:
+        raise (Exception("Response cache is disabled in config.cfg ([RESPONSE_CACHE] enabled = 0)"))
+    mdsg_api.RESPONSE_CACHE.clear()
+    client = mdsg_api.app.test_client()
+    queries = ["/mdsg?d=4&d=5&d=8&d=1&d=9&sr1=3&sr2=9&w=200&seed={}".format(seed) for seed in range(requests)]
+
+    results = dict()
+    results["cold_ms"], responses = timed_requests(client, queries)
+    etags = {query: response.headers["ETag"] for query, response in zip(queries, responses)}
+    results["cached_ms"], _ = timed_requests(client, queries)
+    results["not_modified_ms"], responses = timed_requests(client, queries, lambda query: {"If-None-Match": etags[query]})
+    results["not_modified_status"] = sorted(set(response.status_code for response in responses))
+    results["cache"] = mdsg_api.RESPONSE_CACHE.stats()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_response_cache")
+    parser.add_argument("--requests", type=int, default=200, help="distinct seeded requests, each replayed")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests), indent=2))
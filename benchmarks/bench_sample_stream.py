@@ -0,0 +1,37 @@
+"""
+Samples/sec and traced memory of SampleStream while a consumer pulls batches, memory should stay flat.
+Usage : python -m benchmarks.bench_sample_stream --batches 400 --batch-size 256
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from generator.sample_stream import SampleStream
+
+
+def run(batches=400, batch_size=256, lengths=("6",), width_range=(250, 300), prefetch=4, augment=False):
+    tracemalloc.start()
+    memory = list()
+    start = time.perf_counter()
+    with SampleStream(lengths=lengths, width_range=width_range, batch_size=batch_size, prefetch=prefetch,
+                      augment=augment, limit=batches * batch_size) as stream:
+        for number, _ in enumerate(stream):
+            if number % max(batches // 10, 1) == 0:
+                memory.append(tracemalloc.get_traced_memory()[0] >> 20)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] >> 20
+    tracemalloc.stop()
+    return {"samples_per_sec": batches * batch_size / elapsed, "traced_mb_over_time": memory, "peak_mb": peak}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_sample_stream")
+    parser.add_argument("--batches", type=int, default=400, help="batches to consume")
+    parser.add_argument("--batch-size", type=int, default=256, help="samples per batch")
+    parser.add_argument("--lengths", nargs="+", default=["6"], help="digit counts, Eg: 3 5:0.3")
+    parser.add_argument("--prefetch", type=int, default=4, help="batches generated ahead")
+    parser.add_argument("--augment", action="store_true", help="apply the configured augmentation")
+    args = parser.parse_args()
+    print(json.dumps(run(args.batches, args.batch_size, args.lengths, prefetch=args.prefetch, augment=args.augment),
+                     indent=2))
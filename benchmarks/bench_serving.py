@@ -0,0 +1,86 @@
+"""
+Local load test of the API : requests/sec and refused requests for the inline mode and the generation pool
+with 1..N workers, concurrent clients over real HTTP.
+Usage : python -m benchmarks.bench_serving --requests 400 --clients 16 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import mdsg_api
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+QUERY = "/mdsg?d=4&d=5&d=8&d=1&d=9&d=0&d=2&d=7&sr1=3&sr2=9&w=300&fmt=raw"
+
+
+def load(port, requests, clients):
+    """
+    clients threads sending requests GETs in total
+    :return: dict of status code counts and requests/sec
+    """
+    counts = dict()
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            try:
+                with urllib.request.urlopen("http://127.0.0.1:{}{}".format(port, QUERY)) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            with lock:
+                counts[status] = counts.get(status, 0) + 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"requests_per_sec": counts.get(200, 0) / elapsed, "status": {str(k): v for k, v in counts.items()}}
+
+
+def run(requests=400, clients=16, workers=(1, 2, 4), max_pending=64):
+    results = dict()
+    modes = [("inline", dict())] + [("pool_{}".format(count), {"workers": count, "max_pending": max_pending})
+                                    for count in workers]
+    for name, pool_args in modes:
+        mdsg_api.start_serving("pool" if pool_args else "inline", **pool_args)
+        server = make_server("127.0.0.1", 0, mdsg_api.app, threaded=True, request_handler=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            load(server.server_port, min(requests, 2 * clients), clients)  # warm up the workers
+            results[name] = load(server.server_port, requests, clients)
+        finally:
+            server.shutdown()
+            mdsg_api.stop_serving()
+    results["cores"] = os.cpu_count()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_serving")
+    parser.add_argument("--requests", type=int, default=400, help="requests per mode")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="pool sizes")
+    parser.add_argument("--max-pending", type=int, default=64, help="pool admission bound")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.clients, args.workers, args.max_pending), indent=2))
@@ -0,0 +1,49 @@
+"""
+Per-request config access : parsing config.cfg and reading values through ConfigParser vs the settings snapshot,
+and DigitSequenceGenerator construction time.
+Usage : python -m benchmarks.bench_settings --requests 2000
+"""
+import argparse
+import json
+import time
+
+from utils.config_parser import ConfParser
+from utils.settings import settings
+from generator.digit_sequence_generator import DigitSequenceGenerator
+
+
+def _per_request_us(func, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        func()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def parse_per_request():
+    parser = ConfParser().parser
+    return (parser.get('GENERATOR', 'spacingMode'), float(parser.get('GENERATOR', 'whitePixel')),
+            parser.getint('GENERATOR', 'pngCompression'), parser.getboolean('AUGMENTATION_BANK', 'enabled'),
+            int(parser.get('AUGMENTATION', 'mdsg_mode')))
+
+
+def snapshot_per_request():
+    config = settings()
+    return (config.generator.spacing_mode, config.generator.white_pixel, config.generator.png_compression,
+            config.augmentation_bank.enabled, config.augmentation.mdsg_mode)
+
+
+def run(requests=2000):
+    settings()
+    args = {"digits": [4, 5, 8], "minSpacingRange": 3, "maxSpacingRange": 9, "imageWidth": 100}
+    return {
+        "parse_per_request_us": _per_request_us(parse_per_request, requests),
+        "snapshot_per_request_us": _per_request_us(snapshot_per_request, requests),
+        "generator_init_us": _per_request_us(lambda: DigitSequenceGenerator(args), requests),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_settings")
+    parser.add_argument("--requests", type=int, default=2000, help="simulated requests")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests), indent=2))
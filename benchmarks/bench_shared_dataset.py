@@ -0,0 +1,86 @@
+"""
+Worker startup time and private memory, loading the dataset in every worker vs attaching a shared memory block.
+Private memory is read from /proc/self/smaps_rollup (Linux) after every worker has read all its images.
+Usage : python -m benchmarks.bench_shared_dataset --dataset-size 20000 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.dataset_registry import DatasetRegistry
+from generator.digit_sequence_generator import DigitSequenceGenerator
+from generator.shared_dataset import SharedDataset, publish_dataset
+
+
+def private_bytes():
+    total = 0
+    try:
+        with open("/proc/self/smaps_rollup") as fp:
+            for line in fp:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    total += int(line.split()[1]) << 10
+    except OSError:
+        return None
+    return total
+
+
+def _worker(generator_args, descriptor, results):
+    DatasetRegistry.instance().clear()
+    before = private_bytes()
+    start = time.perf_counter()
+    if descriptor is not None:
+        SharedDataset.attach(descriptor)
+    img_map = DigitSequenceGenerator(generator_args).load_dataset()
+    startup = time.perf_counter() - start
+    checksum = sum(float(np.asarray(images).sum()) for images in img_map.values())
+    after = private_bytes()
+    results.put({"startup_ms": startup * 1e3, "checksum": checksum,
+                 "private_mb": None if before is None else (after - before) / float(1 << 20)})
+
+
+def _measure(generator_args, descriptor, workers):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_worker, args=(generator_args, descriptor, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    private = [entry["private_mb"] for entry in measured if entry["private_mb"] is not None]
+    return {"startup_ms": max(entry["startup_ms"] for entry in measured),
+            "private_mb_per_worker": sum(private) / len(private) if private else None,
+            "checksums": sorted(set(round(entry["checksum"], 3) for entry in measured))}
+
+
+def run(dataset_size=20000, workers=4):
+    with tempfile.TemporaryDirectory() as tmp:
+        image_file, label_file = make_idx_fixture(tmp, dataset_size)
+        generator_args = {"digits": [], "minSpacingRange": 0, "maxSpacingRange": 0, "imageWidth": 0,
+                          "cacheMode": "skip", "imageFile": image_file, "labelFile": label_file}
+        results = {"load": _measure(generator_args, None, workers)}
+
+        start = time.perf_counter()
+        shared = publish_dataset(generator_args)
+        publish_ms = (time.perf_counter() - start) * 1e3
+        DatasetRegistry.instance().clear()
+        try:
+            results["attach"] = _measure(generator_args, shared.descriptor, workers)
+        finally:
+            shared.unlink()
+        results["attach"]["publish_ms"] = publish_ms
+        results["same_data"] = results["load"]["checksums"] == results["attach"]["checksums"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_shared_dataset")
+    parser.add_argument("--dataset-size", type=int, default=20000, help="images in the synthetic IDX files")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    args = parser.parse_args()
+    print(json.dumps(run(args.dataset_size, args.workers), indent=2))
@@ -0,0 +1,36 @@
+"""
+Closed-form spacing planner against the original search over every gap of the spacing range :
+planning time for growing spacing ranges (the equivalence checks live in tests/test_spacing_planner.py).
+Usage : python -m benchmarks.bench_spacing_planner --ranges 10 1000 1000000
+"""
+import argparse
+import json
+import time
+
+from generator.spacing_planner import plan_spacing
+from tests.test_spacing_planner import legacy_spacing
+
+
+def run(ranges=(10, 1000, 1000000), repeat=20):
+    timings = dict()
+    for spacing_range in ranges:
+        # widest image, the search scans the whole range #
+        case = (8 * 28 + 7 * spacing_range, 8 * 28, 8, 0, spacing_range, "EQUALIZED_MAX")
+        start = time.perf_counter()
+        for _ in range(repeat):
+            legacy_spacing(*case)
+        legacy = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            plan_spacing(*case)
+        planned = (time.perf_counter() - start) / repeat
+        timings[str(spacing_range)] = {"search_us": 1e6 * legacy, "planner_us": 1e6 * planned,
+                                       "speedup": legacy / max(planned, 1e-12)}
+    return {"timings": timings}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_spacing_planner")
+    parser.add_argument("--ranges", type=int, nargs="+", default=[10, 1000, 1000000], help="spacing range sizes")
+    args = parser.parse_args()
+    print(json.dumps(run(args.ranges), indent=2))
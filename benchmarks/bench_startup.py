@@ -0,0 +1,66 @@
+"""
+Startup cost of the entry points measured with python -X importtime, with a regression check :
+exits 1 when an import takes longer than its threshold or pulls in a heavy dependency it should not need.
+Usage : python -m benchmarks.bench_startup --repeat 5 --max-ms cli=400 library=400 api=1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry point -> (module imported, heavy modules it must not import) #
+TARGETS = {
+    "cli": ("mdsg_cli", ("flask", "flask_restful", "scipy", "matplotlib", "skimage", "augmentor.operations")),
+    "library": ("generator.digit_sequence_generator",
+                ("flask", "flask_restful", "scipy", "matplotlib", "skimage", "augmentor.operations")),
+    "api": ("mdsg_api", ("scipy", "matplotlib", "skimage")),
+}
+DEFAULT_MAX_MS = {"cli": 400., "library": 400., "api": 1500.}
+
+
+def import_ms(module):
+    """
+    Cumulative import time of module in a fresh interpreter, from the -X importtime report
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module)], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    for line in reversed(completed.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000.
+    raise (Exception("{} not found in the importtime report".format(module)))
+
+
+def loaded_modules(module, candidates):
+    code = "import sys, json, {}; print(json.dumps([m for m in {} if m in sys.modules]))".format(module, list(candidates))
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, universal_newlines=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(repeat=5, max_ms=None):
+    thresholds = dict(DEFAULT_MAX_MS, **(max_ms or dict()))
+    results = dict()
+    for name, (module, forbidden) in TARGETS.items():
+        # best of repeat : the noise of a loaded machine only ever adds time #
+        best = min(import_ms(module) for _ in range(repeat))
+        heavy = loaded_modules(module, forbidden)
+        results[name] = {"module": module, "import_ms": best, "max_ms": thresholds[name], "heavy_imports": heavy,
+                         "ok": best <= thresholds[name] and not heavy}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_startup")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per entry point, best is kept")
+    parser.add_argument("--max-ms", nargs="+", default=[], metavar="TARGET=MS",
+                        help="import time thresholds, default cli=400 library=400 api=1500")
+    args = parser.parse_args()
+    limits = {target: float(limit) for target, limit in (item.split("=", 1) for item in args.max_ms)}
+    report = run(args.repeat, limits)
+    print(json.dumps(report, indent=2))
+    if not all(entry["ok"] for entry in report.values()):
+        sys.exit(1)
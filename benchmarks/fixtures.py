@@ -0,0 +1,60 @@
+import os
+import struct
+import numpy as np
+
+from generator.image_data_reader import IMAGE_FILE_MAGIC, LABEL_FILE_MAGIC
+
+
+def write_idx_images(path, count, rows=28, cols=28, seed=0):
+    """
+    Write a synthetic IDX3 image file with random pixel values
+    :return: path
+    """
+    rng = np.random.RandomState(seed)
+    pixels = rng.randint(0, 256, size=count * rows * cols).astype(np.uint8)
+    with open(path, "wb") as f:
+        f.write(struct.pack(">IIII", IMAGE_FILE_MAGIC, count, rows, cols))
+        f.write(pixels.tobytes())
+    return path
+
+
+def write_idx_labels(path, count, seed=0):
+    """
+    Write a synthetic IDX1 label file with every digit present
+    :return: path
+    """
+    rng = np.random.RandomState(seed)
+    labels = (np.arange(count) % 10).astype(np.uint8)
+    rng.shuffle(labels)
+    with open(path, "wb") as f:
+        f.write(struct.pack(">II", LABEL_FILE_MAGIC, count))
+        f.write(labels.tobytes())
+    return path
+
+
+def make_idx_fixture(directory, count, rows=28, cols=28, seed=0):
+    """
+    Write a matching pair of synthetic IDX image and label files into directory
+    :return: (image_file, label_file)
+    """
+    os.makedirs(directory, exist_ok=True)
+    image_file = write_idx_images(os.path.join(directory, "synthetic-images-idx3-ubyte"), count, rows, cols, seed)
+    label_file = write_idx_labels(os.path.join(directory, "synthetic-labels-idx1-ubyte"), count, seed)
+    return image_file, label_file
+
+
+def fixture_parser(image_file, label_file, parser=None):
+    """
+    Copy of the config with the GENERATOR section pointing at a fixture, for reload_settings(parser)
+    :param parser: ConfigParser to copy, default config.cfg
+    :return: ConfigParser
+    """
+    from configparser import ConfigParser
+    from utils.config_parser import ConfParser
+    parser = parser or ConfParser().parser
+    copy = ConfigParser()
+    copy.read_dict({section: dict(parser.items(section, raw=True)) for section in parser.sections()})
+    # absolute paths replace the input_data relative ones #
+    copy.set('GENERATOR', 'ImagePath', os.path.abspath(image_file))
+    copy.set('GENERATOR', 'LabelPath', os.path.abspath(label_file))
+    return copy
@@ -0,0 +1,249 @@
+"""
+Benchmark harness : runs the suites below on synthetic IDX fixtures (no MNIST download, no network) and writes
+one JSON report, --compare checks it against a stored baseline report and exits 1 on regressions.
+Every metric is the median over --repeat runs of the seconds per call, lower is better.
+  idx          : IDX parsing, per-label indexing (memory and mmap backends)
+  sequence     : _generate_sequence for 1..500 digits and widths up to 10k px
+  augmentation : every augmentation op at several batch sizes
+  png          : encode_png per image width
+  api          : GET /mdsg through the Flask test client, seconds per request
+Usage : python -m benchmarks.run --output benchmarks/baseline.json
+        python -m benchmarks.run --compare benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.fixtures import make_idx_fixture
+from generator.image_data_reader import ImageDataReader, decode_idx_images, decode_idx_labels
+
+SUITES = ("idx", "sequence", "augmentation", "png", "api")
+DIGIT_COUNTS = (1, 10, 100, 500)
+WIDTHS = (500, 3000, 10000)
+BATCH_SIZES = (1, 100, 1000)
+PNG_WIDTHS = (500, 3000, 10000)
+DIGIT_WIDTH = 28
+
+
+def median_seconds(func, repeat, number=1):
+    """
+    Median over repeat runs of the seconds per call, each run calling func number times
+    """
+    func()
+    runs = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        runs.append((time.perf_counter() - start) / number)
+    return statistics.median(runs)
+
+
+def bench_idx(fixture, repeat):
+    image_file, label_file = fixture
+    with open(image_file, "rb") as f:
+        image_bytes = f.read()
+    with open(label_file, "rb") as f:
+        label_bytes = f.read()
+    return {
+        "idx.parse_images": median_seconds(lambda: decode_idx_images(image_bytes), repeat),
+        "idx.parse_labels": median_seconds(lambda: decode_idx_labels(label_bytes), repeat),
+        "idx.read_memory": median_seconds(ImageDataReader(image_file, label_file, backend='memory').read_image, repeat),
+        "idx.index_mmap": median_seconds(ImageDataReader(image_file, label_file, backend='mmap').read_image, repeat),
+    }
+
+
+def sequence_cases(digit_counts=DIGIT_COUNTS, widths=WIDTHS):
+    """
+    (digits, width) pairs to time, a width too narrow for the digits is raised to the narrowest that fits
+    (eg: 500 digits need 14000 px)
+    """
+    cases = list()
+    for digits in digit_counts:
+        for width in widths:
+            case = (digits, max(width, digits * DIGIT_WIDTH))
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+
+def bench_sequence(fixture, repeat, number=20):
+    from generator.digit_sequence_generator import DigitSequenceGenerator
+    from utils.settings import settings
+
+    image_file, label_file = fixture
+    # EQUALIZED_MAX fits any width the digits fit in, the other modes would reject the longest sequences #
+    config = settings().override(generator={"spacing_mode": "EQUALIZED_MAX"})
+    rng = np.random.RandomState(0)
+    results = dict()
+    for digits, width in sequence_cases():
+        args = {"digits": rng.randint(0, 10, size=digits).tolist(), "minSpacingRange": 0, "maxSpacingRange": 10,
+                "imageWidth": width, "imageFile": image_file, "labelFile": label_file, "cacheMode": "skip",
+                "seed": 0}
+        generator = DigitSequenceGenerator(args, config)
+        generator._img_map = generator.load_dataset()
+        generator._random_img_array = generator._select_images()
+        results["sequence.digits_{}.width_{}".format(digits, width)] = median_seconds(
+            generator._generate_sequence, repeat, number)
+    return results
+
+
+def bench_augmentation(repeat, batch_sizes=BATCH_SIZES, number=3):
+    from benchmarks.bench_augmentation import BATCHED_OPS
+
+    images = np.random.RandomState(0).rand(max(batch_sizes), DIGIT_WIDTH, DIGIT_WIDTH).astype(np.float32)
+    results = dict()
+    for name, op in BATCHED_OPS.items():
+        for size in batch_sizes:
+            stack = images[:size]
+            results["augmentation.{}.batch_{}".format(name, size)] = median_seconds(
+                lambda: op(stack).execute(), repeat, number)
+    return results
+
+
+def bench_png(repeat, widths=PNG_WIDTHS, number=5):
+    from benchmarks.bench_png_encoder import synthetic_sequence
+    from generator.png_writer import encode_png
+
+    results = dict()
+    for width in widths:
+        image = synthetic_sequence(width)
+        results["png.width_{}".format(width)] = median_seconds(lambda: encode_png(image), repeat, number)
+    return results
+
+
+def bench_api(fixture, repeat, number=50):
+    """
+    The fixture is installed in the dataset registry under the configured IDX paths,
+    the API serves it without the MNIST files being present
+    """
+    import mdsg_api
+    from generator.dataset_registry import DatasetRegistry
+    from generator.digit_sequence_generator import DigitSequenceGenerator
+
+    image_file, label_file = fixture
+    configured = DigitSequenceGenerator({"digits": [], "minSpacingRange": 0, "maxSpacingRange": 0, "imageWidth": 0})
+    registry = DatasetRegistry.instance()
+    registry.register(configured.image_file, configured.image_label_file,
+                      ImageDataReader(image_file, label_file).read_image())
+    client = mdsg_api.app.test_client()
+    sequences = np.random.RandomState(0).randint(0, 10, size=(number, 5)).tolist()
+    urls = ["/mdsg?{}&sr1=3&sr2=9&w=200&save=0".format("&".join("d={}".format(digit) for digit in sequence))
+            for sequence in sequences]
+
+    def serve():
+        for url in urls:
+            response = client.get(url)
+            if response.status_code != 200:
+                raise (Exception("GET {} failed with status {}".format(url, response.status_code)))
+
+    try:
+        return {"api.mdsg_get": median_seconds(serve, repeat) / number}
+    finally:
+        registry.clear()
+
+
+def run(suites=SUITES, repeat=5, dataset_size=10000):
+    """
+    :return: report dict : meta (environment and parameters) and metrics (name -> seconds)
+    """
+    metrics = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = make_idx_fixture(tmp, dataset_size)
+        for suite in suites:
+            if suite == "idx":
+                metrics.update(bench_idx(fixture, repeat))
+            elif suite == "sequence":
+                metrics.update(bench_sequence(fixture, repeat))
+            elif suite == "augmentation":
+                metrics.update(bench_augmentation(repeat))
+            elif suite == "png":
+                metrics.update(bench_png(repeat))
+            elif suite == "api":
+                metrics.update(bench_api(fixture, repeat))
+            else:
+                raise (Exception("Unknown suite = {}, expected one of {}".format(suite, SUITES)))
+    meta = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "suites": list(suites),
+        "repeat": repeat,
+        "dataset_size": dataset_size,
+    }
+    return {"meta": meta, "metrics": metrics}
+
+
+def compare(report, baseline, tolerance=0.25, min_delta=50e-6):
+    """
+    Compare the metrics of two reports
+    :param tolerance: relative slowdown allowed before a metric is a regression
+    :param min_delta: seconds, smaller absolute differences are never flagged (timer noise of the fastest metrics)
+    :return: list of dict name, baseline, current, ratio, status (ok, regression, improved, new, missing)
+    """
+    current, reference = report["metrics"], baseline["metrics"]
+    # metrics of suites this run skipped are not compared #
+    suites = set(report["meta"]["suites"])
+    reference = {name: value for name, value in reference.items() if name.split(".", 1)[0] in suites}
+    rows = list()
+    for name in sorted(set(current) | set(reference)):
+        if name not in reference or name not in current:
+            rows.append({"name": name, "baseline": reference.get(name), "current": current.get(name), "ratio": None,
+                         "status": "new" if name not in reference else "missing"})
+            continue
+        ratio = current[name] / max(reference[name], 1e-12)
+        status = "ok"
+        if abs(current[name] - reference[name]) >= min_delta:
+            if ratio > 1 + tolerance:
+                status = "regression"
+            elif ratio < 1 / (1 + tolerance):
+                status = "improved"
+        rows.append({"name": name, "baseline": reference[name], "current": current[name], "ratio": ratio,
+                     "status": status})
+    return rows
+
+
+def format_comparison(rows):
+    lines = ["{:<40} {:>12} {:>12} {:>7}  {}".format("metric", "baseline ms", "current ms", "ratio", "status")]
+    for row in rows:
+        lines.append("{:<40} {:>12} {:>12} {:>7}  {}".format(
+            row["name"],
+            "-" if row["baseline"] is None else "{:.4f}".format(row["baseline"] * 1e3),
+            "-" if row["current"] is None else "{:.4f}".format(row["current"] * 1e3),
+            "-" if row["ratio"] is None else "{:.2f}".format(row["ratio"]),
+            row["status"]))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="benchmarks.run")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES), help="suites to run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per metric, the median is kept")
+    parser.add_argument("--dataset-size", type=int, default=10000, help="images in the synthetic IDX fixture")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON report to compare with, exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="smaller differences are never flagged")
+    args = parser.parse_args()
+
+    report = run(args.suites, args.repeat, args.dataset_size)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fp:
+            rows = compare(report, json.load(fp), args.tolerance, args.min_delta_ms / 1e3)
+        print(format_comparison(rows))
+        if any(row["status"] == "regression" for row in rows):
+            sys.exit(1)
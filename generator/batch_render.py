@@ -0,0 +1,155 @@
+import io
+import json
+import struct
+import zipfile
+import numpy as np
+from utils.custom_logging import Logging
+from generator.compositor import to_uint8
+from generator.png_writer import encode_png
+from generator.spacing_planner import plan_spacing
+from generator.digit_sequence_generator import DigitSequenceGenerator
+
+logger = Logging(__name__).get_logger()
+
+BATCH_FORMATS = ('stream', 'zip')
+IMAGE_FORMATS = ('png', 'raw')
+# size of an IDX digit, for the limits checked before the dataset is loaded #
+DIGIT_HEIGHT = 28
+DIGIT_WIDTH = 28
+
+
+def validate_specs(specs, max_images=10000, max_width=20000, max_pixels=50000000, spacing_mode="EQUALIZED_MAX"):
+    """
+    Check and normalize the sequence specs of a batch request
+    :param specs: list of dicts : d (digit list), w (image width), sr1, sr2 (spacing range), optional n (images, default 1)
+                  and seed
+    :param max_width: widest image allowed
+    :param max_pixels: pixels at most over all images of the batch
+    :param spacing_mode: spacing mode the batch is generated with, a spec whose digits do not fit its width is refused
+    :return: list of normalized spec dicts
+    """
+    if not isinstance(specs, list) or not specs:
+        raise (ValueError("specs should be a non empty list of sequence specs"))
+
+    normalized = list()
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            raise (ValueError("spec {} should be an object".format(index)))
+        try:
+            digits = [int(digit) for digit in spec["d"]]
+            entry = {"d": digits, "w": int(spec["w"]), "sr1": int(spec["sr1"]), "sr2": int(spec["sr2"]),
+                     "n": int(spec.get("n", 1)), "seed": None if spec.get("seed") is None else int(spec["seed"])}
+        except (KeyError, TypeError, ValueError) as e:
+            raise (ValueError("spec {} needs d, w, sr1 and sr2 as integers : {}".format(index, e)))
+        if not digits or min(digits) < 0 or max(digits) > 9:
+            raise (ValueError("spec {} : d should be a non empty list of digits 0 to 9".format(index)))
+        if not 0 < entry["w"] <= max_width or entry["n"] < 1 or entry["sr2"] < entry["sr1"]:
+            raise (ValueError("spec {} : w should be 1 to {}, n at least 1 and sr1 <= sr2".format(index, max_width)))
+        if entry["seed"] is not None and entry["seed"] < 0:
+            raise (ValueError("spec {} : seed should be a positive int value".format(index)))
+        try:
+            plan_spacing(entry["w"], len(digits) * DIGIT_WIDTH, len(digits), entry["sr1"], entry["sr2"], spacing_mode)
+        except Exception as e:
+            raise (ValueError("spec {} : {}".format(index, e)))
+        normalized.append(entry)
+
+    total = sum(entry["n"] for entry in normalized)
+    if total > max_images:
+        raise (ValueError("batch of {} images is over the limit of {}".format(total, max_images)))
+    pixels = sum(entry["n"] * entry["w"] for entry in normalized) * DIGIT_HEIGHT
+    if pixels > max_pixels:
+        raise (ValueError("batch of {} pixels is over the limit of {}".format(pixels, max_pixels)))
+    return normalized
+
+
+def _groups(specs):
+    """
+    Batches of specs sharing one generate_batch call : unseeded specs are grouped by spacing range and width
+    (widths 2^k to 2^(k+1) - 1 share a canvas, so it is at most twice as wide as any of its images),
+    every seeded spec is generated alone from its own seed so its images do not depend on the other specs
+    """
+    groups = dict()
+    for index, spec in enumerate(specs):
+        key = (spec["sr1"], spec["sr2"], spec["w"].bit_length(), index if spec["seed"] is not None else None)
+        groups.setdefault(key, list()).append(index)
+    return groups.values()
+
+
+def render_batch(specs, augment=False, image_format='png', png_compression=6, config=None):
+    """
+    Generate every image of a validated batch through the vectorized batch path
+    :param specs: output of validate_specs
+    :param augment: apply the configured augmentation
+    :param image_format: png or raw (uint8 pixels)
+    :param config: Settings of the request, default settings()
+    :return: list of (metadata dict, image bytes) in spec order
+    """
+    records = [None] * len(specs)
+    for indices in _groups(specs):
+        first = specs[indices[0]]
+        sequences = [specs[index]["d"] for index in indices for _ in range(specs[index]["n"])]
+        widths = [specs[index]["w"] for index in indices for _ in range(specs[index]["n"])]
+        generator = DigitSequenceGenerator({"digits": [], "minSpacingRange": first["sr1"],
+                                            "maxSpacingRange": first["sr2"], "imageWidth": max(widths)}, config)
+        rng = np.random.default_rng(first["seed"]) if first["seed"] is not None else None
+        images, batch_info = generator.generate_batch(sequences, augment=augment, image_widths=widths, rng=rng)
+
+        row = 0
+        for index in indices:
+            spec_records = list()
+            for _ in range(specs[index]["n"]):
+                image = images[row, :, :widths[row]]
+                metadata = {"spec": index, "digits": sequences[row], "shape": list(image.shape),
+                            "leftMargin": int(batch_info["leftMargin"][row]),
+                            "rightMargin": int(batch_info["rightMargin"][row]),
+                            "betweenMargin": int(batch_info["betweenMargin"][row]),
+                            "seed": specs[index]["seed"]}
+                data = encode_png(image, png_compression) if image_format == 'png' else to_uint8(image).tobytes()
+                spec_records.append((metadata, data))
+                row += 1
+            records[index] = spec_records
+    return [record for spec_records in records for record in spec_records]
+
+
+def pack_stream(records):
+    """
+    Length prefixed binary stream, per image : >I metadata length, metadata JSON (utf-8), >I image length, image bytes
+    """
+    chunks = list()
+    for metadata, data in records:
+        header = json.dumps(metadata).encode("utf-8")
+        chunks.extend((struct.pack(">I", len(header)), header, struct.pack(">I", len(data)), data))
+    return b"".join(chunks)
+
+
+def read_stream(payload):
+    """
+    Inverse of pack_stream
+    :return: list of (metadata dict, image bytes)
+    """
+    records = list()
+    position = 0
+    while position < len(payload):
+        (size,) = struct.unpack_from(">I", payload, position)
+        metadata = json.loads(payload[position + 4:position + 4 + size].decode("utf-8"))
+        position += 4 + size
+        (size,) = struct.unpack_from(">I", payload, position)
+        records.append((metadata, payload[position + 4:position + 4 + size]))
+        position += 4 + size
+    return records
+
+
+def pack_zip(records, image_format='png'):
+    """
+    Zip archive with one <image number>.png (or .raw) per image and metadata.json listing them in order
+    """
+    buffer = io.BytesIO()
+    extension = "png" if image_format == 'png' else "raw"
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        listing = list()
+        for number, (metadata, data) in enumerate(records):
+            name = "{:06d}.{}".format(number, extension)
+            archive.writestr(name, data)
+            listing.append(dict(metadata, file=name))
+        archive.writestr("metadata.json", json.dumps(listing, indent=2))
+    return buffer.getvalue()
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+def digit_offsets(widths, leftSpace, betweenSpaces):
+    """
+    x offset of every digit : left margin, then each digit followed by its gap
+    :param widths: width of every digit image
+    :param leftSpace: left margin in pixels
+    :param betweenSpaces: len(widths) - 1 gaps in pixels
+    :return: int64 array of x offsets
+    """
+    widths = np.asarray(widths, dtype=np.int64)
+    steps = widths[:-1] + np.asarray(betweenSpaces, dtype=np.int64)
+    offsets = np.empty(widths.shape[0], dtype=np.int64)
+    offsets[0] = leftSpace
+    np.cumsum(steps, out=offsets[1:])
+    offsets[1:] += leftSpace
+    return offsets
+
+
+def compose(images, offsets, image_width, white_pixel, height=None):
+    """
+    Blit every digit image into a white float32 canvas filled once, top aligned at its x offset
+    :param images: list of 2D digit images
+    :param offsets: x offset of every image
+    :param image_width: canvas width
+    :param white_pixel: background value
+    :param height: canvas height, default the tallest image
+    :return: float32 array of shape (height, image_width)
+    """
+    if height is None:
+        height = max(image.shape[0] for image in images)
+    canvas = np.full((height, image_width), float(white_pixel), dtype=np.float32)
+    for image, offset in zip(images, offsets):
+        canvas[:image.shape[0], offset:offset + image.shape[1]] = image
+    return canvas
+
+
+def compose_batch(canvas, digits, rows, offsets):
+    """
+    Scatter a stack of equally sized digits into a preallocated (N, H, W) canvas in one fancy-index assignment
+    :param canvas: (N, H, W) array already filled with the background value
+    :param digits: (T, h, w) digit stack
+    :param rows: canvas index of every digit
+    :param offsets: x offset of every digit
+    :return: canvas
+    """
+    height, width = digits.shape[1:]
+    canvas[rows[:, None, None],
+           np.arange(height)[None, :, None],
+           offsets[:, None, None] + np.arange(width)[None, None, :]] = digits
+    return canvas
+
+
+def to_uint8(canvas):
+    """
+    Quantize a [0, 1] float canvas to uint8 grey levels
+    :return: uint8 array of the same shape
+    """
+    out = np.empty(canvas.shape, dtype=np.float32)
+    np.clip(canvas, 0.0, 1.0, out=out)
+    out *= 255.0
+    out += 0.5
+    return out.astype(np.uint8)
@@ -0,0 +1,217 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils.custom_logging import Logging
+from utils.settings import settings
+from generator.compositor import to_uint8
+from generator.shard_writer import ShardWriter, write_manifest
+from generator.image_data_reader import IMAGE_HEADER_SIZE, parse_idx_image_header
+from generator.digit_sequence_generator import DigitSequenceGenerator
+from generator.shared_dataset import SharedDataset, publish_dataset
+
+logger = Logging(__name__).get_logger()
+
+# generator of the worker process, built once by _init_worker #
+_worker_generator = None
+
+
+def minimum_widths(lengths, digit_width, spacing_range_min, spacing_mode):
+    """
+    Narrowest image width that fits each digit count with the smallest allowed gaps
+    :return: int64 array
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    gaps = lengths - 1
+    widths = lengths * digit_width + gaps * spacing_range_min
+    if spacing_mode == "PROGRESSIVE":
+        widths += gaps * (gaps - 1) // 2
+    return widths
+
+
+def sample_sequences(rng, count, lengths, weights, width_range, digit_width, spacing_range_min,
+                     spacing_mode):
+    """
+    Draw count random digit sequences with their image widths.
+    The width of every image is uniform between max(width_range[0], narrowest fitting width) and width_range[1].
+    :param rng: np.random.Generator
+    :param lengths: possible digit counts
+    :param weights: probability of every digit count
+    :return: (list of digit lists, int64 array of widths)
+    """
+    n_digits = rng.choice(np.asarray(lengths), size=count, p=weights)
+    digits = rng.integers(0, 10, size=int(n_digits.sum()))
+    sequences = [chunk.tolist() for chunk in np.split(digits, np.cumsum(n_digits)[:-1])]
+
+    low = np.maximum(width_range[0], minimum_widths(n_digits, digit_width, spacing_range_min, spacing_mode))
+    widths = rng.integers(low, width_range[1] + 1)
+    return sequences, widths
+
+
+def _init_worker(generator_args, descriptor=None):
+    """
+    Process pool initializer : build the generator and load the dataset once per worker.
+    The parent loaded it before starting the pool : a forked worker finds it in its registry, a spawned one
+    in the dataset cache. With the mmap backend or the dataset cache the pixels are shared through the OS page cache,
+    with a shared dataset descriptor the worker attaches the parent's shared memory block instead of loading.
+    """
+    global _worker_generator
+    if descriptor is not None:
+        SharedDataset.attach(descriptor)
+    _worker_generator = DigitSequenceGenerator(generator_args)
+    _worker_generator.load_dataset()
+
+
+def _build_shard(task):
+    """
+    Generate and write one shard, fully determined by its seed.
+    Images are generated batch_size at a time straight into the shard writer buffer.
+    :param task: dict with shard, count, seed, lengths, weights, width_range, output_dir, augment, format, batch_size
+    :return: shard record
+    """
+    start = time.perf_counter()
+    generator = _worker_generator
+    rng = np.random.default_rng(task["seed"])
+
+    height, digit_width = next(iter(generator.load_dataset().values())).shape[1:]
+    sequences, widths = sample_sequences(rng, task["count"], task["lengths"], task["weights"],
+                                         task["width_range"], digit_width, generator.spacing_range_min,
+                                         generator.spacing_mode)
+
+    # every shard has the same canvas width, narrower images are padded white #
+    writer = ShardWriter(task["output_dir"], (height, task["width_range"][1]), shard_size=task["count"],
+                         fmt=task["format"], first_shard=task["shard"])
+    canvas = np.full((task["batch_size"], height, task["width_range"][1]), 255, dtype=np.uint8)
+    for first in range(0, task["count"], task["batch_size"]):
+        batch_sequences = sequences[first:first + task["batch_size"]]
+        images, batch_info = generator.generate_batch(batch_sequences, augment=task["augment"],
+                                                      image_widths=widths[first:first + task["batch_size"]], rng=rng)
+        batch = canvas[:images.shape[0]]
+        batch[:, :, :images.shape[2]] = to_uint8(images)
+        batch[:, :, images.shape[2]:] = 255
+        writer.append(batch, batch_sequences, {"leftMargin": batch_info["leftMargin"],
+                                               "rightMargin": batch_info["rightMargin"],
+                                               "betweenMargin": batch_info["betweenMargin"],
+                                               "widths": batch_info["imageWidth"]})
+
+    record = writer.close(manifest=False)[0]
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+class DatasetBuilder(object):
+    """
+    Generate a dataset of digit sequence images over a process pool, one shard (images + index) per task
+    and a manifest.json listing them.
+    Shard seeds are spawned from the master seed, so a run is reproducible whatever the number of workers.
+    """
+    def __init__(self, cmd_args):
+        try:
+            self.count = cmd_args["count"]
+            self.lengths, self.weights = self._length_distribution(cmd_args["lengths"])
+            self.width_range = tuple(cmd_args["widthRange"])
+            self.shard_size = cmd_args["shardSize"]
+            self.workers = cmd_args["workers"] or os.cpu_count()
+            self.seed = cmd_args["seed"]
+            self.augment = cmd_args.get("augment", False)
+            self.format = cmd_args.get("format", "npy")
+            self.batch_size = cmd_args.get("batchSize", 1024)
+            self.output_dir = os.path.realpath(cmd_args["outputDir"])
+            self.shared_dataset = cmd_args.get("sharedDataset")
+            if self.shared_dataset is None:
+                self.shared_dataset = settings().generator.shared_dataset
+
+            self.generator_args = {
+                "digits": [],
+                "minSpacingRange": cmd_args["minSpacingRange"],
+                "maxSpacingRange": cmd_args["maxSpacingRange"],
+                "imageWidth": self.width_range[1],
+                "cacheMode": cmd_args.get("cacheMode"),
+                "imageFile": cmd_args.get("imageFile"),
+                "labelFile": cmd_args.get("labelFile"),
+            }
+            self._validate()
+        except Exception as e:
+            logger.error("Unable to build DatasetBuilder Object, exception : {}".format(str(e)))
+            raise e
+
+    @staticmethod
+    def _length_distribution(specs):
+        """
+        Parse digit count specs, Eg: ['3', '5:0.3'] => lengths [3, 5] with weights proportional to [1, 0.3]
+        :return: (lengths, normalized weights)
+        """
+        lengths, weights = list(), list()
+        for spec in specs:
+            length, _, weight = str(spec).partition(":")
+            lengths.append(int(length))
+            weights.append(float(weight) if weight else 1.0)
+        if min(lengths) < 1 or min(weights) < 0 or sum(weights) <= 0:
+            raise (Exception("Invalid digit length distribution = {}".format(specs)))
+        weights = np.asarray(weights) / sum(weights)
+        return lengths, weights
+
+    def _validate(self):
+        generator = DigitSequenceGenerator(self.generator_args)
+        with open(generator.image_file, "rb") as f:
+            _, _, _, digit_width = parse_idx_image_header(f.read(IMAGE_HEADER_SIZE),
+                                                          os.path.getsize(generator.image_file))
+
+        widest = minimum_widths(self.lengths, digit_width, generator.spacing_range_min, generator.spacing_mode)
+        if self.width_range[0] > self.width_range[1] or int(widest.max()) > self.width_range[1]:
+            raise (Exception("Width range = {} can not fit digit lengths = {}, needs at least {} pixels".format(
+                self.width_range, self.lengths, int(widest.max()))))
+        if generator.spacing_mode == "PROGRESSIVE" and \
+                max(self.lengths) - 1 > generator.spacing_range_max - generator.spacing_range_min + 1:
+            raise (Exception("Spacing range is too short for PROGRESSIVE gaps of {} digits".format(max(self.lengths))))
+
+    def tasks(self):
+        """
+        One task per shard, each with its own seed spawned from the master seed
+        """
+        n_shards = int(np.ceil(self.count / float(self.shard_size)))
+        seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(self.seed).spawn(n_shards)]
+        for shard in range(n_shards):
+            yield {
+                "shard": shard,
+                "count": min(self.shard_size, self.count - shard * self.shard_size),
+                "seed": seeds[shard],
+                "lengths": self.lengths,
+                "weights": self.weights,
+                "width_range": self.width_range,
+                "output_dir": self.output_dir,
+                "augment": self.augment,
+                "format": self.format,
+                "batch_size": self.batch_size,
+            }
+
+    def run(self):
+        """
+        Fan the shards out over the process pool
+        :return: list of shard summaries ordered by shard
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        start = time.perf_counter()
+        summaries = list()
+        shared = publish_dataset(self.generator_args) if self.shared_dataset else None
+        if shared is None:
+            # parse (and cache) the dataset once here : forked workers inherit it, spawned ones find a warm cache #
+            DigitSequenceGenerator(self.generator_args).load_dataset()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.generator_args, shared and shared.descriptor)) as executor:
+                futures = [executor.submit(_build_shard, task) for task in self.tasks()]
+                for future in as_completed(futures):
+                    summary = future.result()
+                    logger.info("Shard {} written : {} images in {:.2f}s to {}".format(
+                        summary["shard"], summary["count"], summary["seconds"], summary["images"]))
+                    summaries.append(summary)
+        finally:
+            if shared is not None:
+                shared.unlink()
+        write_manifest(self.output_dir, summaries)
+
+        elapsed = time.perf_counter() - start
+        logger.info("Dataset of {} images in {} shards generated with {} workers in {:.2f}s ({:.0f} images/sec)".format(
+            self.count, len(summaries), self.workers, elapsed, self.count / elapsed))
+        return sorted(summaries, key=lambda summary: summary["shard"])
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import shutil
+import threading
+import numpy as np
+from utils.custom_logging import Logging
+
+logger = Logging(__name__).get_logger()
+
+CACHE_FORMAT_VERSION = 1
+CACHE_MODES = ('use', 'rebuild', 'skip')
+# a lock file older than this is left over by a crashed writer #
+STALE_LOCK_SECONDS = 600
+
+
+def file_fingerprint(path, with_hash=True):
+    """
+    Identity of a source file used as cache key : size, mtime and sha256 of the content
+    :return: dict
+    """
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def _tmp_file(path):
+    """
+    Unique temporary name next to path, concurrent writers never share one
+    """
+    return "{}.{}.{}.tmp".format(path, os.getpid(), uuid.uuid4().hex[:8])
+
+
+_fingerprints = dict()
+_fingerprints_lock = threading.Lock()
+
+
+def source_fingerprint(path):
+    """
+    file_fingerprint with the sha256 remembered per process, the file is re-hashed only when its size or mtime changes
+    :return: dict
+    """
+    stat = os.stat(path)
+    key = os.path.realpath(path)
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(key)
+    if fingerprint is None or (fingerprint["size"], fingerprint["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        fingerprint = file_fingerprint(path)
+        with _fingerprints_lock:
+            _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+class DatasetCache(object):
+    """
+    On-disk cache of the normalized, label grouped image arrays.
+    One directory per (image file, label file) pair holding label_<n>.npy files and a manifest.json
+    with the source fingerprints. Arrays are loaded back with np.load(mmap_mode='r').
+
+    Invalidation policy :
+    - missing manifest, other format version or dtype => miss
+    - source size changed => miss
+    - size and mtime unchanged => hit without hashing (unless verify_hash)
+    - mtime changed => content is re-hashed, same sha256 is a hit (manifest mtime refreshed), else miss
+
+    Concurrent writers (eg: cold start of several processes) : the first one takes <cache dir>.lock, the others skip
+    writing and keep the arrays they parsed.
+    """
+    def __init__(self, image_file, image_label_file, cache_dir, dtype=np.float32, verify_hash=False):
+        self.image_file = image_file
+        self.image_label_file = image_label_file
+        self.dtype = np.dtype(dtype)
+        self.verify_hash = verify_hash
+        self.cache_path = os.path.join(
+            cache_dir, "{}__{}".format(os.path.basename(image_file), os.path.basename(image_label_file)))
+        self._manifest_file = os.path.join(self.cache_path, "manifest.json")
+        self._lock_file = self.cache_path + ".lock"
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_file) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        tmp_file = _tmp_file(self._manifest_file)
+        with open(tmp_file, "w") as fp:
+            json.dump(manifest, fp, indent=2)
+        os.replace(tmp_file, self._manifest_file)
+
+    def _source_is_current(self, cached, path):
+        current = file_fingerprint(path, with_hash=False)
+        if cached is None or cached.get("size") != current["size"]:
+            return False, None
+        if cached.get("mtime_ns") == current["mtime_ns"] and not self.verify_hash:
+            return True, None
+        current = file_fingerprint(path)
+        return current["sha256"] == cached.get("sha256"), current
+
+    def is_valid(self):
+        """
+        Check the manifest against the source files as per the invalidation policy
+        :return: bool
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            logger.info("Dataset cache miss, no manifest at {}".format(self.cache_path))
+            return False
+        if manifest.get("version") != CACHE_FORMAT_VERSION or manifest.get("dtype") != self.dtype.name:
+            logger.info("Dataset cache miss, format version or dtype changed for {}".format(self.cache_path))
+            return False
+
+        refreshed = False
+        for key, path in (("image_file", self.image_file), ("label_file", self.image_label_file)):
+            current, fingerprint = self._source_is_current(manifest["sources"].get(key), path)
+            if not current:
+                logger.info("Dataset cache stale, source changed : {}".format(path))
+                return False
+            if fingerprint is not None:
+                manifest["sources"][key] = fingerprint
+                refreshed = True
+
+        if refreshed:
+            logger.info("Dataset cache content hash unchanged, refreshing manifest mtime for {}".format(
+                self.cache_path))
+            self._write_manifest(manifest)
+        return True
+
+    def load(self):
+        """
+        Load the cached label arrays memory mapped, read-only
+        :return: dict label -> array or None on miss
+        """
+        try:
+            if not self.is_valid():
+                return None
+            manifest = self._read_manifest()
+            img_map = dict()
+            for label in manifest["labels"]:
+                img_map[label] = np.load(os.path.join(self.cache_path, "label_{}.npy".format(label)), mmap_mode='r')
+            return img_map
+        except Exception as e:
+            logger.error("Unable to load dataset cache = {}, exception : {}".format(self.cache_path, str(e)))
+            return None
+
+    def _acquire_lock(self):
+        """
+        :return: True when this process is now the only writer of the cache
+        """
+        os.makedirs(os.path.dirname(self._lock_file) or ".", exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(self._lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode("ascii"))
+                os.close(fd)
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self._lock_file) < STALE_LOCK_SECONDS:
+                        return False
+                    logger.info("Removing stale dataset cache lock {}".format(self._lock_file))
+                    os.remove(self._lock_file)
+                except OSError:
+                    pass
+        return False
+
+    def _release_lock(self):
+        try:
+            os.remove(self._lock_file)
+        except OSError:
+            pass
+
+    def store(self, img_map):
+        """
+        Write the label arrays then the manifest, the manifest is replaced last so a crashed write is a miss.
+        Skipped when another process is writing the cache.
+        :param img_map: dict label -> (n, rows, cols) array
+        """
+        if not self._acquire_lock():
+            logger.info("Dataset cache {} is being written by another process, not storing".format(self.cache_path))
+            return
+        try:
+            if os.path.exists(self._manifest_file):
+                os.remove(self._manifest_file)
+            os.makedirs(self.cache_path, exist_ok=True)
+            for label, images in img_map.items():
+                label_file = os.path.join(self.cache_path, "label_{}.npy".format(label))
+                tmp_file = _tmp_file(label_file)
+                with open(tmp_file, "wb") as fp:
+                    np.save(fp, np.ascontiguousarray(images, dtype=self.dtype))
+                os.replace(tmp_file, label_file)
+
+            self._write_manifest({
+                "version": CACHE_FORMAT_VERSION,
+                "dtype": self.dtype.name,
+                "labels": sorted(img_map.keys()),
+                "counts": {label: int(img_map[label].shape[0]) for label in img_map},
+                "sources": {
+                    "image_file": file_fingerprint(self.image_file),
+                    "label_file": file_fingerprint(self.image_label_file),
+                },
+            })
+            logger.info("Dataset cache written to {}".format(self.cache_path))
+        except Exception as e:
+            logger.error("Unable to write dataset cache = {}, exception : {}".format(self.cache_path, str(e)))
+        finally:
+            self._release_lock()
+
+    def clear(self):
+        shutil.rmtree(self.cache_path, ignore_errors=True)
@@ -0,0 +1,95 @@
+import os
+import threading
+from utils.custom_logging import Logging
+
+logger = Logging(__name__).get_logger()
+
+
+class DatasetRegistry(object):
+    """
+    Process wide registry of loaded datasets, one entry per (image file, label file) pair.
+    Every DigitSequenceGenerator in the process shares the loaded label map instead of re-reading the IDX files.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._datasets = dict()
+        self._loaders = dict()
+        self._lock = threading.RLock()
+        # incremented whenever loaded data may change, lets callers invalidate what they derived from it #
+        self.generation = 0
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def key(image_file, image_label_file):
+        return os.path.realpath(image_file), os.path.realpath(image_label_file)
+
+    def get(self, image_file, image_label_file, loader):
+        """
+        Return the label map of the pair, loading it with loader() on first use
+        :param loader: callable returning dict label -> images
+        :return: dict label -> images
+        """
+        key = self.key(image_file, image_label_file)
+        img_map = self._datasets.get(key)
+        if img_map is not None:
+            return img_map
+
+        with self._lock:
+            img_map = self._datasets.get(key)
+            if img_map is None:
+                logger.info("Dataset registry loading {}".format(str(key)))
+                img_map = loader()
+                self._loaders[key] = loader
+                self._datasets[key] = img_map
+            return img_map
+
+    def register(self, image_file, image_label_file, img_map, loader=None):
+        """
+        Install an already loaded label map for the pair
+        """
+        key = self.key(image_file, image_label_file)
+        with self._lock:
+            self.generation += 1
+            self._datasets[key] = img_map
+            if loader is not None:
+                self._loaders[key] = loader
+
+    def reload(self, image_file=None, image_label_file=None):
+        """
+        Reload hook for when the files change. Reloads the given pair, or every loaded pair when none is given.
+        Generators already holding the old map keep using it, new ones get the fresh map.
+        :return: list of reloaded keys
+        """
+        with self._lock:
+            if image_file is None:
+                keys = list(self._loaders.keys())
+            else:
+                keys = [self.key(image_file, image_label_file)]
+
+            self.generation += 1
+            for key in keys:
+                loader = self._loaders.get(key)
+                if loader is None:
+                    self._datasets.pop(key, None)
+                    continue
+                logger.info("Dataset registry reloading {}".format(str(key)))
+                self._datasets[key] = loader()
+            return keys
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._datasets.clear()
+            self._loaders.clear()
+
+    def loaded(self):
+        return list(self._datasets.keys())
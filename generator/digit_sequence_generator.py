@@ -1,49 +1,96 @@
-import math
-import re
 import os
 import json
+import time
+import logging
 import traceback
 import numpy as np
 from datetime import datetime
-import matplotlib.pyplot as plt
 from utils.custom_logging import Logging
-from utils.config_parser import ConfParser
-from augmentor.augmentation import Augmentor
+from utils.settings import settings, MdsgMode
+from utils.profiling import timed
 from generator.image_data_reader import ImageDataReader
+from generator.dataset_cache import DatasetCache, CACHE_MODES, source_fingerprint
+from generator.dataset_registry import DatasetRegistry
+from generator.compositor import digit_offsets, compose, compose_batch
+from generator.spacing_planner import is_equalized, plan_spacing, plan_spacing_bulk
+from generator.png_writer import write_png, shared_writer, wait_writes
 
 logger = Logging(__name__).get_logger()
 
 
+def configured_dataset_files(config=None):
+    """
+    IDX image and label files named by the GENERATOR section, under input_data
+    :param config: Settings, default settings()
+    :return: (image_file, label_file)
+    """
+    generator_config = (config or settings()).generator
+    input_dir = os.path.join(os.path.dirname(__file__), '../input_data/')
+    return os.path.join(input_dir, generator_config.image_path), os.path.join(input_dir, generator_config.label_path)
+
+
 class DigitSequenceGenerator(object):
-    def __init__(self, cmd_args):
+    def __init__(self, cmd_args, config=None):
+        """
+        :param cmd_args: dict of digits, minSpacingRange, maxSpacingRange, imageWidth and optional seed, imageFile,
+                         labelFile, cacheMode
+        :param config: Settings snapshot to generate with (eg: with per request overrides), default settings()
+        """
         try:
-            self.config = ConfParser()
+            self.settings = config or settings()
+            generator_config = self.settings.generator
 
             self.digits = cmd_args["digits"]
             self.spacing_range_max = cmd_args["maxSpacingRange"]
             self.spacing_range_min = cmd_args["minSpacingRange"]
             self.image_width = cmd_args["imageWidth"]
+            # every random choice of this generator (image selection, augmentation) is drawn from self.rng #
+            self.seed = cmd_args.get("seed")
+            self.rng = np.random.default_rng(self.seed)
 
-            input_dir = os.path.join(os.path.dirname(__file__), '../input_data/')
             output_dir = os.path.join(os.path.dirname(__file__), '../')
 
-            self.image_file = os.path.join(input_dir, self.config.parser.get('GENERATOR', 'ImagePath'))
-            self.image_label_file = os.path.join(input_dir, self.config.parser.get('GENERATOR', 'LabelPath'))
-            self.output_path = os.path.join(output_dir, self.config.parser.get('GENERATOR', 'OutputPath'))
-            self.spacing_mode = self.config.parser.get('GENERATOR', 'spacingMode')
-            self.white_pixel = self.config.parser.get('GENERATOR', 'whitePixel')
-
-            self._mdsg_mode = int(self.config.parser.get('AUGMENTATION', 'mdsg_mode'))
+            image_file, image_label_file = configured_dataset_files(self.settings)
+            self.image_file = cmd_args.get("imageFile") or image_file
+            self.image_label_file = cmd_args.get("labelFile") or image_label_file
+            self.output_path = os.path.join(output_dir, generator_config.output_path)
+            self.spacing_mode = generator_config.spacing_mode
+            self.white_pixel = generator_config.white_pixel
+            self.reader_backend = generator_config.reader_backend
+            self.png_compression = generator_config.png_compression
+            self.async_write = generator_config.async_write
+            # (path, Future) of the background writes submitted by image_downloader #
+            self._pending_writes = list()
+
+            self.cache_mode = cmd_args.get("cacheMode") or self.settings.cache.cache_mode
+            if self.cache_mode not in CACHE_MODES:
+                raise (Exception("cacheMode = {} should be one of {}".format(self.cache_mode, CACHE_MODES)))
+            self.cache_dir = os.path.join(output_dir, self.settings.cache.cache_dir)
+            self.cache_verify_hash = self.settings.cache.verify_hash
+
+            self._mdsg_mode = self.settings.augmentation.mdsg_mode
+
+            bank_config = self.settings.augmentation_bank
+            self.bank_enabled = bank_config.enabled
+            if self.bank_enabled:
+                self.bank_args = {
+                    "variants": bank_config.variants,
+                    "max_bytes": bank_config.max_size_mb << 20,
+                    "eviction": bank_config.eviction,
+                    "storage_dir": os.path.join(output_dir, bank_config.storage_dir) if bank_config.storage_dir else None,
+                }
+                self.bank_warm_per_label = bank_config.warm_per_label
 
             self._img_map = None
             self.image_info = None
             self.aug_image_info = None
             self._random_img_array = None
+            self._selected_indices = None
             self._aug_random_img_array = None
             self.output_image_array = None
             self.aug_output_image_array = None
 
-            self.img_reader = ImageDataReader(self.image_file, self.image_label_file)
+            self.img_reader = ImageDataReader(self.image_file, self.image_label_file, backend=self.reader_backend)
 
         except Exception as e:
             logger.error("Unable to build DigitSequenceGenerator Object, exception : {}".format(str(e)))
@@ -56,7 +103,7 @@ class DigitSequenceGenerator(object):
         :return:
         """
         try:
-            self._img_map = self.img_reader.read_image()
+            self._img_map = self.load_dataset()
         except Exception as e:
             logger.error("Image data read fail : Exception : {}".format(e))
             logger.error(
@@ -66,12 +113,14 @@ class DigitSequenceGenerator(object):
         try:
             self._random_img_array = self._select_images()
             # for augmented and compare mode
-            if self._mdsg_mode == 2 or self._mdsg_mode == 3:
-                self._aug_random_img_array = Augmentor(self._random_img_array).execute()
+            if self._mdsg_mode in (MdsgMode.AUGMENTED, MdsgMode.COMPARE):
+                labels, indices = self._selected_indices
+                self._aug_random_img_array = self._augment(self._random_img_array, labels, indices, self.rng,
+                                                           seeded=self.seed is not None)
                 self.aug_output_image_array, self.aug_image_info = self._generate_sequence(mode='augment')
 
             # for original and compare mode
-            if self._mdsg_mode == 1 or self._mdsg_mode == 3:
+            if self._mdsg_mode in (MdsgMode.ORIGINAL, MdsgMode.COMPARE):
                 self.output_image_array, self.image_info = self._generate_sequence(mode='original')
 
         except Exception as e:
@@ -80,6 +129,208 @@ class DigitSequenceGenerator(object):
                 "\n".join([line.rstrip('\n') for line in traceback.format_exception(e.__class__, e, e.__traceback__)]))
             raise e
 
+    @classmethod
+    def preload_dataset(cls, **kwargs):
+        """
+        Load the configured dataset into the process wide registry, eg: at service startup.
+        With the augmentation bank enabled, warmPerLabel images of every label are banked in the background.
+        :param kwargs: optional imageFile, labelFile, cacheMode overrides
+        :return: dict label -> images
+        """
+        cmd_args = {"digits": [], "minSpacingRange": 0, "maxSpacingRange": 0, "imageWidth": 0}
+        cmd_args.update(kwargs)
+        generator = cls(cmd_args)
+        img_map = generator.load_dataset()
+        if generator.bank_enabled and generator.bank_warm_per_label:
+            generator.augmentation_bank().warm_async(per_label=generator.bank_warm_per_label)
+        return img_map
+
+    def load_dataset(self):
+        """
+        Label grouped images of this generator's IDX files, loaded once per process through DatasetRegistry
+        :return: dict label -> images
+        """
+        return DatasetRegistry.instance().get(self.image_file, self.image_label_file, self._load_image_map)
+
+    def _load_image_map(self):
+        """
+        Load the label grouped images, through the on-disk dataset cache unless cacheMode is skip.
+        A valid cache wins over readerBackend (its float arrays are memory mapped), on a cold start the IDX files
+        are read with readerBackend and the cache is written from what it returned.
+        :return: dict label -> images
+        """
+        start = time.perf_counter()
+        if self.cache_mode == 'skip':
+            img_map = self.img_reader.read_image()
+            logger.info("Dataset loaded without cache in {:.3f}s".format(time.perf_counter() - start))
+            return img_map
+
+        cache = DatasetCache(self.image_file, self.image_label_file, self.cache_dir,
+                             verify_hash=self.cache_verify_hash)
+        img_map = cache.load() if self.cache_mode == 'use' else None
+        if img_map is not None:
+            logger.info("Dataset loaded from cache (warm start) in {:.3f}s".format(time.perf_counter() - start))
+            return img_map
+
+        img_map = self.img_reader.read_image()
+        cache.store(img_map)
+        logger.info("Dataset parsed and cached (cold start) in {:.3f}s".format(time.perf_counter() - start))
+        return img_map
+
+    @timed("batch")
+    def generate_batch(self, digit_sequences, n=1, augment=False, image_widths=None, rng=None):
+        """
+        Generate n images for every digit sequence in one vectorized call : image indices are sampled at once,
+        spacing is planned for the whole batch with array ops and digits are scattered into one preallocated
+        (N, H, W) tensor. Spacing range and spacing mode are the ones of this generator.
+        :param digit_sequences: list of digit lists, Eg: [[3, 5, 7], [1, 2]]
+        :param n: number of images per digit sequence
+        :param augment: apply the configured augmentation to the selected digits
+        :param image_widths: optional width per digit sequence, default this generator's image width.
+                             W is the widest one, narrower images are laid out in their own width and padded white.
+        :param rng: np.random.Generator for this batch, default this generator's rng.
+                    An explicit rng marks the batch as seeded : augmentation then bypasses the augmentation bank.
+        :return: (images float32 array of shape (N, H, W), batch_info dict of per image arrays)
+        """
+        try:
+            img_map = self.load_dataset()
+            sequences = [[int(digit) for digit in sequence] for sequence in digit_sequences for _ in range(n)]
+            if not sequences or min(len(sequence) for sequence in sequences) == 0:
+                raise (Exception("generate_batch needs at least one non empty digit sequence"))
+
+            lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+            if image_widths is None:
+                widths = np.full(lengths.shape[0], self.image_width, dtype=np.int64)
+            else:
+                widths = np.repeat(np.asarray(image_widths, dtype=np.int64), n)
+            labels = np.fromiter((digit for sequence in sequences for digit in sequence), dtype=np.int64,
+                                 count=int(lengths.sum()))
+            rows = np.repeat(np.arange(lengths.shape[0]), lengths)
+
+            label_counts = np.zeros(10, dtype=np.int64)
+            for label in img_map.keys():
+                label_counts[int(label)] = img_map[label].shape[0]
+            # out of range digits (eg: 12 or -1) are missing too, checked before indexing label_counts #
+            in_range = (labels >= 0) & (labels < label_counts.shape[0])
+            missing = np.unique(labels[~in_range | (label_counts[np.where(in_range, labels, 0)] == 0)])
+            if missing.shape[0]:
+                error = "user provided digits = {}, not present in image data base. Unique image labels are : {}".format(
+                    str(missing), str(img_map.keys()))
+                logger.error(error)
+                raise (Exception(error))
+
+            seeded = rng is not None or self.seed is not None
+            rng = rng if rng is not None else self.rng
+            # one random index per digit of the whole batch #
+            chosen = rng.integers(0, label_counts[labels])
+
+            height, digit_width = next(iter(img_map.values())).shape[1:]
+            digits = np.empty((labels.shape[0], height, digit_width), dtype=np.float32)
+            for label in np.unique(labels):
+                mask = labels == label
+                digits[mask] = img_map[str(label)][chosen[mask]]
+
+            if augment:
+                digits = self._augment(digits, labels, chosen, rng, seeded)
+
+            leftSpace, rightSpace, betweenSpace, offsets = self._plan_batch(widths, lengths, rows, digit_width)
+
+            images = np.full((lengths.shape[0], height, int(widths.max())), float(self.white_pixel), dtype=np.float32)
+            compose_batch(images, digits, rows, offsets)
+
+            batch_info = {
+                "digits": sequences,
+                "lengths": lengths,
+                "leftMargin": leftSpace,
+                "rightMargin": rightSpace,
+                "betweenMargin": betweenSpace,
+                "offsets": offsets,
+                "imageWidth": widths,
+                "fullImageSize": images.shape[1:],
+            }
+            logger.info("Generated batch of %d images, %d digits, size = %s", lengths.shape[0], labels.shape[0],
+                        images.shape)
+            return images, batch_info
+
+        except Exception as e:
+            logger.error("Batch sequence generator fail, Exception : {}".format(e))
+            raise e
+
+    def augmentation_bank(self):
+        """
+        Process wide augmentation bank of this generator's dataset
+        """
+        from augmentor.augmentation_bank import shared_bank
+        return shared_bank(DatasetRegistry.key(self.image_file, self.image_label_file), self.load_dataset(),
+                           sources=[source_fingerprint(self.image_file), source_fingerprint(self.image_label_file)],
+                           **self.bank_args)
+
+    def _augment(self, images, labels, indices, rng, seeded=False):
+        """
+        Augmented copy of the selected digits, served from the augmentation bank when it is enabled.
+        Banked variants depend on earlier requests, so seeded requests are always augmented from rng.
+        The bank holds variants of the process settings, a generator with its own AUGMENTATION section
+        (eg: Settings.override) augments with its own pipeline.
+        :param labels: label of every image
+        :param indices: index of every image inside its label
+        :return: float32 (N, H, W) array
+        """
+        if not self.bank_enabled or seeded or self.settings.augmentation != settings().augmentation:
+            # the augmentor is only imported by modes that augment #
+            from augmentor.augmentation import Augmentor
+            return Augmentor(images, rng, self.settings).execute()
+        bank = self.augmentation_bank()
+        augmented = bank.sample(labels, indices, rng)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Augmentation bank stats = %s", bank.stats())
+        return augmented
+
+    def _plan_batch(self, widths, lengths, rows, digit_width):
+        """
+        Spacing of every image of a batch, same layout rules as _generate_sequence
+        :param widths: image width of every image
+        :param lengths: number of digits per image
+        :param rows: image index of every digit
+        :param digit_width: width of every digit image
+        :return: (leftSpace, rightSpace, betweenSpace, x offset of every digit)
+        """
+        gaps = lengths - 1
+        free_width = widths - lengths * digit_width
+        if (free_width < 0).any():
+            row = int(np.argmin(free_width))
+            error = "User input image width = {} is (less than) sum of width of selected images = {}.".format(
+                int(widths[row]), int(lengths[row] * digit_width))
+            logger.error(error)
+            raise (Exception(error))
+
+        # position of every digit inside its image #
+        position = np.arange(rows.shape[0]) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        if not is_equalized(self.spacing_mode) and \
+                (gaps > self.spacing_range_max - self.spacing_range_min + 1).any():
+            error = "For spacing_mode = {}, spacing range = {} to {} has fewer values than gaps between {} digits".format(
+                self.spacing_mode, self.spacing_range_min, self.spacing_range_max, int(lengths.max()))
+            logger.error(error)
+            raise (Exception(error))
+
+        leftSpace, rightSpace, betweenSpace, fits = plan_spacing_bulk(widths, lengths * digit_width, lengths,
+                                                                      self.spacing_range_min, self.spacing_range_max,
+                                                                      self.spacing_mode)
+        if not fits.all():
+            error = "For spacing_mode = {}, with min spacing_range = {} and max spacing range = {}, image_width = {}, fitting is not possible for batch rows = {}".format(
+                self.spacing_mode, self.spacing_range_min, self.spacing_range_max, str(np.unique(widths)),
+                str(np.flatnonzero(~fits)))
+            logger.error(error)
+            raise (Exception(error))
+
+        if is_equalized(self.spacing_mode):
+            gap_offsets = position * betweenSpace[rows]
+        else:
+            gap_offsets = position * self.spacing_range_min + position * (position - 1) // 2
+        offsets = leftSpace[rows] + position * digit_width + gap_offsets
+        return leftSpace, rightSpace, betweenSpace, offsets
+
+    @timed("select")
     def _select_images(self):
         """
         Select a random image from pool of images as per user input
@@ -87,56 +338,55 @@ class DigitSequenceGenerator(object):
         """
         try:
             # We should make a list of rawImages so that the order of input given in digits can be maintained #
-            rawImageList = list()
-            logger.info("User input digit list = {}".format(str(self.digits)))
-            for user_digit in self.digits:
-                if str(user_digit) in self._img_map.keys():
-                    images_for_digit = self._img_map[str(user_digit)]
-                    chosen_image_idx = np.random.choice(np.arange(0, images_for_digit.shape[0]), 1, replace=False)
-                    chosen_image = images_for_digit[chosen_image_idx, :, :]
-                    chosen_image = chosen_image.reshape(chosen_image.shape[1], chosen_image.shape[2])
-                    logger.debug(
-                        "For user input digit = {}, chosen index from in-memory dict = {}".format(str(user_digit),
-                                                                                                  chosen_image_idx))
-                    rawImageList.append(chosen_image)
-                else:
+            logger.info("User input digit list = %s", self.digits)
+            labels = [str(user_digit) for user_digit in self.digits]
+            for label in labels:
+                if label not in self._img_map.keys():
                     error = "user provided digit = {}, not present in image data base. Unique image labels are : {}".format(
-                        str(user_digit), str(self._img_map.keys()))
+                        label, str(self._img_map.keys()))
                     logger.error(error)
                     raise (Exception(error))
+
+            # one random index per digit, drawn at once #
+            chosen_image_idx = self.rng.integers(0, [self._img_map[label].shape[0] for label in labels])
+            logger.debug("For user input digits = %s, chosen indexes from in-memory dict = %s", self.digits,
+                         chosen_image_idx)
+            rawImageList = [np.asarray(self._img_map[label][int(index)]) for label, index in zip(labels, chosen_image_idx)]
+            self._selected_indices = (labels, chosen_image_idx.tolist())
             return rawImageList
         except Exception as e:
             raise (e)
 
+    def output_images(self):
+        """
+        Generated images in mdsg_mode order :
+        mode 1: original image only
+        mode 2: augmented image only
+        mode 3: original then augmented
+        :return: list of (suffix, image array, image info)
+        """
+        images = list()
+        if self._mdsg_mode in (MdsgMode.ORIGINAL, MdsgMode.COMPARE):
+            images.append(('org', self.output_image_array, self.image_info))
+        if self._mdsg_mode in (MdsgMode.AUGMENTED, MdsgMode.COMPARE):
+            images.append(('aug', self.aug_output_image_array, self.aug_image_info))
+        return images
+
+    @timed("save")
     def image_downloader(self):
         """
         Function for downloading the output image based on mdsg_mode flag.
         mode 1: original image only
         mode 2: augmented image only
         mode 3: both
+        With asyncWrite the files are encoded and written by the background writer,
+        wait_for_writes() waits for the ones of this generator.
         :return: Image file list
         """
 
-        iteration = math.ceil(self._mdsg_mode / 2.0)
         file_name = list()
 
-        for itr in range(iteration):
-            """
-            For original image mode and both mode's first iteration (original image) 
-            """
-            if self._mdsg_mode == 1 or (self._mdsg_mode == 3 and itr == 0):
-                image_array = self.output_image_array
-                image_info = self.image_info
-                _ext = 'org'
-
-            """
-            For augmented image mode and both mode's first iteration (augmented image) 
-            """
-            if self._mdsg_mode == 2 or (self._mdsg_mode == 3 and itr == 1):
-                image_array = self.aug_output_image_array
-                image_info = self.aug_image_info
-                _ext = 'aug'
-
+        for _ext, image_array, image_info in self.output_images():
             """
             Save image in png format. 
             for original image suffix : _ord_
@@ -144,10 +394,14 @@ class DigitSequenceGenerator(object):
             """
             try:
                 filename = os.path.realpath(
-                    self.output_path + "/mdsg_" + datetime.now().strftime("%Y_%m_%d_%H_%M_%S_") + _ext + "_" +
+                    self.output_path + "/mdsg_" + datetime.now().strftime("%Y_%m_%d_%H_%M_%S_%f_") + _ext + "_" +
                     image_info["fullImageSize"].strip("(").strip(")").replace(", ", "x") + ".png")
-                logger.info("Writing image to output file = {}".format(filename))
-                plt.imsave(fname=filename, arr=np.float32(image_array), cmap="gray")
+                logger.info("Writing image to output file = %s", filename)
+                if self.async_write:
+                    self._pending_writes.append(
+                        (filename, shared_writer().submit(filename, image_array, self.png_compression)))
+                else:
+                    write_png(filename, image_array, self.png_compression)
                 file_name.append(filename)
 
             except Exception as e:
@@ -158,6 +412,15 @@ class DigitSequenceGenerator(object):
 
         return file_name
 
+    def wait_for_writes(self):
+        """
+        Wait for the background writes of this generator only, not the ones of other requests
+        :return: list of (path, error) failures
+        """
+        writes, self._pending_writes = self._pending_writes, list()
+        return wait_writes(writes)
+
+    @timed("compose")
     def _generate_sequence(self, mode='original'):
 
         if mode == 'augment':
@@ -174,160 +437,47 @@ class DigitSequenceGenerator(object):
                 logger.error(error)
                 raise (Exception(error))
 
-            # For equalized spacing
-            if (re.search("^(EQUALIZED){1}_{1}(MAX|MIN)$", self.spacing_mode)):
-
-                rightEndWhiteSpaceLeft = self.image_width - (minRequiredWidth + (
-                            (len(_img_array) - 1) * np.arange(self.spacing_range_min, self.spacing_range_max + 1, 1)))
-                if not len(np.where(rightEndWhiteSpaceLeft >= 0)[0]) > 0:
-                    error = "For spacing_mode = {},\
-                    with min spacing_range = {} and\
-                    max spacing range = {},\
-                    image_width = {} and\
-                    totalWidthOfAllImages = {}, fitting is not possible.\n\
-                    RightEndSpacingLeft = {}".format(self.spacing_mode,
-                                                     self.spacing_range_min,
-                                                     self.spacing_range_max,
-                                                     self.image_width,
-                                                     minRequiredWidth,
-                                                     str(rightEndWhiteSpaceLeft))
-                    logger.error(error)
-                    raise (Exception(error))
-
-                if (self.spacing_mode == "EQUALIZED_MAX"):
-                    equalized_min_max_func = min
-                else:
-                    equalized_min_max_func = max
-
-                logger.debug("User selected spacing mode = {}".format(self.spacing_mode))
-
-                # distance between two images
-                selectedBetweenSpace = (np.arange(self.spacing_range_min, self.spacing_range_max + 1, 1)[np.where(
-                    rightEndWhiteSpaceLeft == equalized_min_max_func(
-                        rightEndWhiteSpaceLeft[np.where(rightEndWhiteSpaceLeft >= 0)]))])[0]
-                leftSpace = int(
-                    equalized_min_max_func(rightEndWhiteSpaceLeft[np.where(rightEndWhiteSpaceLeft >= 0)]) / 2)
-                rightSpace = equalized_min_max_func(
-                    rightEndWhiteSpaceLeft[np.where(rightEndWhiteSpaceLeft >= 0)]) - leftSpace
-
-                if ((leftSpace + minRequiredWidth + (
-                        selectedBetweenSpace * (len(_img_array) - 1)) + rightSpace) != self.image_width):
-                    error = "FATAL ERROR : user image width = {}, betweenspace = {}, leftspace = {}, rightspace = {}, SUMMATION DOES NOT MATCH, CHECK LOGS".format(
-                        self.image_width, selectedBetweenSpace, leftSpace, rightSpace)
-                    logger.error(error)
-                    raise (Exception(error))
-
-                maxHeightAmongAllImages = max([x.shape[0] for x in _img_array])
-                logger.debug(
-                    "betweenspace = {}, leftspace = {}, rightspace = {}, maxheight = {}".format(selectedBetweenSpace,
-                                                                                                leftSpace, rightSpace,
-                                                                                                maxHeightAmongAllImages))
-
-                selectedBetweenSpaceArray = np.repeat(self.white_pixel,
-                                                      (maxHeightAmongAllImages * selectedBetweenSpace)).reshape(
-                    maxHeightAmongAllImages, selectedBetweenSpace)
-                leftSpaceArray = np.repeat(self.white_pixel, (maxHeightAmongAllImages * leftSpace)).reshape(
-                    maxHeightAmongAllImages, leftSpace)
-                rightSpaceArray = np.repeat(self.white_pixel, (maxHeightAmongAllImages * rightSpace)).reshape(
-                    maxHeightAmongAllImages, rightSpace)
-
-                logger.debug("\n\
-                selectedBetweenSpace = {}\n\
-                leftSpace = {}\n\
-                rightSpace = {}\n\
-                maxHeightAmongAllImages = {}\n\
-                selectedBetweenSpaceArray.shape = {}\n\
-                leftSpaceArray.shape = {}\n\
-                rightSpaceArray.shape = {}\n\
-                rightEndWhiteSpaceLeft.shape = {}\n\
-                rightEndWhiteSpaceLeft (array) = {}".format(selectedBetweenSpace, leftSpace, rightSpace,
-                                                            maxHeightAmongAllImages,
-                                                            str(selectedBetweenSpaceArray.shape),
-                                                            str(leftSpaceArray.shape), str(rightSpaceArray.shape),
-                                                            str(rightEndWhiteSpaceLeft.shape),
-                                                            str(rightEndWhiteSpaceLeft)))
-
-
-                finalImage = _img_array[0]
-                for image in _img_array[1:]:
-                    logger.debug("finalImage before white space addition = {}".format(str(finalImage.shape)))
-                    finalImage = np.hstack((finalImage, selectedBetweenSpaceArray, image))
-                    logger.debug("finalImage after white space addition = {}".format(str(finalImage.shape)))
-
-                finalImage = np.hstack((leftSpaceArray, finalImage, rightSpaceArray))
-
-                imageMetaInfo = dict()
-                imageMetaInfo["fullImageSize"] = str((maxHeightAmongAllImages, leftSpace + minRequiredWidth + (
-                            selectedBetweenSpace * (len(_img_array) - 1)) + rightSpace))
-                imageMetaInfo["leftMargin"] = str(leftSpace)
-                imageMetaInfo["rightMargin"] = str(rightSpace)
-                imageMetaInfo["betweenMargins"] = str(np.repeat(selectedBetweenSpace, len(_img_array)))
-                imageMetaInfo["numberOfLabels"] = str(len(_img_array))
-
-                logger.debug("finalImage FINALLY = {}".format(str(finalImage.shape)))
-                logger.info("FINAL PROCESSED IMAGE METAINFO :\n{}".format(json.dumps(imageMetaInfo, indent=2)))
+            logger.debug("User selected spacing mode = %s", self.spacing_mode)
+            try:
+                leftSpace, rightSpace, betweenSpaces = plan_spacing(self.image_width, minRequiredWidth,
+                                                                    len(_img_array), self.spacing_range_min,
+                                                                    self.spacing_range_max, self.spacing_mode)
+            except Exception as e:
+                logger.error(str(e))
+                raise e
+            if is_equalized(self.spacing_mode):
+                betweenMargins = np.repeat(betweenSpaces[:1] if len(betweenSpaces) else self.spacing_range_min,
+                                           len(_img_array))
             else:
-                # Processing for PROGRESSIVE MODE #
-                selectedBetweenSpace = np.arange(self.spacing_range_min, self.spacing_range_max + 1, 1)[
-                                       0:len(_img_array) - 1]
-                rightEndWhiteSpaceLeft = self.image_width - (minRequiredWidth + sum(selectedBetweenSpace))
-                if (rightEndWhiteSpaceLeft < 0):
-                    error = "For spacing_mode = {}, with min spacing_range = {} and max spacing range = {},image_width = {} and totalWidthOfAllImages = {},selectedBetweenSpace = {} fitting is not possible.\nRightEndSpacingLeft = {}".format(
-                        self.spacing_mode,
-                        self.spacing_range_min,
-                        self.spacing_range_max,
-                        self.image_width,
-                        minRequiredWidth,
-                        str(selectedBetweenSpace),
-                        rightEndWhiteSpaceLeft)
-                    logger.error(error)
-                    raise (Exception(error))
-
-                leftSpace = int(rightEndWhiteSpaceLeft / 2)
-                rightSpace = rightEndWhiteSpaceLeft - leftSpace
+                betweenMargins = betweenSpaces
 
-                if ((leftSpace + minRequiredWidth + sum(selectedBetweenSpace) + rightSpace) != self.image_width):
-                    error = "FATAL ERROR : user image width = {}, betweenspace = {}, leftspace = {}, rightspace = {}, SUMMATION DOES NOT MATCH, CHECK LOGS".format(
-                        self.image_width, selectedBetweenSpace, leftSpace, rightSpace)
-                    logger.error(error)
-                    raise (Exception(error))
-
-                maxHeightAmongAllImages = max([x.shape[0] for x in _img_array])
-
-                logger.debug("betweenspace = {}, leftspace = {}, rightspace = {}, maxheight = {}".format(
-                    str(selectedBetweenSpace), leftSpace, rightSpace, maxHeightAmongAllImages))
-
-                leftSpaceArray = np.repeat(self.white_pixel, (maxHeightAmongAllImages * leftSpace)).reshape(
-                    maxHeightAmongAllImages, leftSpace)
-                rightSpaceArray = np.repeat(self.white_pixel, (maxHeightAmongAllImages * rightSpace)).reshape(
-                    maxHeightAmongAllImages, rightSpace)
+            if ((leftSpace + minRequiredWidth + int(sum(betweenSpaces)) + rightSpace) != self.image_width):
+                error = "FATAL ERROR : user image width = {}, betweenspace = {}, leftspace = {}, rightspace = {}, SUMMATION DOES NOT MATCH, CHECK LOGS".format(
+                    self.image_width, betweenSpaces, leftSpace, rightSpace)
+                logger.error(error)
+                raise (Exception(error))
 
-                finalImage = _img_array[0]
-                for itr in np.arange(1, len(_img_array), 1):
-                    logger.debug("finalImage before white space addition = {}".format(str(finalImage.shape)))
-                    selectedBetweenSpaceArray = np.repeat(self.white_pixel,
-                                                          maxHeightAmongAllImages * selectedBetweenSpace[
-                                                              itr - 1]).reshape(maxHeightAmongAllImages,
-                                                                                selectedBetweenSpace[itr - 1])
-                    image = _img_array[itr]
-                    finalImage = np.hstack((finalImage, selectedBetweenSpaceArray, image))
-                    logger.debug("finalImage after white space addition = {}".format(str(finalImage.shape)))
+            maxHeightAmongAllImages = max([x.shape[0] for x in _img_array])
+            logger.debug("betweenspace = %s, leftspace = %s, rightspace = %s, maxheight = %s", betweenSpaces,
+                         leftSpace, rightSpace, maxHeightAmongAllImages)
 
-                finalImage = np.hstack((leftSpaceArray, finalImage, rightSpaceArray))
+            # every x offset is known up front, digits are blitted into a canvas filled with white once #
+            offsets = digit_offsets([x.shape[1] for x in _img_array], leftSpace, betweenSpaces)
+            finalImage = compose(_img_array, offsets, self.image_width, self.white_pixel,
+                                 height=maxHeightAmongAllImages)
 
-                imageMetaInfo = dict()
-                imageMetaInfo["fullImageSize"] = str(
-                    (maxHeightAmongAllImages, leftSpace + minRequiredWidth + sum(selectedBetweenSpace) + rightSpace))
-                imageMetaInfo["leftMargin"] = str(leftSpace)
-                imageMetaInfo["rightMargin"] = str(rightSpace)
-                imageMetaInfo["betweenMargins"] = str(selectedBetweenSpace)
-                imageMetaInfo["numberOfLabels"] = str(len(_img_array))
+            imageMetaInfo = dict()
+            imageMetaInfo["fullImageSize"] = str(finalImage.shape)
+            imageMetaInfo["leftMargin"] = str(leftSpace)
+            imageMetaInfo["rightMargin"] = str(rightSpace)
+            imageMetaInfo["betweenMargins"] = str(betweenMargins)
+            imageMetaInfo["numberOfLabels"] = str(len(_img_array))
 
-                logger.debug("finalImage FINALLY = {}".format(str(finalImage.shape)))
-                logger.info("FINAL PROCESSED IMAGE METAINFO :\n{}".format(json.dumps(imageMetaInfo, indent=2)))
+            logger.debug("finalImage FINALLY = %s", finalImage.shape)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("FINAL PROCESSED IMAGE METAINFO :\n%s", json.dumps(imageMetaInfo, indent=2))
 
             return finalImage, imageMetaInfo
 
         except Exception as e:
             raise e
-
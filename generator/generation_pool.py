@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from utils.custom_logging import Logging
+from generator.digit_sequence_generator import DigitSequenceGenerator, configured_dataset_files
+from generator.dataset_registry import DatasetRegistry
+from generator.shared_dataset import SharedDataset, publish_dataset
+from generator.png_writer import encode_png
+from utils import profiling
+
+logger = Logging(__name__).get_logger()
+
+
+class PoolOverloaded(Exception):
+    """
+    Raised when max_pending requests are already admitted, served as 503
+    """
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when a request is not generated within the timeout, served as 504
+    """
+
+
+def render_images(arguments, save=False, png_compression=6, encode=True, config=None):
+    """
+    Generate the images of one API request, eg: inside a pool worker
+    :param arguments: dict of request arguments (digits, minSpacingRange, maxSpacingRange, imageWidth, seed)
+    :param save: also write the images to the output directory
+    :param encode: PNG encode every image, so the front end only copies bytes
+    :param config: Settings of the request, so a worker started before a reload renders with the request's settings
+    :return: list of (variant, float32 image, image info, png bytes or None) in mdsg_mode order
+    """
+    generator = DigitSequenceGenerator(arguments, config)
+    generator.generate_numbers_sequence()
+    images = generator.output_images()
+
+    if save:
+        img_file_name = generator.image_downloader()
+        if not img_file_name or generator.wait_for_writes():
+            raise (Exception("Unable to save images, check logs"))
+        for (_, _, image_info), filename in zip(images, img_file_name):
+            image_info["filename"] = filename
+
+    return [(variant, image_array, image_info, encode_png(image_array, png_compression) if encode else None)
+            for variant, image_array, image_info in images]
+
+
+def local_bank_stats():
+    """
+    Augmentation bank stats of this process, empty when no bank was ever built (the augmentor is not imported)
+    """
+    module = sys.modules.get("augmentor.augmentation_bank")
+    return module.bank_stats() if module is not None else dict()
+
+
+def _run_reported(func, args):
+    """
+    Worker side of GenerationPool.run : the result plus the worker's counters for the front end
+    (augmentation bank stats, stage timings since its previous result)
+    """
+    result = func(*args)
+    return result, {"pid": os.getpid(), "banks": local_bank_stats(),
+                    "stages": profiling.take() if profiling.is_enabled() else dict()}
+
+
+def _init_worker(descriptor=None):
+    # stage timings forked from the front end are already counted there #
+    profiling.reset()
+    # every worker loads the dataset once, before its first request, or attaches the published one #
+    if descriptor is not None:
+        SharedDataset.attach(descriptor)
+    DigitSequenceGenerator.preload_dataset()
+
+
+class GenerationPool(object):
+    """
+    Process pool running generation off the request threads of the API.
+    Admission is bounded : at most max_pending requests are queued or running, the next one is refused at once
+    with PoolOverloaded instead of waiting. A request not done within timeout raises PoolTimeout
+    (a task still queued is cancelled, a running one finishes in its worker and keeps its slot until then).
+    shutdown() stops admission, waits for admitted requests up to drain_timeout and stops the workers.
+    With shared_dataset the dataset is loaded once here into shared memory and the workers attach it.
+    reload() starts new workers on the current IDX files, the old ones finish their admitted requests and exit.
+    Every result comes back with its worker's counters : augmentation bank stats, kept per worker, and the stage
+    timings, merged into the stages of this process so /metrics covers the generation stages.
+    """
+    def __init__(self, workers=0, max_pending=64, timeout=30., drain_timeout=30., shared_dataset=False):
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.drain_timeout = drain_timeout
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._pending_lock = threading.Condition()
+        self._closed = False
+        self._reports = dict()
+        self._reports_lock = threading.Lock()
+        self.shared_dataset = shared_dataset
+        self._executor_lock = threading.Lock()
+        self._shared = publish_dataset() if shared_dataset else None
+        self._executor = self._start_workers(self._shared)
+        logger.info("Generation pool started : {} workers, {} pending requests max, timeout {}s".format(
+            self.workers, max_pending, timeout))
+
+    def _start_workers(self, shared):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(shared and shared.descriptor,))
+
+    def reload(self):
+        """
+        Reload hook : re-read the configured dataset (and republish it with shared_dataset) into a new set of workers.
+        Requests admitted before keep running on the old workers, which then exit.
+        :return: list of reloaded dataset keys
+        """
+        if self._closed:
+            raise PoolOverloaded("Generation pool is shutting down")
+        # workers are forked from this process, nothing stale may stay in its registry #
+        DatasetRegistry.instance().reload()
+        shared = publish_dataset() if self.shared_dataset else None
+        executor = self._start_workers(shared)
+        with self._executor_lock:
+            old_executor, old_shared = self._executor, self._shared
+            self._executor, self._shared = executor, shared
+        with self._reports_lock:
+            self._reports.clear()
+        old_executor.shutdown(wait=False)
+        if old_shared is not None:
+            # old workers keep their mapping until they exit #
+            old_shared.unlink()
+        logger.info("Generation pool reloaded : {} new workers".format(self.workers))
+        return [DatasetRegistry.key(*configured_dataset_files())]
+
+    def _release(self, _future):
+        self._slots.release()
+        with self._pending_lock:
+            self._pending -= 1
+            self._pending_lock.notify_all()
+
+    def run(self, func, *args):
+        """
+        Run func(*args) in a worker and wait for its result
+        :raise PoolOverloaded: when the pool is full or shutting down
+        :raise PoolTimeout: when the result is not ready within timeout
+        """
+        if self._closed or not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PoolOverloaded("Generation pool is {}".format("shutting down" if self._closed else "full"))
+
+        with self._pending_lock:
+            self._pending += 1
+        self.admitted += 1
+        try:
+            with self._executor_lock:
+                future = self._executor.submit(_run_reported, func, args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            result, report = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self.timed_out += 1
+            raise PoolTimeout("Generation not done within {}s".format(self.timeout))
+        profiling.merge(report.pop("stages"))
+        with self._reports_lock:
+            self._reports[report["pid"]] = report
+        return result
+
+    def bank_stats(self):
+        """
+        Augmentation bank stats summed over the workers, as of their last result
+        :return: dict dataset -> stats with the number of reporting workers
+        """
+        merged = dict()
+        with self._reports_lock:
+            reports = list(self._reports.values())
+        for report in reports:
+            for name, stats in report["banks"].items():
+                total = merged.setdefault(name, {"hits": 0, "misses": 0, "evictions": 0, "banked": 0,
+                                                 "capacity": 0, "bytes": 0, "workers": 0})
+                for field in ("hits", "misses", "evictions", "banked", "capacity", "bytes"):
+                    total[field] += stats[field]
+                total["workers"] += 1
+        for total in merged.values():
+            lookups = total["hits"] + total["misses"]
+            total["hitRate"] = total["hits"] / float(lookups) if lookups else 0.
+        return merged
+
+    def stats(self):
+        return {"workers": self.workers, "maxPending": self.max_pending, "pending": self._pending,
+                "admitted": self.admitted, "rejected": self.rejected, "timedOut": self.timed_out}
+
+    def shutdown(self):
+        """
+        Graceful shutdown : refuse new requests, drain the admitted ones, stop the workers
+        """
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + self.drain_timeout
+        with self._pending_lock:
+            while self._pending and time.monotonic() < deadline:
+                self._pending_lock.wait(deadline - time.monotonic())
+            abandoned = self._pending
+        if abandoned:
+            logger.error("Generation pool drain timeout, {} requests abandoned".format(abandoned))
+        with self._executor_lock:
+            executor = self._executor
+        executor.shutdown(wait=not abandoned, cancel_futures=True)
+        if self._shared is not None:
+            # workers still running keep their mapping, the block goes away with them #
+            self._shared.unlink()
+        logger.info("Generation pool stopped, stats = {}".format(self.stats()))
@@ -1,25 +1,168 @@
+import os
 import struct
 import numpy as np
-from array import array
 from utils.custom_logging import Logging
+from utils.profiling import timed
 
 logger = Logging(__name__).get_logger()
 
+IMAGE_FILE_MAGIC = 2051
+LABEL_FILE_MAGIC = 2049
+IMAGE_HEADER_SIZE = 16
+LABEL_HEADER_SIZE = 8
+
+
+def normalize_pixels(raw, out=None, dtype=np.float32):
+    """
+    Invert and normalize raw uint8 IDX pixels in one vectorized pass.
+    float32 : (255 - px) / 255.0, bit identical to the per-pixel python computation
+    uint8 : 255 - px
+    :param raw: uint8 array
+    :param out: optional preallocated output array, its dtype wins over dtype
+    :return: normalized array
+    """
+    if out is None:
+        out = np.empty(raw.shape, dtype=dtype)
+
+    if out.dtype == np.float32:
+        np.subtract(255, raw, out=out, dtype=np.float32)
+        np.divide(out, np.float32(255.0), out=out)
+    elif out.dtype == np.uint8:
+        np.subtract(255, raw, out=out)
+    else:
+        error = "Unsupported image dtype = {}, expected float32 or uint8".format(out.dtype)
+        logger.error(error)
+        raise (Exception(error))
+    return out
+
+
+def parse_idx_image_header(header, file_length):
+    """
+    Parse and validate an IDX3 image header against the total file length
+    :param header: first IMAGE_HEADER_SIZE bytes of the file
+    :param file_length: total length of the file in bytes
+    :return: (magic_num, size, rows, cols)
+    """
+    if len(header) < IMAGE_HEADER_SIZE:
+        error = "While reading image data, file too short for IDX header, length = {}".format(len(header))
+        logger.error(error)
+        raise (Exception(error))
+
+    magic_num, size, rows, cols = struct.unpack_from(">IIII", header, 0)
+    logger.info("imageFile -> magic_num = {}, size = {}, rows = {}, cols = {}".format(magic_num, size, rows, cols))
+    if magic_num != IMAGE_FILE_MAGIC:
+        error = "While reading image data, magic number not as expceted. Expected value = {}, value received = {}".format(
+            IMAGE_FILE_MAGIC, magic_num)
+        logger.error(error)
+        raise (Exception(error))
+
+    expected = size * rows * cols
+    received = file_length - IMAGE_HEADER_SIZE
+    if received != expected:
+        error = "While reading image data, payload length = {} does not match size * rows * cols = {}".format(
+            received, expected)
+        logger.error(error)
+        raise (Exception(error))
+    return magic_num, size, rows, cols
+
+
+def decode_idx_images(buffer, dtype=np.float32):
+    """
+    Decode an IDX3 image file buffer into an array of shape (size, rows, cols).
+    float32 pixels are normalized to [0, 1] with white background (1.0),
+    uint8 pixels are inverted raw intensities with white background (255).
+    :param buffer: bytes of the full IDX image file
+    :param dtype: np.float32 or np.uint8
+    :return: (magic_num, parsed_images)
+    """
+    magic_num, size, rows, cols = parse_idx_image_header(buffer[:IMAGE_HEADER_SIZE], len(buffer))
+    expected = size * rows * cols
+    payload = np.frombuffer(buffer, dtype=np.uint8, count=expected, offset=IMAGE_HEADER_SIZE)
+    parsed_images = np.empty((size, rows, cols), dtype=dtype)
+    normalize_pixels(payload.reshape(size, rows, cols), out=parsed_images)
+    return magic_num, parsed_images
+
+
+def decode_idx_labels(buffer):
+    """
+    Decode an IDX1 label file buffer into a uint8 array of shape (size,)
+    :param buffer: bytes of the full IDX label file
+    :return: (magic_num, parsed_labels)
+    """
+    if len(buffer) < LABEL_HEADER_SIZE:
+        error = "While reading image label data, file too short for IDX header, length = {}".format(len(buffer))
+        logger.error(error)
+        raise (Exception(error))
+
+    magic_num, size = struct.unpack_from(">II", buffer, 0)
+    logger.info("imageLabelFile -> magic_num = {}, size = {}".format(magic_num, size))
+    if magic_num != LABEL_FILE_MAGIC:
+        error = "While reading image label data, magic number not as expected. Excepted value = {}, value received = {}".format(
+            LABEL_FILE_MAGIC, magic_num)
+        logger.error(error)
+        raise (Exception(error))
+
+    received = len(buffer) - LABEL_HEADER_SIZE
+    if received != size:
+        error = "While reading image label data, payload length = {} does not match size = {}".format(received, size)
+        logger.error(error)
+        raise (Exception(error))
+
+    return magic_num, np.frombuffer(buffer, dtype=np.uint8, count=size, offset=LABEL_HEADER_SIZE)
+
+
+class LabelView(object):
+    """
+    Lazy, read-only view over the images of one label inside a memory-mapped IDX payload.
+    Indexing it like the (n, rows, cols) array it stands for normalizes only the selected rows.
+    """
+    def __init__(self, raw_images, indices, dtype=np.float32):
+        self._raw_images = raw_images
+        self.indices = indices
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return (self.indices.shape[0],) + self._raw_images.shape[1:]
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            raw_key = (self.indices[key[0]],) + key[1:]
+        else:
+            raw_key = self.indices[key]
+        return normalize_pixels(np.asarray(self._raw_images[raw_key]), dtype=self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        images = self[:]
+        return images if dtype is None else images.astype(dtype)
+
 
 class ImageDataReader(object):
     """
-    Read image data, normalize it and create a dict of label and images
+    Read image data, normalize it and create a dict of label and images.
+    backend = 'memory' decodes the whole file into one normalized array,
+    backend = 'mmap' maps the raw uint8 payload and returns lazy per-label views.
     """
-    def __init__(self, image_file, imageLabelFile):
+    def __init__(self, image_file, imageLabelFile, dtype=np.float32, backend='memory'):
         try:
             self.image_file = image_file
             self.imageLabelFile = imageLabelFile
+            self.dtype = dtype
+            if backend not in ('memory', 'mmap'):
+                raise (Exception("Unknown reader backend = {}, expected memory or mmap".format(backend)))
+            self.backend = backend
         except Exception as e:
             logger.error("Unable to create object for ImageDataReader class, exception : {}".format(str(e)))
             raise e
 
+    @timed("idx_read")
     def read_image(self):
         try:
+            if self.backend == 'mmap':
+                return self.__map_image()
             return self.__read_image()
         except Exception as e:
             logger.error("Unable to read image data, imageFile = {} & imageLabelFile = {} & exception : {}".format(
@@ -29,41 +172,60 @@ class ImageDataReader(object):
     def __read_image(self):
         try:
             with open(self.image_file, "rb") as f:
-                magic_num, size, rows, cols = struct.unpack(">IIII", f.read(16))
-                logger.info(
-                    "imageFile -> magic_num = {}, size = {}, rows = {}, cols = {}".format(magic_num, size, rows, cols))
-                if magic_num != 2051:
-                    error = "While reading image data, magic number not as expceted. Expected value = 2051, value received = {}".format(
-                        magic_num)
-                    logger.error(error)
-                    raise (Exception(error))
-                image = list(map(lambda px: (255 - px) / 255.0, array("B", f.read())))
-                parsed_images = np.asarray(image, dtype=np.float32).reshape(size, rows, cols)
+                _, parsed_images = decode_idx_images(f.read(), dtype=self.dtype)
             logger.info("Completed parsing imageFile, number of images read = {}".format(parsed_images.shape[0]))
 
-
-            with open(self.imageLabelFile, "rb") as f:
-                magic_num, size = struct.unpack(">II", f.read(8))
-                logger.info("imageLabelFile -> magic_num = {}, size = {}".format(magic_num, size))
-                if magic_num != 2049:
-                    error = "While reading image label data, magic number not as expected. Excepted value = 2049, value received = {}".format(
-                        magic_num)
-                    logger.error(error)
-                    raise (Exception(error))
-                parsed_labels = np.array(array("B", f.read())).reshape(size, 1)
-            logger.info("Completed parsing imageLabelFile, number of labels parsed = {}, unique lables = {}".format(
-            parsed_labels.shape[0], str(np.unique(parsed_labels))))
+            parsed_labels = self.__read_labels(parsed_images.shape[0])
 
             # Build the final dict #
             img_map = dict()
             for label in np.unique(parsed_labels):
                 img_map[str(label)] = parsed_images[np.where(label == parsed_labels)[0], :, :]
-            logger.info(
-                "For unique image labels as {}, the number of images found = {} totalling = {} images in the dict".format(
-                str(np.unique(parsed_labels)),
-                str([img_map[str(x)].shape[0] for x in np.unique(parsed_labels)]),
-                sum([img_map[str(x)].shape[0] for x in np.unique(parsed_labels)])))
+            self.__log_label_counts(img_map)
+            return img_map
+
+        except Exception as e:
+            raise e
+
+    def __map_image(self):
+        try:
+            with open(self.image_file, "rb") as f:
+                header = f.read(IMAGE_HEADER_SIZE)
+            _, size, rows, cols = parse_idx_image_header(header, os.path.getsize(self.image_file))
+            raw_images = np.memmap(self.image_file, dtype=np.uint8, mode='r', offset=IMAGE_HEADER_SIZE,
+                                   shape=(size, rows, cols))
+            logger.info("Completed mapping imageFile, number of images mapped = {}".format(size))
+
+            parsed_labels = self.__read_labels(size)
+
+            # Only row offsets are kept per label, pixels stay in the page cache until selected #
+            img_map = dict()
+            for label in np.unique(parsed_labels):
+                img_map[str(label)] = LabelView(raw_images, np.flatnonzero(parsed_labels == label), self.dtype)
+            self.__log_label_counts(img_map)
             return img_map
 
         except Exception as e:
             raise e
+
+    def __read_labels(self, image_count):
+        with open(self.imageLabelFile, "rb") as f:
+            _, parsed_labels = decode_idx_labels(f.read())
+        logger.info("Completed parsing imageLabelFile, number of labels parsed = {}, unique lables = {}".format(
+            parsed_labels.shape[0], str(np.unique(parsed_labels))))
+
+        if parsed_labels.shape[0] != image_count:
+            error = "Number of images = {} does not match number of labels = {}".format(
+                image_count, parsed_labels.shape[0])
+            logger.error(error)
+            raise (Exception(error))
+        return parsed_labels
+
+    @staticmethod
+    def __log_label_counts(img_map):
+        labels = sorted(img_map.keys())
+        logger.info(
+            "For unique image labels as {}, the number of images found = {} totalling = {} images in the dict".format(
+            str(labels),
+            str([img_map[x].shape[0] for x in labels]),
+            sum([img_map[x].shape[0] for x in labels])))
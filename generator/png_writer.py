@@ -0,0 +1,148 @@
+import zlib
+import queue
+import atexit
+import struct
+import threading
+import collections
+from concurrent.futures import Future, wait
+import numpy as np
+from utils.custom_logging import Logging
+from utils.profiling import timed
+from generator.compositor import to_uint8
+
+logger = Logging(__name__).get_logger()
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+@timed("encode")
+def encode_png(image, compression=6):
+    """
+    Encode a 2D image as a single channel 8-bit grayscale PNG
+    :param image: uint8 array, or float array in [0, 1] (0 = black, 1 = white)
+    :param compression: zlib level 0 (fastest) to 9 (smallest)
+    :return: PNG bytes
+    """
+    if image.ndim != 2:
+        raise (Exception("encode_png expects a 2D image, received shape = {}".format(image.shape)))
+    pixels = image if image.dtype == np.uint8 else to_uint8(image)
+    height, width = pixels.shape
+
+    # every scanline starts with filter type 0 (None) #
+    scanlines = np.zeros((height, width + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"".join((PNG_SIGNATURE,
+                     _chunk(b"IHDR", header),
+                     _chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression)),
+                     _chunk(b"IEND", b"")))
+
+
+def write_png(path, image, compression=6):
+    data = encode_png(image, compression)
+    with open(path, "wb") as fp:
+        fp.write(data)
+    return len(data)
+
+
+class AsyncImageWriter(object):
+    """
+    Background PNG writer : encoding and disk writes run on one worker thread fed by a bounded queue.
+    submit() only blocks when max_pending images are already waiting, which bounds memory.
+    Every submit() returns a Future of its own write, so a caller (eg: one API request) waits for its images only
+    and only sees its own failures. flush() waits for everything, eg: at shutdown.
+    """
+    # failures kept for flush(), the oldest are dropped when nobody flushes #
+    MAX_ERRORS = 1024
+
+    def __init__(self, max_pending=64, compression=6):
+        """
+        :param compression: zlib level of the writes submitted without one
+        """
+        self.compression = compression
+        self.errors = collections.deque(maxlen=self.MAX_ERRORS)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="mdsg-image-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, image, compression, future = item
+                future.set_result(write_png(path, image, compression))
+            except Exception as e:
+                logger.error("Unable to write image = {}, exception : {}".format(item[0], str(e)))
+                self.errors.append((item[0], str(e)))
+                item[3].set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, path, image, compression=None):
+        """
+        Queue one image
+        :param compression: zlib level, default the writer's
+        :return: Future of the write : bytes written, or the exception of a failed write
+        """
+        if not self._thread.is_alive():
+            raise (Exception("Image writer is closed"))
+        future = Future()
+        self._queue.put((path, image, self.compression if compression is None else compression, future))
+        return future
+
+    def flush(self):
+        """
+        Wait until every submitted image is on disk
+        :return: list of (path, error) failures since the last flush
+        """
+        self._queue.join()
+        errors = list()
+        while self.errors:
+            errors.append(self.errors.popleft())
+        return errors
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+_shared_writer = None
+_shared_writer_lock = threading.Lock()
+
+
+def shared_writer(compression=6, max_pending=64):
+    """
+    Process wide AsyncImageWriter, created on first use.
+    compression is only the default of the first caller, pass the level to submit() instead.
+    """
+    global _shared_writer
+    with _shared_writer_lock:
+        if _shared_writer is None:
+            _shared_writer = AsyncImageWriter(max_pending=max_pending, compression=compression)
+        return _shared_writer
+
+
+def flush_shared_writer():
+    """
+    Wait for pending background writes, no-op when nothing was written asynchronously
+    :return: list of (path, error) failures
+    """
+    return _shared_writer.flush() if _shared_writer is not None else list()
+
+
+def wait_writes(writes):
+    """
+    Wait for some submitted writes only
+    :param writes: list of (path, Future) from AsyncImageWriter.submit
+    :return: list of (path, error) failures among them
+    """
+    wait([future for _, future in writes])
+    return [(path, str(future.exception())) for path, future in writes if future.exception() is not None]
@@ -0,0 +1,149 @@
+import queue
+import threading
+import numpy as np
+from utils.custom_logging import Logging
+from generator.compositor import to_uint8
+from generator.dataset_builder import DatasetBuilder, minimum_widths, sample_sequences
+from generator.digit_sequence_generator import DigitSequenceGenerator
+
+logger = Logging(__name__).get_logger()
+
+# queue item closing the stream #
+_END = object()
+
+
+class SampleStream(object):
+    """
+    Lazy, unbounded stream of generated samples for training loops, nothing is written to disk.
+    A background thread generates batch_size samples at a time through the batch API into a queue of at most
+    prefetch batches : the producer blocks when the consumer falls behind (backpressure), so memory stays
+    constant however many samples are consumed.
+
+    Eg: for images, labels, meta in SampleStream(lengths=['3', '5'], width_range=(150, 200), seed=7): ...
+
+    batches=True yields (images, labels, meta) per batch : images (B, H, width_range[1]) padded white,
+    labels list of digit lists, meta dict of per image arrays (widths, leftMargin, rightMargin, betweenMargin).
+    batches=False yields (image, labels, meta) per sample with the image cropped to its own width.
+    """
+    def __init__(self, lengths=('3',), width_range=(150, 250), spacing_range=(3, 9), batch_size=256, prefetch=4,
+                 augment=False, seed=None, limit=None, batches=True, dtype=np.float32, image_file=None,
+                 label_file=None, cache_mode=None):
+        self.lengths, self.weights = DatasetBuilder._length_distribution(lengths)
+        self.width_range = tuple(width_range)
+        self.batch_size = batch_size
+        self.augment = augment
+        self.limit = limit
+        self.batches = batches
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.float32), np.dtype(np.uint8)):
+            raise (Exception("SampleStream dtype should be float32 or uint8, received = {}".format(self.dtype)))
+
+        self.generator = DigitSequenceGenerator({"digits": [], "minSpacingRange": spacing_range[0],
+                                                 "maxSpacingRange": spacing_range[1],
+                                                 "imageWidth": self.width_range[1], "imageFile": image_file,
+                                                 "labelFile": label_file, "cacheMode": cache_mode})
+        self._rng = np.random.default_rng(seed)
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._thread = None
+        self.produced = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _digit_shape(self):
+        return next(iter(self.generator.load_dataset().values())).shape[1:]
+
+    def _next_batch(self, count):
+        height, digit_width = self._digit_shape()
+        sequences, widths = sample_sequences(self._rng, count, self.lengths, self.weights, self.width_range,
+                                             digit_width, self.generator.spacing_range_min,
+                                             self.generator.spacing_mode)
+        images, batch_info = self.generator.generate_batch(sequences, augment=self.augment, image_widths=widths,
+                                                           rng=self._rng)
+        batch = np.full((count, height, self.width_range[1]), float(self.generator.white_pixel), dtype=np.float32)
+        batch[:, :, :images.shape[2]] = images
+        if self.dtype == np.uint8:
+            batch = to_uint8(batch)
+        meta = {"widths": widths, "leftMargin": batch_info["leftMargin"], "rightMargin": batch_info["rightMargin"],
+                "betweenMargin": batch_info["betweenMargin"]}
+        return batch, sequences, meta
+
+    def _put(self, item):
+        # blocks while the queue is full, wakes up regularly to notice close() #
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                count = self.batch_size if self.limit is None else min(self.batch_size, self.limit - self.produced)
+                if count <= 0:
+                    break
+                if not self._put(self._next_batch(count)):
+                    return
+                self.produced += count
+        except Exception as e:
+            logger.error("Sample stream producer failed, exception : {}".format(str(e)))
+            self._put(e)
+            return
+        self._put(_END)
+
+    def start(self):
+        if self._thread is None:
+            widest = minimum_widths(self.lengths, self._digit_shape()[1], self.generator.spacing_range_min,
+                                    self.generator.spacing_mode)
+            if int(widest.max()) > self.width_range[1]:
+                raise (Exception("Width range = {} can not fit digit lengths = {}, needs at least {} pixels".format(
+                    self.width_range, self.lengths, int(widest.max()))))
+            self._thread = threading.Thread(target=self._produce, name="mdsg-sample-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop the producer and drop the prefetched batches
+        """
+        self._stop.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self._thread is not None:
+            self._thread.join()
+
+    def __iter__(self):
+        self.start()
+        while True:
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                if self._thread.is_alive():
+                    continue
+                # the producer may have queued its last batch and _END right before exiting #
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            images, labels, meta = item
+            if self.batches:
+                yield images, labels, meta
+                continue
+            for row in range(images.shape[0]):
+                width = int(meta["widths"][row])
+                yield images[row, :, :width], labels[row], {key: int(values[row]) for key, values in meta.items()}
@@ -0,0 +1,164 @@
+import os
+import json
+import struct
+import numpy as np
+from utils.custom_logging import Logging
+from generator.image_data_reader import IMAGE_FILE_MAGIC
+
+logger = Logging(__name__).get_logger()
+
+SHARD_FORMATS = ('npy', 'idx')
+
+
+def _atomic_write(path, write):
+    """
+    Write through a temporary file and rename it into place, readers never see a partial file
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fp:
+        write(fp)
+    os.replace(tmp_path, path)
+
+
+def write_manifest(output_dir, shards):
+    """
+    Write manifest.json listing every finalized shard of a dataset
+    :param shards: list of shard records returned by ShardWriter
+    """
+    manifest = {
+        "shards": sorted(shards, key=lambda shard: shard["shard"]),
+        "count": sum(shard["count"] for shard in shards),
+    }
+    _atomic_write(os.path.join(output_dir, "manifest.json"),
+                  lambda fp: fp.write(json.dumps(manifest, indent=2).encode("utf-8")))
+    return manifest
+
+
+def read_shard(output_dir, shard):
+    """
+    Load a finalized shard back
+    :param shard: shard record from manifest.json
+    :return: (images, index) where index holds labels, labelOffsets and per image metadata arrays
+    """
+    images_file = os.path.join(output_dir, shard["images"])
+    if shard["format"] == "idx":
+        images = np.memmap(images_file, dtype=np.uint8, mode='r', offset=16,
+                           shape=(shard["count"], shard["height"], shard["width"]))
+    else:
+        images = np.load(images_file, mmap_mode='r')
+    with np.load(os.path.join(output_dir, shard["index"])) as index:
+        return images, dict(index)
+
+
+class ShardWriter(object):
+    """
+    Buffered writer appending uint8 images into fixed-size shards.
+    Every shard is one images file plus one compact index (.index.npz) with the flat labels, per image label offsets,
+    margins and widths. Both files are written to a temporary name and renamed, the index last,
+    so a shard is either complete or absent.
+    npy : <prefix>_00000.images.npy, rendered grey levels (white background = 255)
+    idx : <prefix>_00000.images.idx3-ubyte, MNIST convention (ink = 255) so ImageDataReader can read it back
+    """
+    def __init__(self, output_dir, image_shape, shard_size=10000, fmt='npy', prefix='shard', first_shard=0):
+        if fmt not in SHARD_FORMATS:
+            raise (Exception("Unknown shard format = {}, expected one of {}".format(fmt, SHARD_FORMATS)))
+        self.output_dir = output_dir
+        self.image_shape = tuple(image_shape)
+        self.shard_size = shard_size
+        self.fmt = fmt
+        self.prefix = prefix
+        self.shards = list()
+
+        self._next_shard = first_shard
+        self._images = np.empty((shard_size,) + self.image_shape, dtype=np.uint8)
+        self._count = 0
+        self._labels = list()
+        self._meta = {"lengths": list(), "leftMargin": list(), "rightMargin": list(), "betweenMargin": list(),
+                      "widths": list()}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a failed run keeps the shards already finalized but neither writes the partial one nor a manifest #
+        if exc_type is None:
+            self.close()
+        else:
+            logger.error("Shard writer aborted, {} buffered images dropped, no manifest written".format(self._count))
+        return False
+
+    def append(self, images, sequences, meta):
+        """
+        Buffer images, finalizing a shard every shard_size images
+        :param images: uint8 array of shape (n,) + image_shape
+        :param sequences: digit list of every image
+        :param meta: dict of per image arrays : leftMargin, rightMargin, betweenMargin, widths
+        """
+        start = 0
+        while start < images.shape[0]:
+            take = min(self.shard_size - self._count, images.shape[0] - start)
+            self._images[self._count:self._count + take] = images[start:start + take]
+            for sequence in sequences[start:start + take]:
+                self._labels.append(np.asarray(sequence, dtype=np.uint8))
+            self._meta["lengths"].append([len(sequence) for sequence in sequences[start:start + take]])
+            for key in ("leftMargin", "rightMargin", "betweenMargin", "widths"):
+                self._meta[key].append(np.asarray(meta[key][start:start + take]))
+            self._count += take
+            start += take
+            if self._count == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Finalize the buffered images as one shard
+        """
+        if self._count == 0:
+            return None
+
+        name = "{}_{:05d}".format(self.prefix, self._next_shard)
+        images = self._images[:self._count]
+        if self.fmt == "idx":
+            images_name = name + ".images.idx3-ubyte"
+
+            def write_images(fp):
+                fp.write(struct.pack(">IIII", IMAGE_FILE_MAGIC, self._count, *self.image_shape))
+                fp.write((255 - images).tobytes())
+        else:
+            images_name = name + ".images.npy"
+
+            def write_images(fp):
+                np.save(fp, images)
+
+        lengths = np.concatenate([np.asarray(chunk, dtype=np.int64) for chunk in self._meta["lengths"]])
+        index = {
+            "labels": np.concatenate(self._labels),
+            "labelOffsets": np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        }
+        for key in ("leftMargin", "rightMargin", "betweenMargin", "widths"):
+            index[key] = np.concatenate(self._meta[key]).astype(np.int32)
+
+        _atomic_write(os.path.join(self.output_dir, images_name), write_images)
+        _atomic_write(os.path.join(self.output_dir, name + ".index.npz"), lambda fp: np.savez(fp, **index))
+
+        record = {"shard": self._next_shard, "images": images_name, "index": name + ".index.npz",
+                  "format": self.fmt, "count": self._count, "height": self.image_shape[0],
+                  "width": self.image_shape[1]}
+        self.shards.append(record)
+        logger.info("Shard finalized : {} images to {}".format(self._count, images_name))
+
+        self._next_shard += 1
+        self._count = 0
+        self._labels = list()
+        self._meta = {key: list() for key in self._meta}
+        return record
+
+    def close(self, manifest=True):
+        """
+        Finalize the last partial shard and optionally write manifest.json
+        :return: list of shard records written by this writer
+        """
+        self.flush()
+        if manifest:
+            write_manifest(self.output_dir, self.shards)
+        return self.shards
@@ -0,0 +1,123 @@
+import os
+import sys
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from utils.custom_logging import Logging
+from generator.dataset_registry import DatasetRegistry
+from generator.digit_sequence_generator import DigitSequenceGenerator
+
+logger = Logging(__name__).get_logger()
+
+_attach_lock = threading.Lock()
+# attached blocks stay open for the life of the process, the registered arrays are views on them #
+_attached = dict()
+
+
+def _open_block(name):
+    """
+    Attach an existing block without registering it with this process' resource tracker :
+    only the publisher owns (and unlinks) the block, an attaching process exiting must not remove it
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def _label_views(block, descriptor):
+    dtype = np.dtype(descriptor["dtype"])
+    image_shape = tuple(descriptor["image_shape"])
+    total = sum(count for _, count in descriptor["labels"].values())
+    images = np.ndarray((total,) + image_shape, dtype=dtype, buffer=block.buf)
+    images.flags.writeable = False
+    return {label: images[offset:offset + count] for label, (offset, count) in descriptor["labels"].items()}
+
+
+class SharedDataset(object):
+    """
+    Label grouped images in one multiprocessing.shared_memory block, published once by a parent process and
+    attached zero-copy by its workers : memory does not grow with the number of workers
+    and attaching only maps the block.
+    The descriptor is a small JSON-able dict : block name, dtype, image shape, (row offset, count) per label
+    and the IDX files the data came from.
+    """
+    def __init__(self, block, descriptor, owner):
+        self.block = block
+        self.descriptor = descriptor
+        self.owner = owner
+        self.img_map = _label_views(block, descriptor)
+
+    @classmethod
+    def publish(cls, img_map, image_file, image_label_file):
+        """
+        Copy a label map into a new shared memory block
+        :return: owning SharedDataset, unlink() it when the workers are done
+        """
+        labels = sorted(img_map.keys(), key=int)
+        first = np.asarray(img_map[labels[0]][:1])
+        counts = [int(img_map[label].shape[0]) for label in labels]
+        image_shape = first.shape[1:]
+        nbytes = sum(counts) * int(np.prod(image_shape)) * first.dtype.itemsize
+
+        block = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        descriptor = {"name": block.name, "dtype": first.dtype.str, "image_shape": list(image_shape),
+                      "labels": dict(), "image_file": os.path.realpath(image_file),
+                      "label_file": os.path.realpath(image_label_file)}
+        images = np.ndarray((sum(counts),) + image_shape, dtype=first.dtype, buffer=block.buf)
+        offset = 0
+        for label, count in zip(labels, counts):
+            images[offset:offset + count] = np.asarray(img_map[label])
+            descriptor["labels"][label] = [offset, count]
+            offset += count
+        del images
+        logger.info("Dataset published to shared memory block {} ({} bytes)".format(block.name, nbytes))
+        return cls(block, descriptor, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """
+        Map a published dataset and install it in this process' DatasetRegistry, repeated calls are free
+        :return: SharedDataset
+        """
+        with _attach_lock:
+            shared = _attached.get(descriptor["name"])
+        if shared is None:
+            shared = cls(_open_block(descriptor["name"]), descriptor, owner=False)
+            with _attach_lock:
+                _attached[descriptor["name"]] = shared
+        DatasetRegistry.instance().register(descriptor["image_file"], descriptor["label_file"], shared.img_map)
+        return shared
+
+    def unlink(self):
+        """
+        Release the block, by the publisher once every worker is done
+        """
+        self.img_map = None
+        if self.owner:
+            self.block.unlink()
+            logger.info("Shared memory block {} released".format(self.descriptor["name"]))
+        try:
+            self.block.close()
+        except BufferError:
+            # arrays still reference the block, it is unmapped when they are collected #
+            pass
+
+
+def publish_dataset(generator_args=None):
+    """
+    Load the dataset of generator_args (default the configured IDX files) and publish it for pool workers.
+    The registry of this process is switched to the shared views too, so the loaded copy can be freed.
+    :return: owning SharedDataset
+    """
+    cmd_args = {"digits": [], "minSpacingRange": 0, "maxSpacingRange": 0, "imageWidth": 0}
+    cmd_args.update(generator_args or dict())
+    generator = DigitSequenceGenerator(cmd_args)
+    shared = SharedDataset.publish(generator.load_dataset(), generator.image_file, generator.image_label_file)
+    DatasetRegistry.instance().register(generator.image_file, generator.image_label_file, shared.img_map)
+    return shared
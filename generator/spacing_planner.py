@@ -0,0 +1,79 @@
+import re
+import numpy as np
+
+EQUALIZED_MODE = re.compile("^(EQUALIZED){1}_{1}(MAX|MIN)$")
+
+
+def is_equalized(spacing_mode):
+    """
+    EQUALIZED_MAX and EQUALIZED_MIN use one gap for the whole image, every other mode is PROGRESSIVE
+    """
+    return EQUALIZED_MODE.search(spacing_mode) is not None
+
+
+def plan_spacing(image_width, digits_width, n_digits, spacing_range_min, spacing_range_max, spacing_mode):
+    """
+    Gaps and margins of one image in O(1), same layout as searching every gap of the spacing range :
+    EQUALIZED_MAX : widest gap of the range that fits, EQUALIZED_MIN : the smallest gap,
+    PROGRESSIVE : gaps min, min + 1, ... (the range needs at least n_digits - 1 values).
+    Whatever is left is split into the margins, the right one taking the odd pixel.
+    :param digits_width: summed width of the digit images
+    :return: (leftSpace, rightSpace, int64 array of the n_digits - 1 gaps)
+    """
+    gaps = n_digits - 1
+    free_width = image_width - digits_width
+    if gaps < 0:
+        raise (Exception("At least one digit is needed to plan the spacing"))
+
+    if is_equalized(spacing_mode):
+        if spacing_range_max < spacing_range_min or free_width - gaps * spacing_range_min < 0:
+            raise (Exception("For spacing_mode = {}, with min spacing_range = {} and max spacing range = {}, "
+                             "image_width = {} and totalWidthOfAllImages = {}, fitting is not possible.".format(
+                                 spacing_mode, spacing_range_min, spacing_range_max, image_width, digits_width)))
+        betweenSpace = spacing_range_min
+        if spacing_mode == "EQUALIZED_MAX" and gaps > 0:
+            betweenSpace = min(spacing_range_max, free_width // gaps)
+        betweenSpaces = np.full(gaps, betweenSpace, dtype=np.int64)
+    else:
+        if gaps > max(spacing_range_max - spacing_range_min + 1, 0):
+            raise (Exception("For spacing_mode = {}, spacing range = {} to {} has fewer values than gaps between {} "
+                             "digits".format(spacing_mode, spacing_range_min, spacing_range_max, n_digits)))
+        betweenSpaces = np.arange(spacing_range_min, spacing_range_min + gaps, dtype=np.int64)
+        if free_width - int(betweenSpaces.sum()) < 0:
+            raise (Exception("For spacing_mode = {}, with min spacing_range = {} and max spacing range = {}, "
+                             "image_width = {} and totalWidthOfAllImages = {}, selectedBetweenSpace = {} fitting is "
+                             "not possible.".format(spacing_mode, spacing_range_min, spacing_range_max, image_width,
+                                                    digits_width, str(betweenSpaces))))
+
+    rightEndWhiteSpaceLeft = free_width - int(betweenSpaces.sum())
+    leftSpace = rightEndWhiteSpaceLeft // 2
+    return leftSpace, rightEndWhiteSpaceLeft - leftSpace, betweenSpaces
+
+
+def plan_spacing_bulk(image_widths, digits_widths, n_digits, spacing_range_min, spacing_range_max, spacing_mode):
+    """
+    plan_spacing for a whole batch of rows with array ops, spacing ranges can be scalars or per row arrays
+    :return: (leftSpace, rightSpace, betweenSpace, fits) int64 arrays and a bool array.
+             betweenSpace is the gap of EQUALIZED rows and the first gap of PROGRESSIVE rows.
+             Rows that do not fit have fits = False and meaningless margins.
+    """
+    image_widths = np.asarray(image_widths, dtype=np.int64)
+    gaps = np.asarray(n_digits, dtype=np.int64) - 1
+    free_width = image_widths - np.asarray(digits_widths, dtype=np.int64)
+    smin = np.broadcast_to(np.asarray(spacing_range_min, dtype=np.int64), gaps.shape)
+    smax = np.broadcast_to(np.asarray(spacing_range_max, dtype=np.int64), gaps.shape)
+
+    betweenSpace = smin.copy()
+    if is_equalized(spacing_mode):
+        if spacing_mode == "EQUALIZED_MAX":
+            widest = free_width // np.maximum(gaps, 1)
+            betweenSpace = np.where(gaps > 0, np.minimum(smax, widest), betweenSpace)
+        rightEndWhiteSpaceLeft = free_width - gaps * betweenSpace
+        fits = (smax >= smin) & (free_width - gaps * smin >= 0)
+    else:
+        rightEndWhiteSpaceLeft = free_width - (gaps * smin + gaps * (gaps - 1) // 2)
+        fits = gaps <= np.maximum(smax - smin + 1, 0)
+    fits &= (gaps >= 0) & (rightEndWhiteSpaceLeft >= 0)
+
+    leftSpace = rightEndWhiteSpaceLeft // 2
+    return leftSpace, rightEndWhiteSpaceLeft - leftSpace, betweenSpace, fits
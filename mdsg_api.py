@@ -1,17 +1,169 @@
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request
+import os
+import sys
+import json
+import base64
+import signal
+
+from flask import Flask, request, Response
 from flask_restful import Resource, Api, output_json
 
 from utils.command_parser import CommandParser, logger
-from generator.digit_sequence_generator import DigitSequenceGenerator
+from utils.settings import settings, reload_settings
+from generator.digit_sequence_generator import DigitSequenceGenerator, configured_dataset_files
+from generator.dataset_registry import DatasetRegistry
+from generator.dataset_cache import source_fingerprint
+from generator.compositor import to_uint8
+from generator.png_writer import flush_shared_writer
+from generator.generation_pool import GenerationPool, PoolOverloaded, PoolTimeout, render_images, local_bank_stats
+from utils.response_cache import ResponseCache, request_key
+from generator.batch_render import BATCH_FORMATS, IMAGE_FORMATS, validate_specs, render_batch, pack_stream, pack_zip
 from utils.custom_logging import message
+from utils import profiling
 
 app = Flask(__name__)
 api = Api(app)
 
+RESPONSE_CACHE = None
+_cache_config = settings().response_cache
+if _cache_config.enabled:
+    RESPONSE_CACHE = ResponseCache(
+        max_bytes=_cache_config.max_size_mb << 20,
+        spill_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), _cache_config.spill_dir)
+        if _cache_config.spill_dir else None,
+        spill_max_bytes=_cache_config.spill_max_size_mb << 20)
+
+# generation pool of the 'pool' serving mode, None => generation runs on the request thread #
+_pool = None
+
+
+def start_serving(mode=None, **pool_args):
+    """
+    Prepare the process for serving : 'inline' preloads the dataset here, 'pool' starts the generation pool
+    whose workers preload it
+    :param mode: inline or pool, default servingMode of the API section
+    :param pool_args: GenerationPool arguments, default from the API section
+    """
+    global _pool
+    config = settings()
+    mode = mode or config.api.serving_mode
+    if config.profiling.enabled:
+        profiling.enable()
+    if mode == 'inline':
+        DigitSequenceGenerator.preload_dataset()
+    elif mode == 'pool':
+        arguments = {
+            "workers": config.api.workers,
+            "max_pending": config.api.max_pending,
+            "timeout": config.api.request_timeout,
+            "drain_timeout": config.api.drain_timeout,
+            "shared_dataset": config.generator.shared_dataset,
+        }
+        arguments.update(pool_args)
+        _pool = GenerationPool(**arguments)
+    else:
+        raise (Exception("Unknown servingMode = {}, expected inline or pool".format(mode)))
+    return _pool
+
+
+def stop_serving():
+    """
+    Graceful shutdown : drain the generation pool, flush pending image writes
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    flush_shared_writer()
+
+
+def reload_config():
+    """
+    Reload signal (SIGHUP) : re-read config.cfg, requests started afterwards use the new settings.
+    Every request sends its settings to the pool worker rendering it, so cached responses always match their key.
+    The pool workers are also replaced (they load the dataset of the new settings) and the response cache is cleared.
+    The response cache size and the logging setup keep the settings they started with.
+    An invalid file is logged and the current settings stay in place.
+    """
+    try:
+        reload_settings()
+        logger.info('Settings reloaded from config file')
+    except Exception as e:
+        logger.error('Settings reload failed, current settings kept : Exception : {}'.format(e))
+        return
+    if RESPONSE_CACHE is not None:
+        RESPONSE_CACHE.clear()
+    try:
+        if _pool is not None:
+            _pool.reload()
+    except Exception as e:
+        logger.error('Generation pool reload failed : Exception : {}'.format(e))
+
+
+def image_headers(image_array, image_info, variant):
+    return {
+        "X-MDSG-Variant": variant,
+        "X-MDSG-Metadata": json.dumps(image_info),
+        "X-Image-Shape": ",".join(str(x) for x in image_array.shape),
+    }
+
+
+def response_cache_key(arguments, config=None):
+    """
+    Canonical key of a seeded request : its arguments, the generator and augmentation config and the size, mtime and
+    sha256 of the IDX files, so keys and ETags change with the files, across restarts and in every serving mode
+    :param config: Settings the request is rendered with, default settings()
+    """
+    config = config or settings()
+    image_file, label_file = configured_dataset_files(config)
+    return request_key({
+        "digits": arguments.digits,
+        "minSpacingRange": arguments.minSpacingRange,
+        "maxSpacingRange": arguments.maxSpacingRange,
+        "imageWidth": arguments.imageWidth,
+        "format": arguments.format,
+        "variant": arguments.variant,
+        "seed": arguments.seed,
+        "generator": config.generator._asdict(),
+        "augmentation": config.augmentation._asdict(),
+        "dataset": [source_fingerprint(image_file), source_fingerprint(label_file)],
+    })
+
+
+def build_response(arguments, images):
+    """
+    Response of a GET /mdsg request from its rendered images
+    :param images: output of render_images
+    :return: flask Response, or (error dict, status) for flask_restful
+    """
+    if arguments.format == 'json':
+        outputData = [{"variant": variant,
+                       "metadata": image_info,
+                       "png_base64": base64.b64encode(png).decode("ascii")}
+                      for variant, image_array, image_info, png in images]
+        logger.info('Execution successful : Output : %s', [x["metadata"] for x in outputData])
+        response = output_json({"images": outputData}, 200)
+        response.mimetype = "application/json"
+        return response
+
+    variant, image_array, image_info, png = images[0]
+    if arguments.variant is not None:
+        selected = [image for image in images if image[0] == arguments.variant]
+        if not selected:
+            return {"error": "variant = {} not generated in this mdsg_mode".format(arguments.variant)}, 400
+        variant, image_array, image_info, png = selected[0]
+
+    logger.info('Execution successful : Output : %s', image_info)
+    headers = image_headers(image_array, image_info, variant)
+    if arguments.format == 'raw':
+        headers["X-Image-Dtype"] = "uint8"
+        return Response(to_uint8(image_array).tobytes(), mimetype="application/octet-stream", headers=headers)
+    return Response(png, mimetype="image/png", headers=headers)
+
 
 class MDSG(Resource):
+    @profiling.timed("request")
     def get(self):
 
         """
@@ -26,37 +178,164 @@ class MDSG(Resource):
         command_parser = CommandParser()
         go, arguments = command_parser.api_argument_parser()
 
-        if go:
-            try:
-                """
-                Start the sequence generator
-                """
-                generator = DigitSequenceGenerator(arguments)
-                generator.generate_numbers_sequence()
-
-                """
-                Save the generated image sequence
-                """
-                img_file_name = generator.image_downloader()
-
-                if len(img_file_name):
-                    # generator.log_info(img_file_name)
-                    outputData = generator.image_info
-                    outputData["filename"] = img_file_name[0]
-                    logger.info('Execution successful : Output : {}'.format(outputData))
-                    return('Execution successful : Output : {}'.format(outputData))
-
-                else:
-                    logger.error('Execution fail')
-                    return('Execution fail : check logs')
-            except Exception as e:
-                logger.error('Failed to execute program : Exception : {}'.format(e))
-                return("Failed to execute program : Exception : {}".format(e))
-                exit(1)
+        if not go:
+            return {"error": arguments}, 400
+
+        config = settings()
+        save = config.api.save_to_disk if arguments.save is None else bool(arguments.save)
+
+        """
+        Seeded requests are pure : answer them from the response cache when possible
+        """
+        cache_key = None
+        if RESPONSE_CACHE is not None and arguments.seed is not None and not save:
+            cache_key = response_cache_key(arguments, config)
+            etag = RESPONSE_CACHE.etag(cache_key)
+            if request.if_none_match.contains(etag):
+                RESPONSE_CACHE.note_not_modified()
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            cached = RESPONSE_CACHE.get(cache_key)
+            if cached is not None:
+                logger.info('Execution successful : served from response cache')
+                response = Response(cached.body, mimetype=cached.mimetype, headers=cached.headers)
+                response.set_etag(etag)
+                return response
+
+        try:
+            """
+            Start the sequence generator, on the request thread or in the generation pool
+            """
+            encode = arguments.format != 'raw'
+            if _pool is None:
+                images = render_images(dict(arguments), save, config.generator.png_compression, encode, config)
+            else:
+                # the workers render with this request's settings, the ones its cache key was computed from #
+                images = _pool.run(render_images, dict(arguments), save, config.generator.png_compression, encode,
+                                   config)
+
+            response = build_response(arguments, images)
+            if cache_key is not None and isinstance(response, Response):
+                RESPONSE_CACHE.put(cache_key, response.get_data(), response.mimetype,
+                                   {name: value for name, value in response.headers.items() if name.startswith("X-")})
+                response.set_etag(RESPONSE_CACHE.etag(cache_key))
+            return response
+
+        except PoolOverloaded as e:
+            logger.error('Request refused : {}'.format(e))
+            return {"error": str(e)}, 503, {"Retry-After": "1"}
+        except PoolTimeout as e:
+            logger.error('Request timeout : {}'.format(e))
+            return {"error": str(e)}, 504
+        except Exception as e:
+            logger.error('Failed to execute program : Exception : {}'.format(e))
+            return {"error": "Failed to execute program : Exception : {}".format(e)}, 500
+
+
+class MDSGBatch(Resource):
+    @profiling.timed("batch_request")
+    def post(self):
+        """
+        Generate many sequences in one request.
+        Body : {"specs": [{"d": [4, 5, 8], "w": 100, "sr1": 3, "sr2": 9, "n": 1, "seed": 7}, ...],
+                "format": "stream" | "zip", "image": "png" | "raw", "augment": false}
+        stream : per image, >I metadata length + metadata JSON + >I image length + image bytes
+        zip : one file per image plus metadata.json
+        """
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return {"error": "expected a JSON object body with specs"}, 400
+        batch_format = body.get("format", "stream")
+        image_format = body.get("image", "png")
+        if batch_format not in BATCH_FORMATS or image_format not in IMAGE_FORMATS:
+            return {"error": "format should be one of {} and image one of {}".format(BATCH_FORMATS, IMAGE_FORMATS)}, 400
+        config = settings()
+        try:
+            specs = validate_specs(body.get("specs"), config.api.max_batch_images, config.api.max_batch_image_width,
+                                   config.api.max_batch_pixels, config.generator.spacing_mode)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        try:
+            augment = bool(body.get("augment", False))
+            if _pool is None:
+                records = render_batch(specs, augment, image_format, config.generator.png_compression, config)
+            else:
+                records = _pool.run(render_batch, specs, augment, image_format, config.generator.png_compression,
+                                    config)
+            logger.info('Batch execution successful : %d specs, %d images', len(specs), len(records))
+            headers = {"X-MDSG-Images": str(len(records))}
+            if batch_format == 'zip':
+                return Response(pack_zip(records, image_format), mimetype="application/zip", headers=headers)
+            return Response(pack_stream(records), mimetype="application/octet-stream", headers=headers)
+
+        except PoolOverloaded as e:
+            logger.error('Batch request refused : {}'.format(e))
+            return {"error": str(e)}, 503, {"Retry-After": "1"}
+        except PoolTimeout as e:
+            logger.error('Batch request timeout : {}'.format(e))
+            return {"error": str(e)}, 504
+        except Exception as e:
+            logger.error('Failed to execute batch : Exception : {}'.format(e))
+            return {"error": "Failed to execute batch : Exception : {}".format(e)}, 500
+
+
+class MDSGReload(Resource):
+    def post(self):
+        """
+        Reload hook : re-read every dataset loaded in this process, eg: after the IDX files changed.
+        In pool mode the workers are replaced by new ones loading the current files.
+        """
+        try:
+            reloaded = DatasetRegistry.instance().reload() if _pool is None else _pool.reload()
+            if RESPONSE_CACHE is not None:
+                RESPONSE_CACHE.clear()
+            logger.info('Dataset reload successful : {}'.format(reloaded))
+            return {"reloaded": [list(key) for key in reloaded]}
+        except Exception as e:
+            logger.error('Dataset reload failed : Exception : {}'.format(e))
+            return {"error": "Dataset reload failed : {}".format(e)}, 500
+
+
+class MDSGCache(Resource):
+    def get(self):
+        """
+        Response cache counters, with the augmentation bank counters (summed over the workers in pool mode)
+        """
+        banks = local_bank_stats() if _pool is None else _pool.bank_stats()
+        if RESPONSE_CACHE is None:
+            return {"enabled": False, "augmentationBank": banks}
+        return dict(RESPONSE_CACHE.stats(), enabled=True, augmentationBank=banks)
+
+    def delete(self):
+        if RESPONSE_CACHE is not None:
+            RESPONSE_CACHE.clear()
+        return {"cleared": RESPONSE_CACHE is not None}
+
+
+class MDSGMetrics(Resource):
+    def get(self):
+        """
+        Stage timings in Prometheus text format ([PROFILING] enabled = 1).
+        In pool mode the generation stages run in the workers, which return their timings with every result.
+        """
+        return Response(profiling.prometheus_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 api.add_resource(MDSG, '/mdsg')  # Route_1
+api.add_resource(MDSGBatch, '/mdsg/batch')
+api.add_resource(MDSGCache, '/mdsg/cache')
+api.add_resource(MDSGReload, '/mdsg/reload')
+api.add_resource(MDSGMetrics, '/metrics')
 
 if __name__ == '__main__':
-    app.run()
-    # http://127.0.0.1:5000/mdsg?d=4&d=5&d=8&sr1=3&sr2=9&w=100
\ No newline at end of file
+    # SIGTERM unwinds like Ctrl+C so stop_serving drains the in-flight requests #
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload_config())
+    start_serving()
+    try:
+        app.run(host=settings().api.host, port=settings().api.port, threaded=True)
+    finally:
+        stop_serving()
+    # http://127.0.0.1:5000/mdsg?d=4&d=5&d=8&sr1=3&sr2=9&w=100
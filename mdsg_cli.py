@@ -3,11 +3,37 @@ from utils.command_parser import CommandParser
 from utils.custom_logging import message
 from utils.custom_logging import Logging
 from generator.digit_sequence_generator import DigitSequenceGenerator
+from utils.profiling import ProfileDump, format_table
+import os
+import sys
 import json
 
 logger = Logging(__name__).get_logger()
 
+
+def generate_dataset(argv):
+    """
+    Dataset mode : Eg : python mdsg_cli.py generate-dataset -n 100000 -l 3 5 8 -w 300 400 -sr 3 9 --seed 7
+    """
+    from generator.dataset_builder import DatasetBuilder
+
+    try:
+        arguments = CommandParser().dataset_argument_parser(argv)
+        message('Dataset generation start')
+        shards = DatasetBuilder(arguments).run()
+        message('Dataset generation successful : {} images in {} shards under {}'.format(
+            sum(shard["count"] for shard in shards), len(shards), os.path.realpath(arguments["outputDir"])))
+    except Exception as e:
+        logger.error('Failed to generate dataset : Exception : {}'.format(e))
+        message("Failed to generate dataset : Exception : {}".format(e))
+        exit(1)
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "generate-dataset":
+        generate_dataset(sys.argv[2:])
+        exit(0)
+
     """
         Start of the program
         :args: cli : Eg : python mdsg_cli.py -d 3 5 0 -sr1 4 -sr2 8 -w 130
@@ -20,6 +46,13 @@ if __name__ == "__main__":
         command_parser = CommandParser()
         arguments = command_parser.cli_argument_parser()
 
+        """
+        Optional profiling of the run
+        """
+        profiler = None
+        if arguments["profile"] or arguments["profileDump"]:
+            profiler = ProfileDump(arguments["profileDump"]).start()
+
         """
         Logger start
         """
@@ -36,8 +69,10 @@ if __name__ == "__main__":
         Save the generated image sequence
         """
         img_file_name = generator.image_downloader()
+        if img_file_name and generator.wait_for_writes():
+            img_file_name = False
 
-        if len(img_file_name):
+        if img_file_name and len(img_file_name):
             # generator.log_info(img_file_name)
             outputData = generator.image_info
             outputData["filename"] = img_file_name[0]
@@ -47,6 +82,12 @@ if __name__ == "__main__":
         else:
             logger.error('Execution fail')
             message('Execution fail : check logs')
+
+        if profiler is not None:
+            profiler.stop()
+            message('Profile :\n{}'.format(format_table()))
+            if arguments["profileDump"]:
+                message('Profile reports written to {}'.format(os.path.realpath(arguments["profileDump"])))
     except Exception as e:
         logger.error('Failed to execute program : Exception : {}'.format(e))
         message("Failed to execute program : Exception : {}".format(e))
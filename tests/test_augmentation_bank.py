@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from augmentor.augmentation_bank import AugmentationBank
+
+
+def label_map():
+    # every pixel of a label's images is label / 10, so a sample shows which label it came from #
+    return {str(label): np.full((5, 28, 28), label / 10., dtype=np.float32) for label in range(10)}
+
+
+def identity(stack, rng):
+    return np.array(stack, dtype=np.float32)
+
+
+class AugmentationBankTest(unittest.TestCase):
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+
+    def _bank(self, img_map, max_bytes=4 * 2 * 28 * 28 * 4):
+        return AugmentationBank(img_map, variants=2, max_bytes=max_bytes, storage_dir=self.storage_dir,
+                                augmentor=identity)
+
+    def test_banks_on_one_directory_do_not_share_slots(self):
+        img_map = label_map()
+        first, second = self._bank(img_map), self._bank(img_map)
+        self.assertNotEqual(first.stats()["file"], second.stats()["file"])
+        rng = np.random.default_rng(0)
+        first.sample(["3"], [0], rng)
+        second.sample(["7"], [0], rng)
+        np.testing.assert_allclose(first.sample(["3"], [0], rng), 0.3)
+        np.testing.assert_allclose(second.sample(["7"], [0], rng), 0.7)
+        self.assertEqual(first.stats()["hits"], 1)
+        first.close()
+        second.close()
+
+    def test_reopened_after_close(self):
+        img_map = label_map()
+        bank = self._bank(img_map)
+        bank.sample(["1", "2"], [0, 1])
+        data_file = bank.stats()["file"]
+        bank.close()
+
+        reopened = self._bank(img_map)
+        self.assertEqual(reopened.stats()["file"], data_file)
+        self.assertEqual(reopened.stats()["banked"], 2)
+        np.testing.assert_allclose(reopened.sample(["2"], [1]), 0.2)
+        self.assertEqual(reopened.stats()["hits"], 1)
+        reopened.close()
+
+    def test_lock_of_exited_process_is_taken_over(self):
+        with open(os.path.join(self.storage_dir, "bank.0.lock"), "w") as fp:
+            # pid far above pid_max, never alive #
+            fp.write("999999999")
+        bank = self._bank(label_map())
+        self.assertTrue(bank.stats()["file"].endswith("bank.0.dat"))
+        bank.close()
+
+    def test_concurrent_misses_keep_labels(self):
+        bank = AugmentationBank(label_map(), variants=2, max_bytes=3 * 2 * 28 * 28 * 4, augmentor=identity)
+        errors = list()
+
+        def worker(seed):
+            rng = np.random.default_rng(seed)
+            for _ in range(50):
+                labels = rng.integers(0, 10, size=4)
+                out = bank.sample([str(label) for label in labels], rng.integers(0, 5, size=4), rng)
+                if not np.allclose(out[:, 0, 0], labels / 10.):
+                    errors.append(labels)
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(bank.stats()["banked"], bank.capacity)
+
+
+if __name__ == "__main__":
+    unittest.main()
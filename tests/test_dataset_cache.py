@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from generator.dataset_cache import DatasetCache
+
+
+class DatasetCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.image_file = os.path.join(self.work_dir, "images-idx3-ubyte")
+        self.label_file = os.path.join(self.work_dir, "labels-idx1-ubyte")
+        self._write(self.image_file, b"\x01" * 64)
+        self._write(self.label_file, b"\x02" * 16)
+        rng = np.random.default_rng(0)
+        self.img_map = {str(label): rng.random((3 + label, 28, 28), dtype=np.float32) for label in range(10)}
+        self.cache = DatasetCache(self.image_file, self.label_file, os.path.join(self.work_dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    @staticmethod
+    def _write(path, data, mtime_ns=None):
+        with open(path, "wb") as fp:
+            fp.write(data)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.load())
+        self.cache.store(self.img_map)
+        loaded = self.cache.load()
+        self.assertEqual(sorted(loaded), sorted(self.img_map))
+        for label, images in self.img_map.items():
+            self.assertIsInstance(loaded[label], np.memmap)
+            np.testing.assert_array_equal(loaded[label], images)
+        self.assertFalse(os.path.exists(self.cache.cache_path + ".lock"))
+
+    def test_touched_source_is_a_hit(self):
+        self.cache.store(self.img_map)
+        stat = os.stat(self.image_file)
+        self._write(self.image_file, b"\x01" * 64, mtime_ns=stat.st_mtime_ns + 10 ** 9)
+        self.assertTrue(self.cache.is_valid())
+        # the refreshed manifest now matches without hashing #
+        self.assertTrue(self.cache.is_valid())
+
+    def test_changed_content_is_a_miss(self):
+        self.cache.store(self.img_map)
+        stat = os.stat(self.image_file)
+        self._write(self.image_file, b"\x03" * 64, mtime_ns=stat.st_mtime_ns + 10 ** 9)
+        self.assertFalse(self.cache.is_valid())
+        self.assertIsNone(self.cache.load())
+
+    def test_changed_size_is_a_miss(self):
+        self.cache.store(self.img_map)
+        self._write(self.label_file, b"\x02" * 17)
+        self.assertFalse(self.cache.is_valid())
+
+    def test_same_size_and_mtime_needs_verify_hash(self):
+        self.cache.store(self.img_map)
+        stat = os.stat(self.image_file)
+        self._write(self.image_file, b"\x03" * 64, mtime_ns=stat.st_mtime_ns)
+        self.assertTrue(self.cache.is_valid())
+        verified = DatasetCache(self.image_file, self.label_file, os.path.join(self.work_dir, "cache"),
+                                verify_hash=True)
+        self.assertFalse(verified.is_valid())
+
+    def test_other_dtype_is_a_miss(self):
+        self.cache.store(self.img_map)
+        other = DatasetCache(self.image_file, self.label_file, os.path.join(self.work_dir, "cache"), dtype=np.uint8)
+        self.assertFalse(other.is_valid())
+
+    def test_store_skipped_while_locked(self):
+        os.makedirs(os.path.dirname(self.cache.cache_path), exist_ok=True)
+        with open(self.cache.cache_path + ".lock", "w") as fp:
+            fp.write("0")
+        self.cache.store(self.img_map)
+        self.assertIsNone(self.cache.load())
+
+
+if __name__ == "__main__":
+    unittest.main()
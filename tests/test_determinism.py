@@ -0,0 +1,76 @@
+"""
+Same seed, same images : the response cache and the dataset builder rely on it
+"""
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from utils.settings import settings
+from generator.digit_sequence_generator import DigitSequenceGenerator
+from generator.generation_pool import render_images
+from augmentor.augmentation import Augmentor
+from benchmarks.fixtures import make_idx_fixture
+
+
+class SeedDeterminismTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fixture_dir = tempfile.mkdtemp()
+        cls.image_file, cls.label_file = make_idx_fixture(cls.fixture_dir, 300)
+        # compare mode : the original and the augmented image #
+        cls.config = settings().override(augmentation={"mdsg_mode": 3})
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.fixture_dir, ignore_errors=True)
+
+    def _arguments(self, seed):
+        return {"digits": [3, 1, 4, 1, 5], "minSpacingRange": 2, "maxSpacingRange": 6, "imageWidth": 200,
+                "seed": seed, "imageFile": self.image_file, "labelFile": self.label_file}
+
+    def _sequence(self, seed):
+        generator = DigitSequenceGenerator(self._arguments(seed), self.config)
+        generator.generate_numbers_sequence()
+        return generator.output_images()
+
+    def test_cli_sequence(self):
+        first, second = self._sequence(7), self._sequence(7)
+        self.assertEqual([variant for variant, _, _ in first], ["org", "aug"])
+        for (_, image, info), (_, repeated, repeated_info) in zip(first, second):
+            np.testing.assert_array_equal(image, repeated)
+            self.assertEqual(info, repeated_info)
+        self.assertFalse(np.array_equal(first[1][1], self._sequence(8)[1][1]))
+
+    def test_api_render(self):
+        first = render_images(self._arguments(11), config=self.config)
+        second = render_images(self._arguments(11), config=self.config)
+        self.assertEqual([png for _, _, _, png in first], [png for _, _, _, png in second])
+
+    def test_generate_batch(self):
+        generator = DigitSequenceGenerator(self._arguments(None), self.config)
+        sequences = [[1, 2, 3], [9, 8], [0, 0, 7, 7]]
+
+        def batch(seed):
+            return generator.generate_batch(sequences, n=3, augment=True, image_widths=[120, 90, 150],
+                                            rng=np.random.default_rng(seed))
+
+        (images, info), (repeated, repeated_info) = batch(5), batch(5)
+        np.testing.assert_array_equal(images, repeated)
+        for key in ("leftMargin", "rightMargin", "betweenMargin"):
+            np.testing.assert_array_equal(info[key], repeated_info[key])
+        self.assertFalse(np.array_equal(images, batch(6)[0]))
+
+    def test_augmentation(self):
+        stack = np.random.default_rng(0).random((32, 28, 28), dtype=np.float32)
+        config = settings().override(augmentation={"warp": True, "blur": True, "random_noise": True,
+                                                   "warp_probability": 0.5, "random_noise_probability": 0.5})
+        first = Augmentor(stack, np.random.default_rng(3), config).execute()
+        second = Augmentor(stack, np.random.default_rng(3), config).execute()
+        np.testing.assert_array_equal(first, second)
+        self.assertFalse(np.array_equal(first, Augmentor(stack, np.random.default_rng(4), config).execute()))
+
+
+if __name__ == "__main__":
+    unittest.main()
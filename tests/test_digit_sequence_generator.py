@@ -0,0 +1,46 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from generator.digit_sequence_generator import DigitSequenceGenerator
+from benchmarks.fixtures import make_idx_fixture
+
+
+class GenerateBatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fixture_dir = tempfile.mkdtemp()
+        cls.image_file, cls.label_file = make_idx_fixture(cls.fixture_dir, 200)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.fixture_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.generator = DigitSequenceGenerator({"digits": [], "minSpacingRange": 2, "maxSpacingRange": 6,
+                                                 "imageWidth": 150, "seed": 1, "imageFile": self.image_file,
+                                                 "labelFile": self.label_file})
+
+    def test_batch_shape(self):
+        images, batch_info = self.generator.generate_batch([[1, 2, 3], [0, 9]], n=2)
+        self.assertEqual(images.shape, (4, 28, 150))
+        self.assertEqual(batch_info["leftMargin"].shape, (4,))
+
+    def test_out_of_range_digits_are_not_present(self):
+        for sequence in ([1, 12], [-1, 3], [10]):
+            with self.assertRaisesRegex(Exception, "not present in image data base"):
+                self.generator.generate_batch([sequence])
+
+    def test_missing_label_is_not_present(self):
+        img_map = dict(self.generator.load_dataset())
+        del img_map["7"]
+        self.generator.load_dataset = lambda: img_map
+        with self.assertRaisesRegex(Exception, r"digits = \[7\], not present"):
+            self.generator.generate_batch([[1, 7]])
+        self.assertEqual(np.asarray(self.generator.generate_batch([[1, 8]])[0]).shape[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
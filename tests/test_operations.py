@@ -0,0 +1,77 @@
+"""
+Batched augmentation ops against the per-image skimage / scipy calls they replaced
+"""
+import unittest
+
+import numpy as np
+
+import augmentor.operations as ops
+
+try:
+    from skimage.transform import rotate, warp, SimilarityTransform
+except ImportError:
+    rotate = None
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+
+def random_stack(count=16, rows=28, cols=28, seed=0):
+    return np.random.default_rng(seed).random((count, rows, cols), dtype=np.float32)
+
+
+@unittest.skipIf(rotate is None, "scikit-image is not installed")
+class AffineOpsTest(unittest.TestCase):
+    def test_rotate_matches_skimage(self):
+        stack = random_stack()
+        angles = np.linspace(-30, 30, stack.shape[0])
+        out = ops.affine_resample(stack, ops.rotation_matrices(angles, 28, 28))
+        for image, angle, rotated in zip(stack, angles, out):
+            expected = rotate(image=image.astype(np.float64), angle=angle, mode='wrap')
+            np.testing.assert_allclose(rotated, expected, atol=1e-5)
+
+    def test_rotate_non_square(self):
+        stack = random_stack(count=4, rows=20, cols=33)
+        angles = [-17., 5., 12.5, 29.]
+        out = ops.affine_resample(stack, ops.rotation_matrices(angles, 20, 33))
+        for image, angle, rotated in zip(stack, angles, out):
+            np.testing.assert_allclose(rotated, rotate(image=image.astype(np.float64), angle=angle, mode='wrap'),
+                                       atol=1e-5)
+
+    def test_warp_matches_skimage(self):
+        stack = random_stack()
+        for translation in ((0, 4), (3, -2), (1.5, 2.25)):
+            out = ops.affine_resample(stack, ops.translation_matrices([translation] * stack.shape[0]))
+            for image, shifted in zip(stack, out):
+                expected = warp(image.astype(np.float64), inverse_map=SimilarityTransform(translation=translation),
+                                clip=True, mode='wrap')
+                np.testing.assert_allclose(shifted, expected, atol=1e-5)
+
+    def test_warp_op_integer_translation_is_exact(self):
+        stack = random_stack()
+        out = ops.Warp(stack, translation_x=(0, 0), translation_y=(4, 4)).execute()
+        np.testing.assert_array_equal(out, np.roll(stack, -4, axis=1))
+
+
+class StackOpsTest(unittest.TestCase):
+    @unittest.skipIf(ndimage is None, "scipy is not installed")
+    def test_blur_matches_per_image_filter(self):
+        stack = random_stack()
+        out = ops.Blur(stack, size=3).execute()
+        for image, blurred in zip(stack, out):
+            np.testing.assert_array_equal(blurred, ndimage.uniform_filter(input=image, size=3))
+
+    def test_flips(self):
+        stack = random_stack()
+        np.testing.assert_array_equal(ops.HorizontalFlip(stack).execute(), stack[:, :, ::-1])
+        np.testing.assert_array_equal(ops.VerticalFlip(stack).execute(), stack[:, ::-1, ::-1])
+
+    def test_noise_is_clipped(self):
+        out = ops.RandomNoise(random_stack(), var=0.5, rng=np.random.default_rng(0)).execute()
+        self.assertGreaterEqual(out.min(), 0.)
+        self.assertLessEqual(out.max(), 1.)
+
+
+if __name__ == "__main__":
+    unittest.main()
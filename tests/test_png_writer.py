@@ -0,0 +1,121 @@
+import io
+import os
+import zlib
+import struct
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from generator import png_writer
+from generator.png_writer import PNG_SIGNATURE, AsyncImageWriter, encode_png, wait_writes
+
+
+def read_chunks(data):
+    """
+    :return: list of (chunk type, data) after checking every CRC
+    """
+    chunks = list()
+    position = len(PNG_SIGNATURE)
+    while position < len(data):
+        (size,) = struct.unpack_from(">I", data, position)
+        chunk_type = data[position + 4:position + 8]
+        chunk_data = data[position + 8:position + 8 + size]
+        (crc,) = struct.unpack_from(">I", data, position + 8 + size)
+        if crc != zlib.crc32(chunk_type + chunk_data):
+            raise (Exception("Bad CRC of chunk {}".format(chunk_type)))
+        chunks.append((chunk_type, chunk_data))
+        position += 12 + size
+    return chunks
+
+
+class EncodePngTest(unittest.TestCase):
+    def setUp(self):
+        self.image = np.random.default_rng(0).integers(0, 256, size=(28, 97), dtype=np.uint8)
+
+    def test_chunks_round_trip(self):
+        data = encode_png(self.image)
+        self.assertTrue(data.startswith(PNG_SIGNATURE))
+        chunks = read_chunks(data)
+        self.assertEqual([chunk_type for chunk_type, _ in chunks], [b"IHDR", b"IDAT", b"IEND"])
+        self.assertEqual(struct.unpack(">IIBBBBB", chunks[0][1]), (97, 28, 8, 0, 0, 0, 0))
+        scanlines = np.frombuffer(zlib.decompress(chunks[1][1]), dtype=np.uint8).reshape(28, 98)
+        self.assertFalse(scanlines[:, 0].any())
+        np.testing.assert_array_equal(scanlines[:, 1:], self.image)
+
+    def test_decoded_by_pillow(self):
+        for compression in (0, 6, 9):
+            decoded = Image.open(io.BytesIO(encode_png(self.image, compression)))
+            self.assertEqual(decoded.mode, "L")
+            np.testing.assert_array_equal(np.asarray(decoded), self.image)
+
+    def test_float_image_is_scaled(self):
+        image = np.array([[0., 0.5, 1.]], dtype=np.float32)
+        decoded = np.asarray(Image.open(io.BytesIO(encode_png(image))))
+        self.assertEqual(decoded[0, 0], 0)
+        self.assertEqual(decoded[0, 2], 255)
+
+    def test_rejects_stack(self):
+        with self.assertRaises(Exception):
+            encode_png(np.zeros((2, 28, 28), dtype=np.uint8))
+
+
+class AsyncImageWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.writer = AsyncImageWriter(max_pending=4, compression=9)
+        self.image = np.random.default_rng(0).integers(0, 256, size=(28, 60), dtype=np.uint8)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_submit_returns_its_write(self):
+        path = os.path.join(self.output_dir, "one.png")
+        size = self.writer.submit(path, self.image, compression=0).result(timeout=10)
+        self.assertEqual(size, os.path.getsize(path))
+        self.assertEqual(size, len(encode_png(self.image, 0)))
+        np.testing.assert_array_equal(np.asarray(Image.open(path)), self.image)
+
+    def test_default_compression(self):
+        path = os.path.join(self.output_dir, "default.png")
+        self.assertEqual(self.writer.submit(path, self.image).result(timeout=10), len(encode_png(self.image, 9)))
+
+    def test_failures_stay_with_their_submitter(self):
+        missing = os.path.join(self.output_dir, "missing", "bad.png")
+        failed = [(missing, self.writer.submit(missing, self.image))]
+        good_path = os.path.join(self.output_dir, "good.png")
+        good = [(good_path, self.writer.submit(good_path, self.image))]
+        self.assertEqual(wait_writes(good), [])
+        errors = wait_writes(failed)
+        self.assertEqual([path for path, _ in errors], [missing])
+        # flush still reports every failure, eg: at shutdown #
+        self.assertEqual([path for path, _ in self.writer.flush()], [missing])
+        self.assertEqual(self.writer.flush(), [])
+
+    def test_wait_ignores_later_writes(self):
+        release = threading.Event()
+        real_write = png_writer.write_png
+
+        def write_png(path, image, compression=6):
+            # a slow write of another request, submitted after ours #
+            if path.endswith("slow.png"):
+                release.wait(10)
+            return real_write(path, image, compression)
+
+        own_path, slow_path = os.path.join(self.output_dir, "own.png"), os.path.join(self.output_dir, "slow.png")
+        with mock.patch.object(png_writer, "write_png", write_png):
+            own = [(own_path, self.writer.submit(own_path, self.image))]
+            slow = self.writer.submit(slow_path, self.image)
+            self.assertEqual(wait_writes(own), [])
+            self.assertFalse(slow.done())
+            release.set()
+            slow.result(timeout=10)
+
+
+if __name__ == "__main__":
+    unittest.main()
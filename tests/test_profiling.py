@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+import unittest
+
+from utils import profiling
+from utils.settings import reload_settings, settings
+from generator.dataset_registry import DatasetRegistry
+from generator.generation_pool import GenerationPool, render_images
+from benchmarks.fixtures import make_idx_fixture, fixture_parser
+
+
+class StageMergeTest(unittest.TestCase):
+    def setUp(self):
+        profiling.reset()
+
+    def tearDown(self):
+        profiling.reset()
+
+    def test_take_returns_deltas(self):
+        profiling._stats("compose").add(0.002, 10)
+        taken = profiling.take()
+        self.assertEqual(taken["compose"]["count"], 1)
+        self.assertEqual(profiling.snapshot(), dict())
+        profiling._stats("compose").add(0.004)
+        self.assertEqual(profiling.take()["compose"]["sum"], 0.004)
+
+    def test_merge_adds_counters(self):
+        for seconds in (0.001, 0.003):
+            profiling._stats("encode").add(seconds, 5)
+        taken = profiling.take()
+        profiling._stats("encode").add(0.2)
+        profiling.merge(taken)
+        merged = profiling.snapshot()["encode"]
+        self.assertEqual(merged["count"], 3)
+        self.assertAlmostEqual(merged["sum"], 0.204)
+        self.assertEqual(merged["allocatedBytes"], 10)
+        self.assertEqual(sum(merged["buckets"]), 3)
+        self.assertEqual(merged["p50"], 0.003)
+
+
+class PoolStageMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.fixture_dir = tempfile.mkdtemp()
+        parser = fixture_parser(*make_idx_fixture(self.fixture_dir, 200))
+        parser.set('AUGMENTATION', 'mdsg_mode', '2')
+        reload_settings(parser)
+        profiling.reset()
+        profiling.enable()
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        profiling.disable()
+        profiling.reset()
+        reload_settings()
+        DatasetRegistry.instance().clear()
+        shutil.rmtree(self.fixture_dir, ignore_errors=True)
+
+    def test_worker_stages_reach_the_front_end(self):
+        # timed before the fork : must not come back from the worker a second time #
+        profiling._stats("request").add(0.01)
+        self.pool = GenerationPool(workers=1)
+        arguments = {"digits": [1, 2, 3], "minSpacingRange": 2, "maxSpacingRange": 6, "imageWidth": 120, "seed": 3}
+        for _ in range(2):
+            self.pool.run(render_images, arguments, False, 6, True, settings())
+        stages = profiling.snapshot()
+        for name in ("select", "augment", "compose", "encode"):
+            self.assertEqual(stages[name]["count"], 2, name)
+        self.assertEqual(stages["request"]["count"], 1)
+        self.assertNotIn("stages", self.pool._reports.popitem()[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.settings import reload_settings
+from generator.dataset_registry import DatasetRegistry
+from utils.response_cache import ResponseCache, request_key
+from benchmarks.fixtures import make_idx_fixture, fixture_parser
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_bytes=30)
+        for name in ("a", "b", "c"):
+            cache.put(name, name.encode("ascii") * 10, "image/png")
+        # touching a makes b the least recently used #
+        self.assertEqual(cache.get("a").body, b"a" * 10)
+        cache.put("d", b"d" * 10, "image/png")
+        self.assertIsNone(cache.get("b"))
+        for name in ("a", "c", "d"):
+            self.assertEqual(cache.get(name).body, name.encode("ascii") * 10)
+        stats = cache.stats()
+        self.assertEqual((stats["evictions"], stats["misses"], stats["bytes"]), (1, 1, 30))
+
+    def test_oversized_body_is_skipped(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.put("a", b"a" * 11, "image/png")
+        self.assertIsNone(cache.get("a"))
+
+    def test_spill_round_trip(self):
+        cache = ResponseCache(max_bytes=10, spill_dir=self.spill_dir)
+        first, second = request_key({"seed": 1}), request_key({"seed": 2})
+        cache.put(first, b"1" * 10, "application/json", {"X-Seed": "1"})
+        cache.put(second, b"2" * 10, "application/json")
+        self.assertEqual(os.listdir(self.spill_dir), [first + ".bin"])
+
+        entry = cache.get(first)
+        self.assertEqual((entry.body, entry.mimetype, entry.headers), (b"1" * 10, "application/json", {"X-Seed": "1"}))
+        self.assertEqual(cache.stats()["spillHits"], 1)
+        # promoted back to memory, second is spilled in turn #
+        self.assertEqual(os.listdir(self.spill_dir), [second + ".bin"])
+
+    def test_spill_dir_keeps_other_files(self):
+        other = os.path.join(self.spill_dir, "notes.txt")
+        stale = os.path.join(self.spill_dir, request_key({"seed": 3}) + ".bin")
+        for path in (other, stale):
+            with open(path, "w") as fp:
+                fp.write("x")
+        ResponseCache(max_bytes=10, spill_dir=self.spill_dir)
+        self.assertEqual(os.listdir(self.spill_dir), ["notes.txt"])
+
+    def test_key_and_etag(self):
+        key = request_key({"seed": 7, "digits": [1, 2], "format": "png"})
+        self.assertEqual(key, request_key({"format": "png", "digits": [1, 2], "seed": 7}))
+        self.assertNotEqual(key, request_key({"seed": 8, "digits": [1, 2], "format": "png"}))
+        self.assertEqual(ResponseCache.etag(key), key[:32])
+
+
+class ResponseCacheApiTest(unittest.TestCase):
+    QUERY = "/mdsg?d=4&d=5&d=8&sr1=3&sr2=9&w=100&seed=7&format=json"
+
+    @classmethod
+    def setUpClass(cls):
+        import mdsg_api
+        if mdsg_api.RESPONSE_CACHE is None:
+            raise (unittest.SkipTest("response cache disabled in config.cfg"))
+        cls.api = mdsg_api
+        cls.client = mdsg_api.app.test_client()
+        cls.fixture_dir = tempfile.mkdtemp()
+        reload_settings(fixture_parser(*make_idx_fixture(cls.fixture_dir, 200)))
+
+    @classmethod
+    def tearDownClass(cls):
+        reload_settings()
+        DatasetRegistry.instance().clear()
+        shutil.rmtree(cls.fixture_dir, ignore_errors=True)
+
+    def test_not_modified(self):
+        response = self.client.get(self.QUERY)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        repeated = self.client.get(self.QUERY)
+        self.assertEqual((repeated.headers["ETag"], repeated.data), (etag, response.data))
+        self.assertEqual(self.client.get(self.QUERY, headers={"If-None-Match": etag}).status_code, 304)
+
+    def test_etag_follows_dataset_files(self):
+        etag = self.client.get(self.QUERY).headers["ETag"]
+        changed = {"size": 0, "mtime_ns": 0, "sha256": "0" * 64}
+        with mock.patch.object(self.api, "source_fingerprint", return_value=changed):
+            response = self.client.get(self.QUERY, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class ReloadPoolTest(unittest.TestCase):
+    QUERY = "/mdsg?d=4&d=5&d=8&sr1=3&sr2=9&w=100&seed=5"
+
+    def setUp(self):
+        import mdsg_api
+        if mdsg_api.RESPONSE_CACHE is None:
+            raise (unittest.SkipTest("response cache disabled in config.cfg"))
+        self.api = mdsg_api
+        self.client = mdsg_api.app.test_client()
+        self.fixture_dir = tempfile.mkdtemp()
+        self.parser = fixture_parser(*make_idx_fixture(self.fixture_dir, 200))
+        self.parser.set('AUGMENTATION', 'mdsg_mode', '2')
+        reload_settings(self.parser)
+        mdsg_api.RESPONSE_CACHE.clear()
+
+    def tearDown(self):
+        self.api.stop_serving()
+        self.api.RESPONSE_CACHE.clear()
+        reload_settings()
+        DatasetRegistry.instance().clear()
+        shutil.rmtree(self.fixture_dir, ignore_errors=True)
+
+    def _no_rotation(self):
+        self.parser.set('AUGMENTATION', 'max_left_degree', '0')
+        self.parser.set('AUGMENTATION', 'max_right_degree', '0')
+
+    def test_workers_render_with_request_settings(self):
+        self.api.start_serving('pool', workers=1)
+        rotated = self.client.get(self.QUERY)
+        # settings swapped in this process only, the worker was forked with the old ones #
+        self._no_rotation()
+        reload_settings(self.parser)
+        pooled = self.client.get(self.QUERY)
+        self.api.stop_serving()
+        self.api.RESPONSE_CACHE.clear()
+        inline = self.client.get(self.QUERY)
+        self.assertNotEqual(rotated.data, pooled.data)
+        self.assertEqual((pooled.headers["ETag"], pooled.data), (inline.headers["ETag"], inline.data))
+
+    def test_reload_config_replaces_workers_and_clears_cache(self):
+        self.api.start_serving('pool', workers=1)
+        self.client.get(self.QUERY)
+        self._no_rotation()
+        with mock.patch.object(self.api, "reload_settings", lambda: reload_settings(self.parser)), \
+                mock.patch.object(self.api._pool, "reload", wraps=self.api._pool.reload) as pool_reload:
+            self.api.reload_config()
+        pool_reload.assert_called_once_with()
+        self.assertEqual(self.api.RESPONSE_CACHE.stats()["entries"], 0)
@@ -0,0 +1,54 @@
+import queue
+import shutil
+import tempfile
+import unittest
+
+from generator.sample_stream import SampleStream
+from benchmarks.fixtures import make_idx_fixture
+
+
+class LateQueue(queue.Queue):
+    """
+    Queue whose timed get always times out, as when the producer queues its last items during the wait
+    """
+    def get(self, block=True, timeout=None):
+        if timeout is not None:
+            raise queue.Empty
+        return super(LateQueue, self).get(block, timeout)
+
+
+class SampleStreamTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fixture_dir = tempfile.mkdtemp()
+        cls.image_file, cls.label_file = make_idx_fixture(cls.fixture_dir, 200)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.fixture_dir, ignore_errors=True)
+
+    def _stream(self, **kwargs):
+        return SampleStream(lengths=['3'], width_range=(100, 120), batch_size=4, seed=1, image_file=self.image_file,
+                            label_file=self.label_file, **kwargs)
+
+    def test_limit(self):
+        with self._stream(limit=10) as stream:
+            self.assertEqual([len(labels) for _, labels, _ in stream], [4, 4, 2])
+
+    def test_batches_left_by_an_exited_producer_are_drained(self):
+        stream = self._stream(limit=10, prefetch=8)
+        stream._queue = LateQueue(maxsize=8)
+        stream.start()
+        stream._thread.join()
+        self.assertFalse(stream._thread.is_alive())
+        self.assertEqual(sum(len(labels) for _, labels, _ in stream), 10)
+
+    def test_producer_error_is_raised(self):
+        stream = self._stream(limit=4)
+        stream._next_batch = lambda count: 1 / 0
+        with self.assertRaises(ZeroDivisionError):
+            list(stream)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from configparser import ConfigParser
+
+from utils.config_parser import ConfParser
+from utils.settings import load_settings, MdsgMode, SpacingMode
+
+
+def config_copy():
+    """
+    Editable copy of config.cfg
+    """
+    parser = ConfParser().parser
+    copy = ConfigParser()
+    copy.read_dict({section: dict(parser.items(section, raw=True)) for section in parser.sections()})
+    return copy
+
+
+class LoadSettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = config_copy()
+
+    def test_bool_values(self):
+        for value, expected in (("0", False), ("1", True), ("no", False), ("Yes", True), ("off", False),
+                                ("true", True)):
+            self.parser.set('AUGMENTATION', 'Blur', value)
+            # '0' was a truthy string before the typed settings #
+            self.assertIs(load_settings(self.parser).augmentation.blur, expected)
+
+    def test_invalid_bool(self):
+        self.parser.set('AUGMENTATION', 'Blur', 'maybe')
+        with self.assertRaisesRegex(Exception, r"\[AUGMENTATION\] Blur = maybe"):
+            load_settings(self.parser)
+
+    def test_enums(self):
+        self.parser.set('GENERATOR', 'spacingMode', 'PROGRESSIVE')
+        self.parser.set('AUGMENTATION', 'mdsg_mode', '2')
+        config = load_settings(self.parser)
+        self.assertIs(config.generator.spacing_mode, SpacingMode.PROGRESSIVE)
+        self.assertIs(config.augmentation.mdsg_mode, MdsgMode.AUGMENTED)
+
+        for section, key, value in (('GENERATOR', 'spacingMode', 'WIDEST'), ('AUGMENTATION', 'mdsg_mode', '4')):
+            parser = config_copy()
+            parser.set(section, key, value)
+            with self.assertRaisesRegex(Exception, "Invalid config value"):
+                load_settings(parser)
+
+    def test_ranges(self):
+        self.parser.set('AUGMENTATION', 'warp_translation_x', '-2, 3')
+        self.parser.set('AUGMENTATION', 'warp_translation_y', '4')
+        config = load_settings(self.parser)
+        self.assertEqual(config.augmentation.warp_translation_x, (-2., 3.))
+        self.assertEqual(config.augmentation.warp_translation_y, (4., 4.))
+
+        for value in ("3, 1", "1, 2, 3", "a"):
+            self.parser.set('AUGMENTATION', 'warp_translation_x', value)
+            with self.assertRaisesRegex(Exception, "warp_translation_x"):
+                load_settings(self.parser)
+
+    def test_pipeline_names(self):
+        self.parser.set('AUGMENTATION', 'Pipeline', ' Warp ,Rotate,, Blur')
+        self.assertEqual(load_settings(self.parser).augmentation.pipeline, ("Warp", "Rotate", "Blur"))
+
+    def test_missing_required_key(self):
+        self.parser.remove_option('AUGMENTATION', 'max_left_degree')
+        with self.assertRaisesRegex(Exception, r"Missing config value \[AUGMENTATION\] max_left_degree"):
+            load_settings(self.parser)
+
+    def test_missing_optional_key_takes_default(self):
+        self.parser.remove_option('AUGMENTATION', 'blur_size')
+        self.assertEqual(load_settings(self.parser).augmentation.blur_size, 3)
+
+
+class OverrideTest(unittest.TestCase):
+    def setUp(self):
+        self.config = load_settings(config_copy())
+
+    def test_values_are_converted(self):
+        config = self.config.override(generator={"spacing_mode": "EQUALIZED_MIN"},
+                                      augmentation={"blur": "0", "warp_translation_y": "1, 2", "max_left_degree": 5})
+        self.assertIs(config.generator.spacing_mode, SpacingMode.EQUALIZED_MIN)
+        self.assertIs(config.augmentation.blur, False)
+        self.assertEqual(config.augmentation.warp_translation_y, (1., 2.))
+        self.assertEqual(config.augmentation.max_left_degree, 5.)
+        # the snapshot it was copied from is unchanged #
+        self.assertEqual(self.config.augmentation.blur_size, config.augmentation.blur_size)
+        self.assertIsNot(config, self.config)
+
+    def test_invalid_values_are_refused(self):
+        for sections in ({"generator": {"spacing_mode": "WIDEST"}}, {"augmentation": {"blur": "maybe"}},
+                         {"augmentation": {"warp_translation_x": "5, 1"}},
+                         {"augmentation": {"max_left_degree": "left"}}):
+            with self.assertRaisesRegex(Exception, "Invalid config value"):
+                self.config.override(**sections)
+
+    def test_unknown_field_is_refused(self):
+        with self.assertRaisesRegex(Exception, "Unknown setting augmentation.shear"):
+            self.config.override(augmentation={"shear": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from generator.shard_writer import ShardWriter, read_shard
+from generator.image_data_reader import IMAGE_FILE_MAGIC, decode_idx_images
+
+
+def random_batch(rng, count, shape):
+    images = rng.integers(0, 256, size=(count,) + shape, dtype=np.uint8)
+    sequences = [rng.integers(0, 10, size=int(rng.integers(1, 6))).tolist() for _ in range(count)]
+    meta = {key: rng.integers(0, 50, size=count) for key in ("leftMargin", "rightMargin", "betweenMargin", "widths")}
+    return images, sequences, meta
+
+
+class ShardWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def _round_trip(self, fmt):
+        rng = np.random.default_rng(0)
+        images, sequences, meta = random_batch(rng, 25, (28, 60))
+        with ShardWriter(self.output_dir, (28, 60), shard_size=10, fmt=fmt) as writer:
+            writer.append(images[:7], sequences[:7], {key: value[:7] for key, value in meta.items()})
+            writer.append(images[7:], sequences[7:], {key: value[7:] for key, value in meta.items()})
+
+        with open(os.path.join(self.output_dir, "manifest.json")) as fp:
+            manifest = json.load(fp)
+        self.assertEqual(manifest["count"], 25)
+        self.assertEqual([shard["count"] for shard in manifest["shards"]], [10, 10, 5])
+
+        # idx shards hold MNIST ink values #
+        stored = 255 - images if fmt == "idx" else images
+        first = 0
+        for shard in manifest["shards"]:
+            shard_images, index = read_shard(self.output_dir, shard)
+            np.testing.assert_array_equal(shard_images, stored[first:first + shard["count"]])
+            offsets = index["labelOffsets"]
+            for row in range(shard["count"]):
+                self.assertEqual(index["labels"][offsets[row]:offsets[row + 1]].tolist(), sequences[first + row])
+            for key, values in meta.items():
+                np.testing.assert_array_equal(index[key], values[first:first + shard["count"]])
+            first += shard["count"]
+        return manifest
+
+    def test_npy_round_trip(self):
+        self._round_trip("npy")
+
+    def test_idx_round_trip(self):
+        manifest = self._round_trip("idx")
+        # the IDX decoder reads the shard back as rendered grey levels (white background = 255) #
+        shard = manifest["shards"][0]
+        with open(os.path.join(self.output_dir, shard["images"]), "rb") as fp:
+            magic_num, decoded = decode_idx_images(fp.read(), dtype=np.uint8)
+        self.assertEqual(magic_num, IMAGE_FILE_MAGIC)
+        np.testing.assert_array_equal(decoded, 255 - read_shard(self.output_dir, shard)[0])
+
+    def test_error_keeps_complete_shards_only(self):
+        rng = np.random.default_rng(1)
+        images, sequences, meta = random_batch(rng, 15, (28, 40))
+        with self.assertRaises(RuntimeError):
+            with ShardWriter(self.output_dir, (28, 40), shard_size=10) as writer:
+                writer.append(images, sequences, meta)
+                raise RuntimeError("generation failed")
+
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "manifest.json")))
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ["shard_00000.images.npy", "shard_00000.index.npz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
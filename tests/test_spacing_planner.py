@@ -0,0 +1,88 @@
+"""
+Closed-form spacing planner against the original search over every gap of the spacing range
+"""
+import unittest
+
+import numpy as np
+
+from generator.spacing_planner import is_equalized, plan_spacing, plan_spacing_bulk
+
+MODES = ("EQUALIZED_MAX", "EQUALIZED_MIN", "PROGRESSIVE")
+
+
+def legacy_spacing(image_width, digits_width, n_digits, spacing_range_min, spacing_range_max, spacing_mode):
+    """
+    The np.arange / np.where search _generate_sequence used before the planner
+    :return: (leftSpace, rightSpace, gap list) or None when fitting is not possible
+    """
+    candidates = np.arange(spacing_range_min, spacing_range_max + 1, 1)
+    if is_equalized(spacing_mode):
+        rightEndWhiteSpaceLeft = image_width - (digits_width + (n_digits - 1) * candidates)
+        if not len(np.where(rightEndWhiteSpaceLeft >= 0)[0]) > 0:
+            return None
+        pick = min if spacing_mode == "EQUALIZED_MAX" else max
+        best = pick(rightEndWhiteSpaceLeft[np.where(rightEndWhiteSpaceLeft >= 0)])
+        gap = int(candidates[np.where(rightEndWhiteSpaceLeft == best)][0])
+        leftSpace = int(best / 2)
+        return leftSpace, int(best - leftSpace), [gap] * (n_digits - 1)
+
+    selected = candidates[0:n_digits - 1]
+    if len(selected) != n_digits - 1:
+        return None
+    rightEndWhiteSpaceLeft = image_width - (digits_width + sum(selected))
+    if rightEndWhiteSpaceLeft < 0:
+        return None
+    leftSpace = int(rightEndWhiteSpaceLeft / 2)
+    return leftSpace, int(rightEndWhiteSpaceLeft - leftSpace), [int(gap) for gap in selected]
+
+
+def random_cases(count, seed=0):
+    rng = np.random.RandomState(seed)
+    for _ in range(count):
+        n_digits = int(rng.randint(1, 12))
+        digits_width = n_digits * int(rng.choice([20, 28, 32]))
+        spacing_range_min = int(rng.randint(0, 30))
+        # a few empty ranges (min > max) on purpose #
+        spacing_range_max = spacing_range_min + int(rng.randint(-2, 40))
+        image_width = digits_width + int(rng.randint(0, 400))
+        yield image_width, digits_width, n_digits, spacing_range_min, spacing_range_max, MODES[rng.randint(3)]
+
+
+class SpacingPlannerTest(unittest.TestCase):
+    CASES = 5000
+
+    def test_scalar_matches_search(self):
+        for case in random_cases(self.CASES):
+            expected = legacy_spacing(*case)
+            try:
+                leftSpace, rightSpace, gaps = plan_spacing(*case)
+                planned = (leftSpace, rightSpace, gaps.tolist())
+            except Exception:
+                planned = None
+            self.assertEqual(planned, expected, "case = {}".format(case))
+
+    def test_bulk_matches_search(self):
+        rows = {mode: list() for mode in MODES}
+        for case in random_cases(self.CASES, seed=1):
+            rows[case[5]].append((case, legacy_spacing(*case)))
+
+        # bulk form, one call per mode over all its rows #
+        for mode, entries in rows.items():
+            columns = np.array([case[:5] for case, _ in entries], dtype=np.int64)
+            leftSpace, rightSpace, betweenSpace, fits = plan_spacing_bulk(columns[:, 0], columns[:, 1], columns[:, 2],
+                                                                          columns[:, 3], columns[:, 4], mode)
+            for row, (case, expected) in enumerate(entries):
+                planned = None
+                if fits[row]:
+                    planned = (int(leftSpace[row]), int(rightSpace[row]),
+                               [int(betweenSpace[row]) + (0 if is_equalized(mode) else gap)
+                                for gap in range(case[2] - 1)])
+                self.assertEqual(planned, expected, "case = {}".format(case))
+
+    def test_narrow_width_is_refused(self):
+        with self.assertRaises(Exception):
+            plan_spacing(50, 3 * 28, 3, 2, 4, "EQUALIZED_MAX")
+
+
+if __name__ == "__main__":
+    unittest.main()
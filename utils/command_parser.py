@@ -1,9 +1,8 @@
+import os
 import sys
 import json
 import argparse
 
-from flask import jsonify
-from flask_restful import reqparse
 from utils.custom_logging import Logging, message
 
 logger = Logging(__name__).get_logger()
@@ -52,8 +51,37 @@ class CommandParser(object):
                                 required=True,
                                 help='Image Width : Eg: -w 28 (in pixels)')
 
+            parser.add_argument('--cache',
+                                dest='cacheMode',
+                                choices=['use', 'rebuild', 'skip'],
+                                default=None,
+                                help='preprocessed dataset cache : use, rebuild or skip (default from config.cfg)')
+
+            parser.add_argument('--seed',
+                                dest='seed',
+                                type=int,
+                                default=None,
+                                help='random seed, the same seed and inputs give the same images : Eg: --seed 7')
+
+            parser.add_argument('--profile',
+                                dest='profile',
+                                action='store_true',
+                                help='print the time spent per stage (idx read, selection, augmentation, composition, '
+                                     'encoding, save)')
+
+            parser.add_argument('--profile-dump',
+                                dest='profileDump',
+                                default=None,
+                                help='also write cProfile and tracemalloc reports to this directory : '
+                                     'Eg: --profile-dump output/profile')
+
             args = parser.parse_args()
 
+            if args.seed is not None and args.seed < 0:
+                message("seed :{} should be a positive int value".format(args.seed))
+                parser.print_usage(sys.stdout)
+                exit(1)
+
             if args.imageWidth < 0:
                 message("{} is an invalid positive int value".format(args.imageWidth))
                 parser.print_usage(sys.stdout)
@@ -64,7 +92,7 @@ class CommandParser(object):
                 parser.print_usage(sys.stdout)
                 exit(1)
 
-            logger.debug("Arguments : = {}".format(args))
+            logger.debug("Arguments : = %s", args)
             return dict(args._get_kwargs())
 
         except Exception as e:
@@ -72,16 +100,121 @@ class CommandParser(object):
             raise e
 
 
+    def dataset_argument_parser(self, argv=None):
+        '''
+        Command line argument parsing function for the generate-dataset mode
+        :return:
+        '''
+
+        try:
+            parser = argparse.ArgumentParser(prog='mdsg_cli generate-dataset',
+                                             description='Generate a sharded dataset of digit sequence images')
+
+            parser.add_argument('-n',
+                                '--count',
+                                dest='count',
+                                type=int,
+                                required=True,
+                                help='number of images to generate : Eg: -n 100000')
+
+            parser.add_argument('-l',
+                                '--lengths',
+                                dest='lengths',
+                                nargs="+",
+                                required=True,
+                                help='digit counts with optional weights : Eg: -l 3 5:2 8 (5 digits twice as likely)')
+
+            parser.add_argument('-w',
+                                '--width-range',
+                                dest='widthRange',
+                                nargs=2,
+                                type=int,
+                                required=True,
+                                help='min and max image width : Eg: -w 200 400 (in pixels)')
+
+            parser.add_argument('-sr',
+                                '--spacing-range',
+                                dest='spacingRange',
+                                nargs=2,
+                                type=int,
+                                required=True,
+                                help='min and max spacing between digits : Eg: -sr 3 9 (in pixels)')
+
+            parser.add_argument('--shard-size',
+                                dest='shardSize',
+                                type=int,
+                                default=10000,
+                                help='images per shard file : Eg: --shard-size 10000')
+
+            parser.add_argument('--format',
+                                dest='format',
+                                choices=['npy', 'idx'],
+                                default='npy',
+                                help='shard image format : npy or idx (MNIST-like, readable as input data)')
+
+            parser.add_argument('--workers',
+                                dest='workers',
+                                type=int,
+                                default=0,
+                                help='worker processes, default number of cores')
+
+            parser.add_argument('--seed',
+                                dest='seed',
+                                type=int,
+                                default=0,
+                                help='master seed, the same seed gives the same dataset')
+
+            parser.add_argument('--augment',
+                                dest='augment',
+                                action='store_true',
+                                help='apply the configured augmentation')
+
+            parser.add_argument('-o',
+                                '--output-dir',
+                                dest='outputDir',
+                                default=os.path.join(os.path.dirname(__file__), '../output/dataset'),
+                                help='directory of the shard files')
+
+            parser.add_argument('--cache',
+                                dest='cacheMode',
+                                choices=['use', 'rebuild', 'skip'],
+                                default=None,
+                                help='preprocessed dataset cache : use, rebuild or skip (default from config.cfg)')
+
+            args = parser.parse_args(argv)
+
+            if args.count <= 0 or args.shardSize <= 0:
+                message("count and shard size should be positive")
+                parser.print_usage(sys.stdout)
+                exit(1)
+
+            if args.spacingRange[1] < args.spacingRange[0] or args.widthRange[1] < args.widthRange[0]:
+                message("ranges should be given as min max")
+                parser.print_usage(sys.stdout)
+                exit(1)
+
+            arguments = dict(args._get_kwargs())
+            arguments["minSpacingRange"], arguments["maxSpacingRange"] = args.spacingRange
+            logger.debug("Arguments : = %s", arguments)
+            return arguments
+
+        except Exception as e:
+            logger.error("Error while parsing dataset CLI Arguments : {}".format(e))
+            raise e
+
     def api_argument_parser(self):
         '''
         Api get parameter parsing function
         :return:
         '''
+        # Flask is only imported in API mode, the CLI starts without it #
+        from flask import jsonify
+        from flask_restful import reqparse
 
         help = jsonify(
             INFO='Usage for API',
             BASE_URL='http://127.0.0.1:5000/mdsg',
-            QUERY_STRINGS='digits : Eg :[4 6 8], imageWidth : Eg :200, minSpacingRange : Eg : 7, maxSpacingRange : Eg : 9',
+            QUERY_STRINGS='digits : Eg :[4 6 8], imageWidth : Eg :200, minSpacingRange : Eg : 7, maxSpacingRange : Eg : 9, optional fmt : png|raw|json, variant : org|aug, save : 0|1, seed : Eg : 7',
             EXAMPLE='http://127.0.0.1:5000/mdsg?d=4&d=5&d=8&sr1=3&sr2=9&w=100'
         )
 
@@ -116,8 +249,41 @@ class CommandParser(object):
                             required=True,
                             help='Missing : Image Width : Eg: w=28 (in pixels)')
 
+        parser.add_argument('fmt',
+                            dest='format',
+                            choices=['png', 'raw', 'json'],
+                            default='png',
+                            location='args',
+                            help='Response format : png, raw (uint8 pixels with shape headers) or json : Eg: fmt=json')
+
+        parser.add_argument('variant',
+                            dest='variant',
+                            choices=['org', 'aug'],
+                            default=None,
+                            location='args',
+                            help='Image to return for png and raw in compare mode : org or aug : Eg: variant=aug')
+
+        parser.add_argument('save',
+                            dest='save',
+                            type=int,
+                            choices=[0, 1],
+                            default=None,
+                            location='args',
+                            help='Also write the image to the output directory : Eg: save=1')
+
+        parser.add_argument('seed',
+                            dest='seed',
+                            type=int,
+                            default=None,
+                            location='args',
+                            help='Random seed, the same seed and inputs give the same images : Eg: seed=7')
+
         args = parser.parse_args()
 
+        if args.seed is not None and args.seed < 0:
+            message("seed :{} should be a positive int value".format(args.seed))
+            return False, "seed :{} should be a positive int value".format(args.seed)
+
         if args.imageWidth < 0:
             message("{} is an invalid positive int value".format(args.imageWidth))
             return False, "{} is an invalid positive int value".format(args.imageWidth)
@@ -128,7 +294,7 @@ class CommandParser(object):
 
             return False, "maxSpacingRange :{} should be greater than minSpacingRange :{}".format(args.maxSpacingRange,
                                                                                           args.minSpacingRange)
-        logger.debug("Inputs : = {}".format(args))
+        logger.debug("Inputs : = %s", args)
         return True, args
 
 #
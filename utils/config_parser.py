@@ -1,5 +1,4 @@
 import os
-from utils import custom_logging
 from configparser import ConfigParser
 
 
@@ -15,7 +14,9 @@ class ConfParser(object):
             with open(self._config_file_path) as fp:
                 parser.read_file(fp)
         except FileNotFoundError:
-            custom_logging.critical('Config file not found')
+            # imported here, custom_logging itself needs ConfParser #
+            from utils.custom_logging import message
+            message('Config file not found')
             exit()
 
         return parser
@@ -1,6 +1,19 @@
 import os
+import json
+import queue
+import atexit
 import logging
-from utils.config_parser import ConfParser
+import threading
+from multiprocessing import util
+from logging.handlers import QueueHandler, QueueListener
+from utils.settings import settings
+
+# LogRecord attributes, anything else on a record was passed through extra= #
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# sink shared by every Logging of the process, built on first use #
+_sink = None
+_sink_lock = threading.Lock()
 
 
 def message(message):
@@ -8,17 +21,119 @@ def message(message):
     print(header + message)
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line : time, level, logger, message, process, thread, plus every extra= field
+    and the formatted exception if any
+    """
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler for an in-process queue : the record is enqueued as is, message formatting happens
+    on the listener thread instead of the logging thread
+    """
+    def prepare(self, record):
+        return record
+
+
+class AsyncLogSink(object):
+    """
+    Queue in front of a target handler : loggers only enqueue records, a QueueListener thread formats and writes them.
+    A forked child gets its own queue and listener, records still queued are written by the parent.
+    The listener is stopped (queue flushed) at exit.
+    """
+    def __init__(self, target):
+        self.target = target
+        self.handler = _DeferredQueueHandler(queue.SimpleQueue())
+        self._start()
+        atexit.register(self.stop)
+        os.register_at_fork(after_in_child=self._after_fork)
+        util.register_after_fork(self, AsyncLogSink._finalize_in_child)
+
+    def _start(self):
+        self.listener = QueueListener(self.handler.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def _after_fork(self):
+        self.handler.queue = queue.SimpleQueue()
+        self._start()
+
+    def _finalize_in_child(self):
+        # multiprocessing children exit through os._exit, which skips atexit #
+        util.Finalize(self, self.stop, exitpriority=10)
+
+    def stop(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+
+
+def _target_handler(config):
+    if config.log_handler == 'FileHandler':
+        log_dir = config.log_dir
+        if log_dir == '':
+            log_dir = '../log'
+        else:
+            log_dir = '../' + log_dir
+
+        log_file = os.path.join(os.path.dirname(__file__), os.path.join(log_dir, 'mdsg.log'))
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        target = logging.FileHandler(log_file)
+    else:
+        target = logging.StreamHandler()
+
+    if config.log_format == 'json':
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter('%(asctime)s : %(name)-25s : %(levelname)-8s  : %(message)s'))
+    return target
+
+
+def log_sink(config=None):
+    """
+    Handler every logger of the process writes to, configured by the LOGGING section :
+    LogHandler (FileHandler or StreamHandler), LogFormat (text or json), LogAsync (queue + listener thread)
+    :param config: LoggingSettings, default settings().logging
+    """
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                config = config or settings().logging
+                target = _target_handler(config)
+                if config.log_async:
+                    _sink = AsyncLogSink(target).handler
+                else:
+                    _sink = target
+    return _sink
+
+
 class Logging(object):
     def __init__(self, name):
         self.logger = logging.getLogger(name)
-        self._parser = ConfParser().parser
+        self._config = settings().logging
         self._get_handler()
-        self._get_formatter()
         self._get_log_level()
         self._set_logger()
 
     def _get_log_level(self):
-        log_level = self._parser.get('LOGGING', 'LogLevel')
+        log_level = self._config.log_level
 
         if log_level == 'INFO':
             self.log_level = logging.INFO
@@ -32,30 +147,12 @@ class Logging(object):
             # default level
             self.log_level = logging.DEBUG
 
-    def _get_formatter(self):
-        self._formatter = logging.Formatter('%(asctime)s : %(name)-25s : %(levelname)-8s  : %(message)s')
-
     def _get_handler(self):
-        handler = self._parser.get('LOGGING', 'LogHandler')
-        # handler = self._parser.get(('aa', 'dd'), option='')
-        if handler == 'FileHandler':
-            log_dir = self._parser.get('LOGGING', 'LogDir')
-            if log_dir == '':
-                log_dir = '../log'
-            else:
-                log_dir = '../' + log_dir
-
-            log_file = os.path.join(os.path.dirname(__file__), os.path.join(log_dir, 'mdsg.log'))
-            os.makedirs(os.path.dirname(log_file), exist_ok=True)
-            self._handler = logging.FileHandler(log_file)
-
-        if handler == 'StreamHandler':
-            self._handler = logging.StreamHandler()
+        self._handler = log_sink(self._config)
 
     def _set_logger(self):
-        self._handler.setFormatter(self._formatter)
-        self.logger.addHandler(self._handler)
-        # self.logger.setLevel(logging.INFO)
+        if self._handler not in self.logger.handlers:
+            self.logger.addHandler(self._handler)
         self.logger.setLevel(self.log_level)
 
     def get_logger(self):
@@ -0,0 +1,265 @@
+import os
+import time
+import bisect
+import threading
+import functools
+import tracemalloc
+import numpy as np
+
+# histogram buckets of the stage durations, in seconds #
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+# recent durations kept per stage for the quantiles #
+WINDOW = 4096
+QUANTILES = (0.5, 0.95, 0.99)
+
+_enabled = False
+_stages = dict()
+_stages_lock = threading.Lock()
+
+
+class StageStats(object):
+    """
+    Durations of one stage : cumulative histogram buckets, count and sum since start,
+    quantiles over the last WINDOW samples, bytes allocated (only measured while tracemalloc traces)
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.
+        self.allocated = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self._recent = np.zeros(WINDOW, dtype=np.float64)
+        self._lock = threading.Lock()
+
+    def add(self, seconds, allocated=0):
+        with self._lock:
+            self._recent[self.count % WINDOW] = seconds
+            self.count += 1
+            self.total += seconds
+            self.allocated += allocated
+            self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            recent = self._recent[:min(self.count, WINDOW)].copy()
+            summary = {"count": self.count, "sum": self.total, "allocatedBytes": self.allocated,
+                       "buckets": list(self.buckets)}
+        for quantile in QUANTILES:
+            summary["p{}".format(int(quantile * 100))] = float(np.quantile(recent, quantile)) if recent.size else 0.
+        return summary
+
+    def export(self):
+        """
+        Raw counters, eg: of a pool worker, to be merged into the front end stats
+        """
+        with self._lock:
+            return {"count": self.count, "sum": self.total, "allocatedBytes": self.allocated,
+                    "buckets": list(self.buckets), "recent": self._recent[:min(self.count, WINDOW)].copy()}
+
+    def merge(self, exported):
+        recent = exported["recent"][-WINDOW:]
+        with self._lock:
+            self._recent[(self.count + np.arange(len(recent))) % WINDOW] = recent
+            self.count += exported["count"]
+            self.total += exported["sum"]
+            self.allocated += exported["allocatedBytes"]
+            self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, exported["buckets"])]
+
+
+def _stats(name):
+    stats = _stages.get(name)
+    if stats is None:
+        with _stages_lock:
+            stats = _stages.setdefault(name, StageStats(name))
+    return stats
+
+
+class _Stage(object):
+    __slots__ = ("name", "start", "memory")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        allocated = 0
+        if self.memory is not None and tracemalloc.is_tracing():
+            allocated = max(tracemalloc.get_traced_memory()[0] - self.memory, 0)
+        _stats(self.name).add(elapsed, allocated)
+        return False
+
+
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """
+    Context manager timing a block as stage name, a shared no-op while profiling is disabled
+    """
+    return _Stage(name) if _enabled else _NO_STAGE
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as stage name, a flag check while profiling is disabled
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _stages_lock:
+        _stages.clear()
+
+
+def take():
+    """
+    Export the stages and reset them, consecutive calls return the deltas, eg: a pool worker after each request
+    :return: dict stage -> raw counters for merge()
+    """
+    with _stages_lock:
+        stages = list(_stages.values())
+        _stages.clear()
+    return {stats.name: stats.export() for stats in stages}
+
+
+def merge(stages):
+    """
+    Add the counters returned by take() in another process to the stages of this one
+    """
+    for name, exported in stages.items():
+        _stats(name).merge(exported)
+
+
+def snapshot():
+    """
+    :return: dict stage -> count, sum (s), p50 / p95 / p99 (s), allocatedBytes, buckets
+    """
+    with _stages_lock:
+        stages = list(_stages.values())
+    return {stats.name: stats.snapshot() for stats in sorted(stages, key=lambda stats: stats.name)}
+
+
+def prometheus_text():
+    """
+    Stage metrics in the Prometheus text exposition format : mdsg_stage_seconds histogram,
+    mdsg_stage_quantile_seconds summary and mdsg_stage_allocated_bytes_total counter
+    """
+    stages = snapshot()
+    lines = ["# HELP mdsg_stage_seconds Time spent per generation stage.",
+             "# TYPE mdsg_stage_seconds histogram"]
+    for name, summary in stages.items():
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), summary["buckets"]):
+            cumulative += count
+            lines.append('mdsg_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(name, bound, cumulative))
+        lines.append('mdsg_stage_seconds_sum{{stage="{}"}} {!r}'.format(name, summary["sum"]))
+        lines.append('mdsg_stage_seconds_count{{stage="{}"}} {}'.format(name, summary["count"]))
+
+    lines += ["# HELP mdsg_stage_quantile_seconds Stage duration quantiles over the last {} calls.".format(WINDOW),
+              "# TYPE mdsg_stage_quantile_seconds summary"]
+    for name, summary in stages.items():
+        for quantile in QUANTILES:
+            lines.append('mdsg_stage_quantile_seconds{{stage="{}",quantile="{}"}} {!r}'.format(
+                name, quantile, summary["p{}".format(int(quantile * 100))]))
+        lines.append('mdsg_stage_quantile_seconds_sum{{stage="{}"}} {!r}'.format(name, summary["sum"]))
+        lines.append('mdsg_stage_quantile_seconds_count{{stage="{}"}} {}'.format(name, summary["count"]))
+
+    lines += ["# HELP mdsg_stage_allocated_bytes_total Bytes allocated per stage while tracemalloc traces.",
+              "# TYPE mdsg_stage_allocated_bytes_total counter"]
+    for name, summary in stages.items():
+        lines.append('mdsg_stage_allocated_bytes_total{{stage="{}"}} {}'.format(name, summary["allocatedBytes"]))
+    return "\n".join(lines) + "\n"
+
+
+def format_table():
+    """
+    One line per stage, eg: for the --profile report of the CLI
+    """
+    rows = ["{:<12} {:>7} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+        "stage", "count", "total ms", "p50 ms", "p95 ms", "p99 ms", "alloc bytes")]
+    for name, summary in snapshot().items():
+        rows.append("{:<12} {:>7} {:>10.2f} {:>10.3f} {:>10.3f} {:>10.3f} {:>12}".format(
+            name, summary["count"], summary["sum"] * 1e3, summary["p50"] * 1e3, summary["p95"] * 1e3,
+            summary["p99"] * 1e3, summary["allocatedBytes"]))
+    return "\n".join(rows)
+
+
+class ProfileDump(object):
+    """
+    Enables the stage timers between start() and stop() (or for a with block), with a directory it also runs cProfile and tracemalloc and writes
+    mdsg.prof (pstats file, eg: python -m pstats mdsg.prof), mdsg_cprofile.txt (top functions by cumulative time)
+    and mdsg_tracemalloc.txt (top allocating lines)
+    """
+    def __init__(self, dump_dir=None, top=30):
+        self.dump_dir = dump_dir
+        self.top = top
+        self._profiler = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        enable()
+        if self.dump_dir:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            import cProfile
+            tracemalloc.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def stop(self):
+        disable()
+        if self._profiler is not None:
+            import pstats
+            self._profiler.disable()
+            self._profiler.dump_stats(os.path.join(self.dump_dir, "mdsg.prof"))
+            with open(os.path.join(self.dump_dir, "mdsg_cprofile.txt"), "w") as fp:
+                pstats.Stats(self._profiler, stream=fp).sort_stats("cumulative").print_stats(self.top)
+            allocations = tracemalloc.take_snapshot().statistics("lineno")
+            tracemalloc.stop()
+            with open(os.path.join(self.dump_dir, "mdsg_tracemalloc.txt"), "w") as fp:
+                for statistic in allocations[:self.top]:
+                    fp.write("{}\n".format(statistic))
+            self._profiler = None
@@ -0,0 +1,169 @@
+import os
+import json
+import re
+import struct
+import hashlib
+import threading
+import collections
+from utils.custom_logging import Logging
+
+logger = Logging(__name__).get_logger()
+
+CachedResponse = collections.namedtuple("CachedResponse", ["body", "mimetype", "headers"])
+# name of a spilled response : request_key digest + .bin #
+SPILL_FILE_PATTERN = re.compile(r"^[0-9a-f]{64}\.bin$")
+
+
+def request_key(fields):
+    """
+    Canonical key of a request : sha256 of its fields as sorted JSON
+    :param fields: dict of everything the response depends on
+    :return: hex digest
+    """
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache(object):
+    """
+    In-process LRU cache of encoded responses bounded by body bytes.
+    Only meant for pure requests (eg: seeded ones), the key must cover every input of the response.
+    With spill_dir, entries evicted from memory are written to disk (bounded by spill_max_bytes, oldest removed first)
+    and promoted back to memory on their next hit. Spilled files (<key>.bin) left in spill_dir by a previous run are removed
+    on start, other files of the directory are left alone.
+    """
+    def __init__(self, max_bytes=64 << 20, spill_dir=None, spill_max_bytes=512 << 20):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spill_hits = 0
+        self.not_modified = 0
+
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._spilled = collections.OrderedDict()
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            for name in os.listdir(spill_dir):
+                if SPILL_FILE_PATTERN.match(name):
+                    self._remove_file(os.path.join(spill_dir, name))
+
+    @staticmethod
+    def etag(key):
+        """
+        Entity tag of a cached request (unquoted), stable as long as the key covers every input
+        """
+        return key[:32]
+
+    def note_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def _spill_file(self, key):
+        return os.path.join(self.spill_dir, key + ".bin")
+
+    def _spill(self, key, entry):
+        header = json.dumps({"mimetype": entry.mimetype, "headers": entry.headers}).encode("utf-8")
+        try:
+            with open(self._spill_file(key), "wb") as fp:
+                fp.write(struct.pack(">I", len(header)))
+                fp.write(header)
+                fp.write(entry.body)
+        except OSError as e:
+            logger.error("Unable to spill cached response = {}, exception : {}".format(key, str(e)))
+            return
+        self._spilled[key] = len(entry.body)
+        self._spilled_bytes += len(entry.body)
+        while self._spilled_bytes > self.spill_max_bytes:
+            old_key, size = self._spilled.popitem(last=False)
+            self._spilled_bytes -= size
+            self._remove_spilled(old_key)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remove_spilled(self, key):
+        self._remove_file(self._spill_file(key))
+
+    def _load_spilled(self, key):
+        size = self._spilled.pop(key)
+        self._spilled_bytes -= size
+        try:
+            with open(self._spill_file(key), "rb") as fp:
+                (header_size,) = struct.unpack(">I", fp.read(4))
+                header = json.loads(fp.read(header_size).decode("utf-8"))
+                body = fp.read()
+        except (OSError, ValueError) as e:
+            logger.error("Unable to read spilled response = {}, exception : {}".format(key, str(e)))
+            return None
+        finally:
+            self._remove_spilled(key)
+        return CachedResponse(body, header["mimetype"], header["headers"])
+
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        while self._bytes > self.max_bytes:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._bytes -= len(old_entry.body)
+            self.evictions += 1
+            if self.spill_dir:
+                self._spill(old_key, old_entry)
+
+    def get(self, key):
+        """
+        :return: CachedResponse or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if key in self._spilled:
+                entry = self._load_spilled(key)
+                if entry is not None:
+                    self.hits += 1
+                    self.spill_hits += 1
+                    self._insert(key, entry)
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, body, mimetype, headers=None):
+        """
+        Cache an encoded response, bodies larger than the whole cache are skipped
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.body)
+            self._insert(key, CachedResponse(bytes(body), mimetype, dict(headers or dict())))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for key in list(self._spilled):
+                self._remove_spilled(key)
+            self._spilled.clear()
+            self._spilled_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "spillHits": self.spill_hits, "notModified": self.not_modified,
+                "hitRate": self.hits / float(lookups) if lookups else 0.,
+                "entries": len(self._entries), "bytes": self._bytes,
+                "spilledEntries": len(self._spilled), "spilledBytes": self._spilled_bytes}
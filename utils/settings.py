@@ -0,0 +1,245 @@
+import threading
+import collections
+from enum import Enum, IntEnum
+from configparser import ConfigParser
+from utils.config_parser import ConfParser
+
+# marks a key config.cfg has to define #
+_REQUIRED = object()
+
+
+class SpacingMode(str, Enum):
+    EQUALIZED_MAX = "EQUALIZED_MAX"
+    EQUALIZED_MIN = "EQUALIZED_MIN"
+    PROGRESSIVE = "PROGRESSIVE"
+
+    def __str__(self):
+        return self.value
+
+
+class MdsgMode(IntEnum):
+    ORIGINAL = 1
+    AUGMENTED = 2
+    COMPARE = 3
+
+
+def _names(value):
+    """
+    'Rotate, Warp' (or a list of names) => ('Rotate', 'Warp')
+    """
+    names = value.split(",") if isinstance(value, str) else value
+    return tuple(str(name).strip() for name in names if str(name).strip())
+
+
+def _range(value):
+    """
+    '0, 4' (or a pair) => (0.0, 4.0), a single value is a fixed range
+    """
+    bounds = [float(bound) for bound in (str(value).split(",") if isinstance(value, (str, int, float)) else value)]
+    if len(bounds) == 1:
+        bounds = bounds * 2
+    if len(bounds) != 2 or bounds[0] > bounds[1]:
+        raise ValueError("expected 'min, max'")
+    return tuple(bounds)
+
+
+def _section(name, section, fields):
+    """
+    :param fields: list of (attribute, config key, type, default) : type is str, int, float, bool, an Enum,
+                   a tuple of allowed strings or a converter raising ValueError (_names, _range),
+                   default _REQUIRED when the key must be set
+    """
+    return name, section, collections.namedtuple(name, [field[0] for field in fields]), fields
+
+
+_SECTIONS = collections.OrderedDict((
+    ("logging", _section("LoggingSettings", "LOGGING", [
+        ("log_level", "LogLevel", str, "DEBUG"),
+        ("log_handler", "LogHandler", ("FileHandler", "StreamHandler"), _REQUIRED),
+        ("log_dir", "LogDir", str, ""),
+        ("log_format", "LogFormat", ("text", "json"), "text"),
+        ("log_async", "LogAsync", bool, False),
+    ])),
+    ("generator", _section("GeneratorSettings", "GENERATOR", [
+        ("image_path", "ImagePath", str, _REQUIRED),
+        ("label_path", "LabelPath", str, _REQUIRED),
+        ("output_path", "OutputPath", str, _REQUIRED),
+        ("spacing_mode", "spacingMode", SpacingMode, _REQUIRED),
+        ("white_pixel", "whitePixel", float, _REQUIRED),
+        ("reader_backend", "readerBackend", ("memory", "mmap"), "memory"),
+        ("png_compression", "pngCompression", int, 6),
+        ("async_write", "asyncWrite", bool, False),
+        ("shared_dataset", "sharedDataset", bool, False),
+    ])),
+    ("api", _section("ApiSettings", "API", [
+        ("save_to_disk", "saveToDisk", bool, False),
+        ("host", "host", str, "127.0.0.1"),
+        ("port", "port", int, 5000),
+        ("serving_mode", "servingMode", ("inline", "pool"), "inline"),
+        ("workers", "workers", int, 0),
+        ("max_pending", "maxPending", int, 64),
+        ("request_timeout", "requestTimeout", float, 30.),
+        ("max_batch_images", "maxBatchImages", int, 10000),
+        ("max_batch_image_width", "maxBatchImageWidth", int, 20000),
+        ("max_batch_pixels", "maxBatchPixels", int, 50000000),
+        ("drain_timeout", "drainTimeout", float, 30.),
+    ])),
+    ("cache", _section("CacheSettings", "CACHE", [
+        ("cache_mode", "cacheMode", ("use", "rebuild", "skip"), "skip"),
+        ("cache_dir", "cacheDir", str, "input_data/.cache"),
+        ("verify_hash", "verifyHash", bool, False),
+    ])),
+    ("response_cache", _section("ResponseCacheSettings", "RESPONSE_CACHE", [
+        ("enabled", "enabled", bool, False),
+        ("max_size_mb", "maxSizeMB", int, 64),
+        ("spill_dir", "spillDir", str, ""),
+        ("spill_max_size_mb", "spillMaxSizeMB", int, 512),
+    ])),
+    ("augmentation", _section("AugmentationSettings", "AUGMENTATION", [
+        ("mdsg_mode", "mdsg_mode", MdsgMode, _REQUIRED),
+        ("pipeline", "Pipeline", _names, ("Rotate", "Warp", "Blur", "RandomNoise", "HorizontalFlip", "VerticalFlip")),
+        ("rand_aug", "RandAug", bool, True),
+        ("rotate", "Rotate", bool, False),
+        ("warp", "Warp", bool, False),
+        ("blur", "Blur", bool, False),
+        ("random_noise", "RandomNoise", bool, False),
+        ("horizontal_flip", "HorizontalFlip", bool, False),
+        ("vertical_flip", "VerticalFlip", bool, False),
+        ("rotate_probability", "Rotate_probability", float, 1.0),
+        ("warp_probability", "Warp_probability", float, 1.0),
+        ("blur_probability", "Blur_probability", float, 1.0),
+        ("random_noise_probability", "RandomNoise_probability", float, 1.0),
+        ("horizontal_flip_probability", "HorizontalFlip_probability", float, 1.0),
+        ("vertical_flip_probability", "VerticalFlip_probability", float, 1.0),
+        ("max_left_degree", "max_left_degree", float, _REQUIRED),
+        ("max_right_degree", "max_right_degree", float, _REQUIRED),
+        ("warp_translation_x", "warp_translation_x", _range, (0., 0.)),
+        ("warp_translation_y", "warp_translation_y", _range, (4., 4.)),
+        ("blur_size", "blur_size", int, 3),
+        ("noise_var", "noise_var", float, 0.01),
+    ])),
+    ("profiling", _section("ProfilingSettings", "PROFILING", [
+        ("enabled", "enabled", bool, False),
+    ])),
+    ("augmentation_bank", _section("AugmentationBankSettings", "AUGMENTATION_BANK", [
+        ("enabled", "enabled", bool, False),
+        ("variants", "variants", int, 8),
+        ("max_size_mb", "maxSizeMB", int, 256),
+        ("eviction", "eviction", ("lru", "random"), "lru"),
+        ("storage_dir", "storageDir", str, ""),
+        ("warm_per_label", "warmPerLabel", int, 0),
+    ])),
+))
+# section types are module attributes so snapshots pickle, eg: sent to the generation pool workers #
+globals().update((tuple_type.__name__, tuple_type) for _, _, tuple_type, _ in _SECTIONS.values())
+
+
+def _convert(section, key, kind, value):
+    try:
+        if isinstance(kind, tuple):
+            if value not in kind:
+                raise ValueError("expected one of {}".format(kind))
+            return value
+        if kind is bool:
+            if isinstance(value, bool):
+                return value
+            if str(value).lower() not in ConfigParser.BOOLEAN_STATES:
+                raise ValueError("expected 1/0, yes/no, true/false or on/off")
+            return ConfigParser.BOOLEAN_STATES[str(value).lower()]
+        if isinstance(kind, type) and issubclass(kind, IntEnum):
+            return kind(int(value))
+        return kind(value)
+    except (TypeError, ValueError) as e:
+        raise (Exception("Invalid config value [{}] {} = {} : {}".format(section, key, value, e)))
+
+
+class Settings(collections.namedtuple("Settings", list(_SECTIONS) + ["parser"])):
+    """
+    Immutable, typed snapshot of config.cfg : one namedtuple per section, eg: settings().generator.spacing_mode.
+    parser is the ConfigParser the snapshot was read from, for sections read by key name (eg: the augmentation
+    pipeline), it must not be modified.
+    """
+    __slots__ = ()
+
+    def override(self, **sections):
+        """
+        Copy with some fields replaced, values are converted and checked like the file's,
+        eg: settings().override(generator={"spacing_mode": "PROGRESSIVE"}) for one request
+        """
+        replaced = dict()
+        for attribute, fields in sections.items():
+            name, section, _, schema = _SECTIONS[attribute]
+            kinds = {field: (key, kind) for field, key, kind, _ in schema}
+            values = dict()
+            for field, value in fields.items():
+                if field not in kinds:
+                    raise (Exception("Unknown setting {}.{}".format(attribute, field)))
+                key, kind = kinds[field]
+                values[field] = _convert(section, key, kind, value)
+            replaced[attribute] = getattr(self, attribute)._replace(**values)
+        return self._replace(**replaced)
+
+
+def load_settings(parser=None):
+    """
+    Parse and check every known section of config.cfg
+    :param parser: ConfigParser to read instead of config.cfg
+    :return: Settings
+    """
+    parser = parser or ConfParser().parser
+    sections = dict()
+    for attribute, (name, section, tuple_type, schema) in _SECTIONS.items():
+        values = dict()
+        for field, key, kind, default in schema:
+            if not parser.has_option(section, key):
+                if default is _REQUIRED:
+                    raise (Exception("Missing config value [{}] {}".format(section, key)))
+                values[field] = default
+                continue
+            values[field] = _convert(section, key, kind, parser.get(section, key))
+        sections[attribute] = tuple_type(**values)
+    return Settings(parser=parser, **sections)
+
+
+_settings = None
+_settings_lock = threading.Lock()
+_reload_callbacks = list()
+
+
+def settings():
+    """
+    Process wide snapshot, config.cfg is parsed on first use only
+    :return: Settings
+    """
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = load_settings()
+    return _settings
+
+
+def reload_settings(parser=None):
+    """
+    Reload signal : re-read config.cfg, swap the process wide snapshot and call the on_reload callbacks.
+    Objects keep the snapshot they were built with, new ones get the fresh one.
+    An invalid file raises and leaves the current snapshot in place.
+    :return: Settings
+    """
+    global _settings
+    fresh = load_settings(parser)
+    with _settings_lock:
+        _settings = fresh
+        callbacks = list(_reload_callbacks)
+    for callback in callbacks:
+        callback(fresh)
+    return fresh
+
+
+def on_reload(callback):
+    """
+    Call callback(settings) after every reload_settings
+    """
+    with _settings_lock:
+        _reload_callbacks.append(callback)
+    return callback